@@ -0,0 +1,14 @@
+// Reload the page when it is rebuilt.
+// Only used by the preview server (see scripts/watch.py), which adds this
+// script to the pages that it serves.
+(function() {
+	if (!window.EventSource) {
+		return;
+	}
+	var events = new EventSource("/__events");
+	events.addEventListener("reload", function() {
+		// The URL (including the #id anchor) is kept, so the page returns to
+		// the same conflict.
+		window.location.reload();
+	});
+})();
@@ -1,4 +1,35 @@
-url = window.location.href.split("?");
-if (url.length != 1 && url[1] == "random") {
-	window.location.assign(url[0] + "#" + Math.floor(Math.random() * 1462 + 1));
-}
+// Jump to a random conflict, for "?random" and for links to "?random".
+// The list of conflict ids (plottoConflicts) is written into the page by
+// build.py. The jump only changes the #id anchor, so the page isn't loaded
+// again.
+(function() {
+	function jump() {
+		var ids = window.plottoConflicts || [];
+		if (ids.length == 0) {
+			return;
+		}
+		var current = window.location.hash.substring(1);
+		var id = current;
+		while (id == current && ids.length > 1) {
+			id = ids[Math.floor(Math.random() * ids.length)];
+		}
+		window.location.hash = id;
+	}
+
+	document.addEventListener("DOMContentLoaded", function() {
+		var url = window.location.href.split("#")[0].split("?");
+		if (url.length != 1 && url[1] == "random") {
+			// Drop the "?random" so that reloading the page stays on the same
+			// conflict.
+			window.history.replaceState(null, "", url[0]);
+			jump();
+		}
+		document.addEventListener("click", function(event) {
+			var link = event.target.closest ? event.target.closest("a") : null;
+			if (link && link.getAttribute("href") == "?random") {
+				event.preventDefault();
+				jump();
+			}
+		});
+	});
+})();
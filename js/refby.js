@@ -0,0 +1,48 @@
+// Expand the "Referenced by" rows into links.
+// build.py writes the (sub)conflicts that link to each (sub)conflict as a
+// list of ids, which is much smaller than a link for each of them:
+//   <div class="refby" data-refby="110 131a 156"></div>
+// The rows are expanded when the page is loaded, and when the conflicts are
+// added later (like the shards, see shard.js).
+(function() {
+	// Return the conflict (like "131") of the subconflict |id| (like "131a").
+	function conflictOf(id) {
+		var m = /^(\d+)[a-z]?$/.exec(id);
+		return m ? m[1] : id;
+	}
+
+	function expand(row) {
+		var ids = row.getAttribute("data-refby").split(" ");
+		row.removeAttribute("data-refby");
+		row.appendChild(document.createTextNode("Referenced by:"));
+		ids.forEach(function(id) {
+			var link = document.createElement("a");
+			link.href = "#" + conflictOf(id);
+			link.className = "clink";
+			link.textContent = id;
+			row.appendChild(document.createTextNode(" "));
+			row.appendChild(link);
+		});
+	}
+
+	function expandAll(root) {
+		var rows = root.querySelectorAll(".refby[data-refby]");
+		for (var i = 0; i < rows.length; i++) {
+			expand(rows[i]);
+		}
+	}
+
+	document.addEventListener("DOMContentLoaded", function() {
+		expandAll(document);
+		new MutationObserver(function(mutations) {
+			mutations.forEach(function(mutation) {
+				for (var i = 0; i < mutation.addedNodes.length; i++) {
+					var node = mutation.addedNodes[i];
+					if (node.nodeType == Node.ELEMENT_NODE) {
+						expandAll(node);
+					}
+				}
+			});
+		}).observe(document.body, {childList: true, subtree: true});
+	});
+})();
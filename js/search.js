@@ -0,0 +1,169 @@
+// Full-text search over the conflicts.
+// The index (written by build.py, see scripts/search.py) is only loaded when
+// the search box is first used.
+(function() {
+	var MAX_RESULTS = 25;
+
+	var index = null;
+	var loading = null;
+	// Decoded postings, by term.
+	var postings = {};
+	var sortedTerms = null;
+
+	// Must match stem() in scripts/search.py.
+	function stem(word) {
+		function ends(suffix) {
+			return word.slice(-suffix.length) == suffix;
+		}
+		if (word.length > 4 && ends("ies")) {
+			return word.slice(0, -3) + "y";
+		}
+		if (word.length > 4 && (ends("sses") || ends("shes") || ends("ches"))) {
+			return word.slice(0, -2);
+		}
+		if (word.length > 3 && ends("s") && !ends("ss") && !ends("us")) {
+			word = word.slice(0, -1);
+		}
+		if (word.length > 5 && ends("ing")) {
+			return word.slice(0, -3);
+		}
+		if (word.length > 4 && ends("ed")) {
+			return word.slice(0, -2);
+		}
+		return word;
+	}
+
+	function queryTerms(query) {
+		var words = query.toLowerCase().match(/[a-z]+/g) || [];
+		var terms = [];
+		for (var i = 0; i < words.length; i++) {
+			if (index.stop_words.indexOf(words[i]) != -1) {
+				continue;
+			}
+			terms.push(index.stemming ? stem(words[i]) : words[i]);
+		}
+		return terms;
+	}
+
+	// Return a map from doc index to count for |term|.
+	function decode(term) {
+		if (postings[term]) {
+			return postings[term];
+		}
+		var result = {};
+		var data = index.terms[term];
+		if (data) {
+			var doc = 0;
+			var entries = data.split(",");
+			for (var i = 0; i < entries.length; i++) {
+				var parts = entries[i].split(":");
+				doc += parseInt(parts[0], 36);
+				result[doc] = parts.length > 1 ? parseInt(parts[1], 36) : 1;
+			}
+		}
+		postings[term] = result;
+		return result;
+	}
+
+	// Return the terms that start with |prefix|.
+	function expand(prefix) {
+		if (!sortedTerms) {
+			sortedTerms = Object.keys(index.terms).sort();
+		}
+		var result = [];
+		for (var i = 0; i < sortedTerms.length; i++) {
+			if (sortedTerms[i].lastIndexOf(prefix, 0) == 0) {
+				result.push(sortedTerms[i]);
+			}
+		}
+		return result;
+	}
+
+	// Return the docs that match all the terms, ranked by tf-idf.
+	function search(query) {
+		var terms = queryTerms(query);
+		if (terms.length == 0) {
+			return [];
+		}
+		var numDocs = index.docs.length;
+		var scores = null;
+		for (var i = 0; i < terms.length; i++) {
+			// The last term may be incomplete, so match it as a prefix.
+			var variants = [terms[i]];
+			if (i == terms.length - 1 && !index.terms[terms[i]]) {
+				variants = expand(terms[i]);
+			}
+			var termScores = {};
+			for (var v = 0; v < variants.length; v++) {
+				var docs = decode(variants[v]);
+				var keys = Object.keys(docs);
+				// Always positive, so that matching a common term never lowers the score.
+				var idf = Math.log(1 + numDocs / keys.length);
+				for (var k = 0; k < keys.length; k++) {
+					termScores[keys[k]] = (termScores[keys[k]] || 0) + docs[keys[k]] * idf;
+				}
+			}
+			if (scores == null) {
+				scores = termScores;
+			} else {
+				var merged = {};
+				for (var doc in scores) {
+					if (doc in termScores) {
+						merged[doc] = scores[doc] + termScores[doc];
+					}
+				}
+				scores = merged;
+			}
+		}
+		var results = Object.keys(scores);
+		results.sort(function(a, b) { return scores[b] - scores[a]; });
+		return results.slice(0, MAX_RESULTS).map(function(doc) {
+			return index.docs[doc];
+		});
+	}
+
+	function showResults(names) {
+		var div = document.getElementById("search-results");
+		div.innerHTML = "";
+		for (var i = 0; i < names.length; i++) {
+			var id = names[i].match(/^\d+/)[0];
+			var link = document.createElement("a");
+			link.href = "#" + id;
+			link.className = "clink";
+			link.textContent = names[i];
+			div.appendChild(link);
+			div.appendChild(document.createTextNode(" "));
+		}
+	}
+
+	function load(form) {
+		if (!loading) {
+			loading = fetch(form.getAttribute("data-index"))
+				.then(function(response) { return response.json(); })
+				.then(function(data) { index = data; });
+		}
+		return loading;
+	}
+
+	document.addEventListener("DOMContentLoaded", function() {
+		var form = document.getElementById("search-form");
+		var input = document.getElementById("search-input");
+		if (!form || !input) {
+			return;
+		}
+		input.addEventListener("focus", function() { load(form); });
+		input.addEventListener("input", function() {
+			load(form).then(function() { showResults(search(input.value)); });
+		});
+		form.addEventListener("submit", function(e) {
+			e.preventDefault();
+			load(form).then(function() {
+				var results = search(input.value);
+				showResults(results);
+				if (results.length != 0) {
+					window.location.hash = "#" + results[0].match(/^\d+/)[0];
+				}
+			});
+		});
+	});
+})();
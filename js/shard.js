@@ -0,0 +1,54 @@
+// Load the shard that contains the requested conflict on demand.
+// The list of shards (plottoShards) is written into the index page by build.py.
+(function() {
+	var loaded = {};
+
+	function findShard(id) {
+		var shards = window.plottoShards || [];
+		for (var i = 0; i < shards.length; i++) {
+			if (id >= shards[i].first && id <= shards[i].last) {
+				return i;
+			}
+		}
+		return -1;
+	}
+
+	function scrollTo(id) {
+		var elem = document.getElementById(id);
+		if (elem) {
+			elem.scrollIntoView();
+		}
+	}
+
+	function show(id) {
+		var n = parseInt(id, 10);
+		if (isNaN(n) || String(n) != id) {
+			return;
+		}
+		var index = findShard(n);
+		if (index == -1) {
+			return;
+		}
+		if (loaded[index]) {
+			loaded[index].then(function() { scrollTo(id); });
+			return;
+		}
+		loaded[index] = fetch(window.plottoShards[index].file)
+			.then(function(response) { return response.text(); })
+			.then(function(html) {
+				document.getElementById("shard-" + index).innerHTML = html;
+			}, function(error) {
+				// Allow the shard to be requested again.
+				delete loaded[index];
+				throw error;
+			});
+		loaded[index].then(function() { scrollTo(id); });
+	}
+
+	function showHash() {
+		show(window.location.hash.substring(1));
+	}
+
+	window.addEventListener("hashchange", showHash);
+	document.addEventListener("DOMContentLoaded", showHash);
+})();
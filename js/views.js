@@ -0,0 +1,86 @@
+// Show the transformed text of the target of a link that changes the
+// characters (like "1035 ch A-2 to A-4") below the link, instead of jumping
+// to the original conflict.
+// The views are written by build.py (see scripts/transform.py) and are only
+// loaded when a transformed link is first clicked. The name of the file is
+// in plottoViews.
+(function() {
+	var views = null;
+	var loading = null;
+
+	function load() {
+		if (!loading) {
+			loading = fetch(window.plottoViews)
+				.then(function(response) { return response.json(); })
+				.then(function(data) {
+					views = data;
+				}, function(error) {
+					// Allow the views to be requested again.
+					loading = null;
+					throw error;
+				});
+		}
+		return loading;
+	}
+
+	function render(key, view) {
+		var panel = document.createElement("div");
+		panel.className = "xview";
+		panel.setAttribute("data-link", key);
+
+		var header = document.createElement("div");
+		header.className = "xviewheader";
+		var link = document.createElement("a");
+		link.href = "#" + view.id;
+		link.className = "clink";
+		link.textContent = view.id;
+		header.appendChild(link);
+		header.appendChild(document.createTextNode(" " + view.label));
+		panel.appendChild(header);
+
+		view.subconflicts.forEach(function(sub) {
+			var desc = document.createElement("div");
+			desc.className = "xviewdesc";
+			desc.textContent = sub[1];
+			if (view.subconflicts.length > 1) {
+				var subid = document.createElement("span");
+				subid.className = "subid";
+				subid.textContent = sub[0].substring(view.id.length);
+				desc.insertBefore(subid, desc.firstChild);
+			}
+			panel.appendChild(desc);
+		});
+		return panel;
+	}
+
+	// Show the view for |link| (or hide it if it is already shown).
+	function toggle(link) {
+		var key = link.textContent;
+		var row = link.closest("div");
+		var next = row.nextElementSibling;
+		if (next && next.className == "xview") {
+			next.parentNode.removeChild(next);
+			if (next.getAttribute("data-link") == key) {
+				return;
+			}
+		}
+		row.parentNode.insertBefore(render(key, views[key]), row.nextSibling);
+	}
+
+	document.addEventListener("click", function(event) {
+		var link = event.target.closest ? event.target.closest("a.xlink") : null;
+		if (!link || !window.plottoViews || !window.fetch) {
+			return;
+		}
+		event.preventDefault();
+		load().then(function() {
+			if (views[link.textContent]) {
+				toggle(link);
+			} else {
+				window.location.hash = link.getAttribute("href").substring(1);
+			}
+		}, function() {
+			window.location.hash = link.getAttribute("href").substring(1);
+		});
+	});
+})();
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Analysis of the links between conflicts.
+#
+# verify.py checks that each link is well-formed. This checks where the links
+# go, using the link graph (see linkgraph.py):
+#   - links to conflicts or subconflicts that don't exist (errors)
+#   - PRE/POST links that aren't reciprocated: a POST link from X to Y
+#     without a PRE link from Y back to X (and vice versa)
+#   - the strongly connected components, sources and sinks of the flow
+#     between conflicts
+#   - the distribution of the in- and out-degrees
+#   - the longest chain of conflicts without cycles
+#
+# The flow is between conflicts (the subconflict ids are ignored): there is
+# an edge from X to Y if X has a POST link to Y or Y has a PRE link to X.
+# Everything is computed in time linear in the number of links.
+#
+# Usage: python3 plotto.py analyze <options>
+
+import collections
+import getopt
+import json
+import sys
+
+import corpus
+import linkgraph
+import verify
+
+# Number of items shown for each list (unless --verbose).
+MAX_ITEMS = 10
+
+def error(msg):
+	print('Error: %s' % (msg), file=sys.stderr)
+	sys.exit(1)
+
+# Return the diagnostics for the links to nodes that aren't defined.
+# |lines| maps each node to the index of its line in the source.
+def dangling_links(graph, lines):
+	diagnostics = []
+	for n in range(len(graph)):
+		name = graph.nodes[n]
+		for e in range(graph.offsets[n], graph.offsets[n+1]):
+			target = graph.nodes[graph.targets[e]]
+			if graph.defined[graph.targets[e]]:
+				continue
+			kind = linkgraph.KIND_NAMES[graph.kinds[e]]
+			parent = linkgraph.conflict_of(target)
+			if parent != target and graph.is_defined(parent):
+				msg = '%s link to %s: conflict %s has no subconflict %s' % (
+						kind, target, parent, target[len(parent):])
+			else:
+				msg = '%s link to %s: no such conflict' % (kind, target)
+			diagnostics.append(verify.Diagnostic(lines[name] + 1, name, verify.ERROR, msg))
+	return diagnostics
+
+# Return the (from, to) pairs of conflicts for the POST links and for the
+# PRE links (reversed, so that both are in the direction of the flow).
+def flow_pairs(graph):
+	post = set()
+	pre = set()
+	for n in range(len(graph)):
+		a = linkgraph.conflict_of(graph.nodes[n])
+		for e in range(graph.offsets[n], graph.offsets[n+1]):
+			b = linkgraph.conflict_of(graph.nodes[graph.targets[e]])
+			if a == b:
+				continue
+			if graph.kinds[e] == linkgraph.POST:
+				post.add((a, b))
+			elif graph.kinds[e] == linkgraph.PRE:
+				pre.add((b, a))
+	return (post, pre)
+
+# Return the successors of each conflict in |ids| (as indexes into |ids|)
+# for the flow |pairs|. Links to undefined conflicts are ignored.
+def successors(ids, pairs):
+	index = dict([(id, i) for (i, id) in enumerate(ids)])
+	succ = [[] for id in ids]
+	for (a, b) in pairs:
+		if a in index and b in index:
+			succ[index[a]].append(index[b])
+	for s in succ:
+		s.sort()
+	return succ
+
+# Return the strongly connected components of the graph |succ| (Tarjan's
+# algorithm, without recursion). The components are returned in reverse
+# topological order: there are no edges from a component to a later one.
+def strongly_connected_components(succ):
+	n = len(succ)
+	index = [-1] * n
+	low = [0] * n
+	on_stack = [False] * n
+	stack = []
+	components = []
+	counter = 0
+	for root in range(n):
+		if index[root] != -1:
+			continue
+		index[root] = low[root] = counter
+		counter += 1
+		stack.append(root)
+		on_stack[root] = True
+		# (node, index of the next successor to visit)
+		work = [(root, 0)]
+		while work:
+			(v, i) = work[-1]
+			if i < len(succ[v]):
+				work[-1] = (v, i + 1)
+				w = succ[v][i]
+				if index[w] == -1:
+					index[w] = low[w] = counter
+					counter += 1
+					stack.append(w)
+					on_stack[w] = True
+					work.append((w, 0))
+				elif on_stack[w]:
+					low[v] = min(low[v], index[w])
+				continue
+			work.pop()
+			if work:
+				u = work[-1][0]
+				low[u] = min(low[u], low[v])
+			if low[v] == index[v]:
+				component = []
+				while True:
+					w = stack.pop()
+					on_stack[w] = False
+					component.append(w)
+					if w == v:
+						break
+				components.append(sorted(component))
+	return components
+
+# Return the shortest path from |start| to |end| that stays within the
+# component |c|.
+def path_within(succ, component_of, c, start, end):
+	prev = {start: None}
+	queue = collections.deque([start])
+	while queue:
+		v = queue.popleft()
+		if v == end:
+			break
+		for w in succ[v]:
+			if component_of[w] == c and not w in prev:
+				prev[w] = v
+				queue.append(w)
+	path = []
+	v = end
+	while v != None:
+		path.append(v)
+		v = prev[v]
+	return path[::-1]
+
+# Return the longest chain (list of nodes) without cycles in the graph
+# |succ|. The chain is the longest path between the |components| (each of
+# which counts as a single step), where the path through each component is
+# the shortest one from where the chain enters it to where it leaves.
+def longest_chain(succ, components):
+	if len(components) == 0:
+		return []
+	component_of = [0] * len(succ)
+	for (c, members) in enumerate(components):
+		for v in members:
+			component_of[v] = c
+
+	# The components are in reverse topological order, so the successors of
+	# each component have already been handled.
+	length = [1] * len(components)
+	next_edge = [None] * len(components)
+	for (c, members) in enumerate(components):
+		for v in members:
+			for w in succ[v]:
+				d = component_of[w]
+				if d != c and length[d] + 1 > length[c]:
+					length[c] = length[d] + 1
+					next_edge[c] = (v, w)
+
+	c = max(range(len(components)), key=lambda c: (length[c], -c))
+	chain = []
+	entry = None
+	while True:
+		edge = next_edge[c]
+		if entry == None:
+			entry = edge[0] if edge != None else components[c][0]
+		exit = edge[0] if edge != None else entry
+		chain.extend(path_within(succ, component_of, c, entry, exit))
+		if edge == None:
+			break
+		entry = edge[1]
+		c = component_of[entry]
+	return chain
+
+# Return a sorted list of (degree, count).
+def histogram(degrees):
+	return sorted(collections.Counter(degrees).items())
+
+class Report(object):
+	"""The results of the analysis."""
+
+	def __init__(self, source):
+		graph = linkgraph.cached(source)
+
+		lines = {}
+		for c in source.conflicts:
+			lines[c.id] = c.line
+			for s in c.subconflicts:
+				lines[c.id + s.subid] = s.line
+		self.diagnostics = dangling_links(graph, lines)
+
+		(post, pre) = flow_pairs(graph)
+		# POST links (from, to) without a matching PRE link, and PRE links
+		# (from, to) without a matching POST link.
+		self.missing_pre = sorted(post - pre, key=self.pair_key)
+		self.missing_post = sorted([(b, a) for (a, b) in pre - post], key=self.pair_key)
+
+		self.ids = [c.id for c in source.conflicts]
+		succ = successors(self.ids, post | pre)
+		in_degree = [0] * len(self.ids)
+		for s in succ:
+			for w in s:
+				in_degree[w] += 1
+		out_degree = [len(s) for s in succ]
+		self.in_degrees = histogram(in_degree)
+		self.out_degrees = histogram(out_degree)
+		n = range(len(self.ids))
+		self.sources = [self.ids[i] for i in n if in_degree[i] == 0 and out_degree[i] != 0]
+		self.sinks = [self.ids[i] for i in n if out_degree[i] == 0 and in_degree[i] != 0]
+		self.isolated = [self.ids[i] for i in n if in_degree[i] == 0 and out_degree[i] == 0]
+
+		components = strongly_connected_components(succ)
+		self.components = sorted([[self.ids[v] for v in c] for c in components if len(c) > 1],
+				key=lambda c: (-len(c), linkgraph.node_key(c[0])))
+		self.chain = [self.ids[v] for v in longest_chain(succ, components)]
+
+	@staticmethod
+	def pair_key(pair):
+		return (linkgraph.node_key(pair[0]), linkgraph.node_key(pair[1]))
+
+	def errors(self):
+		return len([d for d in self.diagnostics if d.severity == verify.ERROR])
+
+	def to_json(self, src):
+		return {
+			'source': src,
+			'errors': self.errors(),
+			'diagnostics': [d.to_json() for d in self.diagnostics],
+			'missing_pre': self.missing_pre,
+			'missing_post': self.missing_post,
+			'components': self.components,
+			'sources': self.sources,
+			'sinks': self.sinks,
+			'isolated': self.isolated,
+			'in_degrees': self.in_degrees,
+			'out_degrees': self.out_degrees,
+			'longest_chain': self.chain,
+		}
+
+	def write(self, src, verbose=False):
+		for d in self.diagnostics:
+			print(d.format(src))
+
+		def items(values):
+			if not verbose and len(values) > MAX_ITEMS:
+				return ', '.join(values[:MAX_ITEMS]) + ', ...'
+			return ', '.join(values)
+
+		def pairs(values):
+			return items(['%s -> %s' % p for p in values])
+
+		print('Conflicts: %d' % len(self.ids))
+		print('POST links without a PRE link back: %d' % len(self.missing_pre))
+		if self.missing_pre:
+			print('  %s' % pairs(self.missing_pre))
+		print('PRE links without a POST link back: %d' % len(self.missing_post))
+		if self.missing_post:
+			print('  %s' % pairs(self.missing_post))
+		print('Strongly connected components (with more than 1 conflict): %d' % len(self.components))
+		for c in self.components[:None if verbose else MAX_ITEMS]:
+			print('  %d: %s' % (len(c), items(c)))
+		for (name, values) in [('Sources', self.sources), ('Sinks', self.sinks),
+				('Isolated', self.isolated)]:
+			print('%s: %d' % (name, len(values)))
+			if values:
+				print('  %s' % items(values))
+		for (name, degrees) in [('In-degrees', self.in_degrees),
+				('Out-degrees', self.out_degrees)]:
+			print('%s:' % name)
+			for (degree, count) in degrees:
+				print('  %3d: %d' % (degree, count))
+		print('Longest chain without cycles: %d' % len(self.chain))
+		print('  %s' % ' -> '.join(self.chain))
+
+def usage():
+	print('Usage: %s analyze <options>' % sys.argv[0])
+	print('where <options> are:')
+	print('  --json <file>')  # also write the report as JSON
+	print('  --verbose')  # list everything (instead of the first few of each)
+
+def main(argv):
+	try:
+		opts, args = getopt.getopt(argv,
+			'v',
+			['json=', 'verbose'])
+	except getopt.GetoptError:
+		usage()
+		exit()
+
+	json_file = None
+	verbose = False
+	for opt, arg in opts:
+		if opt == '--json':
+			json_file = arg
+		elif opt in ('-v', '--verbose'):
+			verbose = True
+
+	infilename = '../plotto.txt'
+	report = Report(corpus.load(infilename))
+	report.write(infilename, verbose)
+	if json_file:
+		try:
+			with open(json_file, 'w') as f:
+				json.dump(report.to_json(infilename), f, indent=2, sort_keys=True)
+				f.write('\n')
+		except IOError as e:
+			error('Unable to open "%s" for writing: %s' % (json_file, e))
+
+	errors = report.errors()
+	if errors != 0:
+		print('%d error(s)' % errors)
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
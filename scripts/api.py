@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Static JSON API.
+#
+# Writes one JSON file for each conflict (in each variant), so that apps can
+# fetch the few conflicts they need instead of the whole HTML document:
+#   <dir>/manifest.json
+#   <dir>/conflicts/<id>.<hash>.json
+# The file names include a hash of their contents, so a conflict keeps its
+# URL for as long as it doesn't change and the files can be cached forever.
+# The manifest (which must not be cached for long) maps each conflict id to
+# its current file.
+#
+# Conflict format:
+#   id, group, subgroup
+#   bclause: {id, name}
+#   referenced_by
+#   subconflicts: list of {subid, pre, text, links, post, referenced_by}
+# where pre, post and links (the links in the text) are lists of links, and
+# each link is {text, sequence}: a sequence of lists of alternative targets.
+# referenced_by lists the subconflicts that link to the (sub)conflict.
+
+import hashlib
+import json
+import os
+import os.path
+
+import linkgraph
+import links
+import output
+
+# Bump this whenever the format of the files changes.
+API_VERSION = 2
+
+MANIFEST = 'manifest.json'
+CONFLICTS_DIR = 'conflicts'
+
+# Number of hex digits of the content hash in the file names.
+HASH_LENGTH = 12
+
+def api_dir(dst):
+	return os.path.splitext(dst)[0] + '-api'
+
+def target_data(target):
+	return {
+		'id': target.id,
+		'subids': list(target.subids),
+		'qualifiers': target.qualifiers,
+		'part': target.part,
+		'transforms': [[t.op] + list(t.args) for t in target.transforms],
+		'note': target.note,
+	}
+
+# Return the data for the |text| between the parentheses of a link.
+def link_data(text):
+	link = links.parse(text)
+	return {
+		'text': text,
+		'sequence': [[target_data(t) for t in alternatives if t.text != '']
+				for alternatives in link.sequence],
+	}
+
+# Return the data for a string of links "(123) (234a ch A to B)".
+def links_data(text):
+	return [link_data(l) for l in linkgraph.split_links(text)]
+
+# Return the data for the links in the |text| of a subconflict.
+def text_links_data(text):
+	return [link_data(link) for (kind, link) in linkgraph.text_links(text)]
+
+def conflict_data(id, group, subgroup, bclause_id, bclause_name, referenced_by):
+	return {
+		'id': id,
+		'group': group,
+		'subgroup': subgroup,
+		'bclause': {'id': bclause_id, 'name': bclause_name},
+		'referenced_by': list(referenced_by),
+		'subconflicts': [],
+	}
+
+def subconflict_data(subid, pre, referenced_by):
+	return {
+		'subid': subid,
+		'pre': links_data(pre),
+		'text': '',
+		'links': [],
+		'post': [],
+		'referenced_by': list(referenced_by),
+	}
+
+def to_json(data):
+	return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+# Return the name of the file for |data| (the JSON for conflict |id|).
+def conflict_file(id, data):
+	hash = hashlib.sha1(data.encode('utf-8')).hexdigest()[:HASH_LENGTH]
+	return '%s/%s.%s.json' % (CONFLICTS_DIR, id, hash)
+
+# Write the API for the |conflicts| (from conflict_data) into |dir|.
+# Files for old versions of the conflicts are removed.
+# If |compress| is set, then compressed copies of each file are written too.
+def write(conflicts, dir, compress=False):
+	conflicts_dir = os.path.join(dir, CONFLICTS_DIR)
+	if not os.path.isdir(conflicts_dir):
+		os.makedirs(conflicts_dir)
+
+	files = {}
+	for c in conflicts:
+		data = to_json(c)
+		file = conflict_file(c['id'], data)
+		output.write_if_changed(os.path.join(dir, file), data, compress)
+		files[c['id']] = file
+
+	# The manifest is written after the files that it refers to.
+	manifest = {
+		'version': API_VERSION,
+		'conflicts': files,
+	}
+	output.write_if_changed(os.path.join(dir, MANIFEST), to_json(manifest), compress)
+
+	output.remove_stale(conflicts_dir, set([os.path.basename(f) for f in files.values()]))
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark and equivalence check for the gender swap (see genderswap.py).
+#
+# Compares the fm casting (see casting.py) against the original word-by-word
+# implementation (ReferenceSwapper, below):
+#  * every line of the source must be swapped in the same way
+#  * the rendered A=female, B=male document must be byte-identical to both
+#    the reference rendering and the current plotto-fm.html
+# and reports the time taken by each.
+#
+# Usage: python3 bench-swap.py [--repeat <n>]
+
+import getopt
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+import build
+import casting
+import corpus
+import genderswap
+import lexer
+
+class ReferenceSwapper(object):
+	"""The original word-by-word gender swap."""
+
+	def __init__(self):
+		self.chars = genderswap.swap_chars()
+		self.terms = genderswap.swap_terms()
+
+	def swap_word(self, word, info):
+		if word == '':
+			return word
+
+		char = word.split('-')
+		if len(char) == 2:
+			(pre, post) = char
+			if post == 'A' or post == 'B':
+				if pre in self.chars:
+					return '%s-%s' % (self.chars[pre], post)
+
+		if word == 'U' and info.u_info:
+			return word
+
+		if word in genderswap.SWAP_CHARS_ALONE:
+			return self.chars[word]
+
+		cap = False
+		wordLower = word
+		if word[0].isupper():
+			cap = True
+			wordLower = word[0].lower() + word[1:]
+
+		if wordLower == 'her':
+			wordNew = 'his'
+			if info.her_info != None:
+				if len(info.her_info) == 0:
+					print(info.page, info.id, 'missing her info')
+				type = info.her_info.pop(0)
+				if type == 'obj':
+					wordNew = 'him'
+				elif type == 'poss':
+					wordNew = 'his'
+				else:
+					assert False
+			if cap:
+				wordNew = wordNew[0].upper() + wordNew[1:]
+			return wordNew
+
+		if wordLower == 'husband' and info.husband_info:
+			return 'husband'
+		if wordLower == 'mistress' and info.mistress_info:
+			return 'master'
+
+		if wordLower in self.terms:
+			wordNew = self.terms[wordLower]
+			if cap:
+				wordNew = wordNew[0].upper() + wordNew[1:]
+			return wordNew
+		return word
+
+	def swap_line(self, line, info):
+		if line[0:2] == '--':
+			return line
+		words = genderswap.split_words(line)
+		# The words and delimiters alternate, starting with a word.
+		for i in range(0, len(words), 2):
+			if i == 0 or not words[i - 1] in genderswap.NO_SWAP_AFTER:
+				words[i] = self.swap_word(words[i], info)
+		return ''.join(words)
+
+class Annotations(object):
+	"""The HER/U/HUSBAND/MISTRESS annotations for a line of the source
+	(from the comment on the line before), as ReferenceSwapper uses them."""
+
+	page = 0
+	id = ''
+
+	def __init__(self, source, i):
+		self.her_info = None
+		self.u_info = None
+		self.husband_info = None
+		self.mistress_info = None
+		if i == 0 or source.token(i - 1).kind != lexer.COMMENT:
+			return
+		(directive, value) = source.token(i - 1).args
+		if directive == 'HER':
+			self.her_info = value.split()
+		elif directive == 'U':
+			self.u_info = value.split()
+		elif directive == 'HUSBAND' and value == 'verb':
+			self.husband_info = 'verb'
+		elif directive == 'MISTRESS' and value == 'master':
+			self.mistress_info = 'master'
+
+# Return the stripped lines of |source| swapped by the ReferenceSwapper.
+def reference_lines(source):
+	swapper = ReferenceSwapper()
+	return [swapper.swap_line(source.lines[i].strip(), Annotations(source, i))
+			for i in range(len(source))]
+
+# Return the stripped lines of |source| with the fm casting applied (with a
+# new index, rather than the cached one).
+def casting_lines(source):
+	table = casting.load_table('fm')
+	fm = casting.Casting(table, casting.Index(source, table.words()))
+	lines = [line.strip() for line in source.lines]
+	for (i, changes) in fm.changes(0, len(source)):
+		lines[i] = casting.apply(lines[i], changes)
+	return lines
+
+# Render |source| into |dst|, with the fm casting if |fm| is set.
+def render(source, dst, fm=False):
+	parser = build.Parser()
+	if fm:
+		table = casting.load_table('fm')
+		parser.setCasting(casting.Casting(table, casting.index(source, [table])))
+	parser.setJavascript('random.js')
+	parser.setCss('plotto.css')
+	parser.render(source, dst)
+
+def read_file(path):
+	f = open(path, 'r', encoding='utf-8')
+	data = f.read()
+	f.close()
+	return data
+
+# Return the best time (in seconds) of |repeat| calls to |fn|.
+def best_time(fn, repeat):
+	best = None
+	for i in range(repeat):
+		start = time.time()
+		fn()
+		elapsed = time.time() - start
+		if best == None or elapsed < best:
+			best = elapsed
+	return best
+
+def usage():
+	print('Usage: %s [--repeat <n>]' % sys.argv[0])
+
+def main():
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], 'r:', ['repeat='])
+	except getopt.GetoptError:
+		usage()
+		exit()
+
+	repeat = 5
+	for opt, arg in opts:
+		if opt in ('-r', '--repeat'):
+			repeat = int(arg)
+
+	source = build.read_source('../plotto.txt')
+	failed = False
+
+	# Line by line, with the annotations.
+	expected = reference_lines(source)
+	actual = casting_lines(source)
+	for (n, (a, b)) in enumerate(zip(expected, actual)):
+		if a != b:
+			print('Line %d differs:\n  reference: %s\n  casting:   %s' % (n + 1, a, b))
+			failed = True
+
+	print('Swap %d lines:' % len(source))
+	for (name, fn) in [('reference', reference_lines), ('casting', casting_lines)]:
+		t = best_time(lambda: fn(source), repeat)
+		print('  %-10s %7.1f ms' % (name, t * 1000))
+
+	# The whole document: the source as written ('copy'), the source already
+	# swapped by the reference ('reference', without the time of the swap
+	# above) and the source with the fm casting ('casting').
+	tmp_dir = tempfile.mkdtemp()
+	try:
+		swapped_src = os.path.join(tmp_dir, 'plotto-fm.txt')
+		swapped = corpus.from_data(swapped_src, '\n'.join(expected).encode('utf-8'), False)
+		renders = [
+			('copy', lambda dst: render(source, dst)),
+			('reference', lambda dst: render(swapped, dst)),
+			('casting', lambda dst: render(source, dst, True)),
+		]
+		print('Render plotto-fm.html:')
+		output = {}
+		for (name, fn) in renders:
+			dst = os.path.join(tmp_dir, name + '.html')
+			t = best_time(lambda: fn(dst), repeat)
+			output[name] = read_file(dst)
+			print('  %-10s %7.1f ms' % (name, t * 1000))
+	finally:
+		shutil.rmtree(tmp_dir)
+
+	if output['casting'] != output['reference']:
+		print('Rendered document differs from the reference')
+		failed = True
+
+	# And the full build (with the search box) against the published file.
+	config = build.load_config('config-fm.txt')
+	published = read_file(config['output_file'])
+	tmp_dir = tempfile.mkdtemp()
+	try:
+		config['output_file'] = os.path.join(tmp_dir, 'plotto-fm.html')
+		# The page registers the service worker relative to the page.
+		build.service_worker_file = os.path.join(tmp_dir, 'sw.js')
+		build.build_variant(config, source, False)
+		current = read_file(config['output_file'])
+	finally:
+		shutil.rmtree(tmp_dir)
+	if current != published:
+		print('Built document differs from the published plotto-fm.html')
+		failed = True
+
+	if failed:
+		sys.exit(1)
+	print('OK')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,8 @@
+# Benchmarks for the Plotto tools.
+#
+# Times each stage of the pipeline (fixup, verify, build, ...) on plotto.txt
+# and on synthetic corpora that are larger copies of it (see synth.py), and
+# reports the time, peak memory and lines per second of each stage.
+#
+# Run this from within the scripts/ directory:
+#   python3 -m benchmark <options>
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Usage: python3 -m benchmark <options>
+#
+# Each stage is run in a separate process so that the peak memory of one
+# stage doesn't hide the peak memory of the next.
+
+import getopt
+import json
+import multiprocessing
+import os
+import os.path
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import corpus
+
+from benchmark import stages
+from benchmark import synth
+
+def error(msg):
+	print('Error: %s' % (msg), file=sys.stderr)
+	sys.exit(1)
+
+# Peak resident memory of this process, in KB.
+def peak_memory():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# Run stage |name| on |src| (in a child process) and send the result to
+# |queue|.
+def run_stage(name, src, tmp_dir, queue):
+	result = {'status': 'ok'}
+	try:
+		fn = dict(stages.STAGES)[name]
+		source = corpus.load(src)
+		# Don't include the output of the stage in the report.
+		devnull = open(os.devnull, 'w')
+		stdout = sys.stdout
+		sys.stdout = devnull
+		start = time.time()
+		try:
+			fn(src, source, tmp_dir)
+		finally:
+			result['time'] = time.time() - start
+			sys.stdout = stdout
+			devnull.close()
+	except SystemExit as e:
+		# The tools exit on errors.
+		result['status'] = 'error (exit %s)' % e.code
+	except Exception as e:
+		result['status'] = 'error (%s: %s)' % (type(e).__name__, e)
+	result['peak_memory_kb'] = peak_memory()
+	queue.put(result)
+
+def measure(name, src, tmp_dir):
+	queue = multiprocessing.Queue()
+	p = multiprocessing.Process(target=run_stage, args=(name, src, tmp_dir, queue))
+	p.start()
+	result = queue.get()
+	p.join()
+	return result
+
+def count_lines(path):
+	with open(path, 'rb') as f:
+		return f.read().count(b'\n') + 1
+
+def git_commit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+				stderr=open(os.devnull, 'w')).decode('ascii').strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def usage():
+	print('Usage: python3 -m benchmark <options>')
+	print('where <options> are:')
+	print('  --scale <n>[,<n>...]')  # corpus sizes, as multiples of plotto.txt (default 1,10)
+	print('  --stage <name>[,<name>...]')  # stages to run (default all)
+	print('  --repeat <n>')  # runs of each stage (the best time is reported)
+	print('  --output <file>')  # write the results as JSON
+	print('  --keep')  # keep the synthetic corpora (in .plotto-cache/bench)
+	print('Stages: %s' % ', '.join(stages.STAGE_NAMES))
+
+def main():
+	try:
+		opts, args = getopt.getopt(sys.argv[1:],
+			'o:r:s:',
+			['scale=', 'stage=', 'repeat=', 'output=', 'keep'])
+	except getopt.GetoptError:
+		usage()
+		exit()
+
+	scales = [1, 10]
+	stage_names = stages.STAGE_NAMES
+	repeat = 1
+	output_file = None
+	keep = False
+	for opt, arg in opts:
+		if opt in ('-s', '--scale'):
+			scales = [int(x) for x in arg.split(',')]
+		elif opt == '--stage':
+			stage_names = arg.split(',')
+			for name in stage_names:
+				if not name in stages.STAGE_NAMES:
+					error('Unknown stage: %s' % name)
+		elif opt in ('-r', '--repeat'):
+			repeat = int(arg)
+		elif opt in ('-o', '--output'):
+			output_file = arg
+		elif opt == '--keep':
+			keep = True
+
+	src = '../plotto.txt'
+	if keep:
+		corpus_dir = os.path.join(os.path.dirname(os.path.abspath(src)),
+				corpus.CACHE_DIR, 'bench')
+		if not os.path.isdir(corpus_dir):
+			os.makedirs(corpus_dir)
+	else:
+		corpus_dir = tempfile.mkdtemp()
+	tmp_dir = tempfile.mkdtemp()
+
+	base_lines = count_lines(src)
+	results = []
+	try:
+		for scale in scales:
+			path = src
+			if scale != 1:
+				path = os.path.join(corpus_dir, 'plotto-x%d.txt' % scale)
+				synth.write_corpus(src, path, scale)
+			lines = count_lines(path)
+			ratio = lines / base_lines
+			print('Corpus x%d (%d lines, %.2f times plotto.txt):' % (scale, lines, ratio))
+			for name in stage_names:
+				runs = [measure(name, path, tmp_dir) for i in range(repeat)]
+				ok = [r for r in runs if r['status'] == 'ok']
+				best = min(ok, key=lambda r: r['time']) if ok else runs[0]
+				result = {
+					'scale': scale,
+					'lines': lines,
+					'ratio': ratio,
+					'stage': name,
+					'status': best['status'],
+					'peak_memory_kb': max([r['peak_memory_kb'] for r in runs]),
+				}
+				if best['status'] == 'ok':
+					result['time'] = best['time']
+					result['lines_per_sec'] = lines / best['time'] if best['time'] else None
+					print('  %-10s %8.3fs %8d KB %10d lines/s' % (name, result['time'],
+							result['peak_memory_kb'], result['lines_per_sec']))
+				else:
+					print('  %-10s %s' % (name, best['status']))
+				results.append(result)
+				sys.stdout.flush()
+	finally:
+		shutil.rmtree(tmp_dir)
+		if not keep:
+			shutil.rmtree(corpus_dir)
+
+	if output_file:
+		report = {
+			'commit': git_commit(),
+			'python': platform.python_version(),
+			'repeat': repeat,
+			'results': results,
+		}
+		with open(output_file, 'w') as f:
+			json.dump(report, f, indent=2, sort_keys=True)
+			f.write('\n')
+
+if __name__ == '__main__':
+	main()
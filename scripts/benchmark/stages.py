@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# The stages of the pipeline that are benchmarked.
+#
+# Each stage is a function (src, source, tmp_dir) that processes the corpus
+# file |src| (already parsed as |source|, for the stages that use it) and
+# writes any output into |tmp_dir|.
+
+import os.path
+
+import build
+import casting
+import corpus
+import fixup
+import verify
+
+def parse(src, source, tmp_dir):
+	with open(src, 'r', encoding='utf-8') as f:
+		corpus.parse(f.read())
+
+def run_fixup(src, source, tmp_dir):
+	parser = fixup.Parser()
+	parser.process(src, os.path.join(tmp_dir, 'fixup.txt'))
+
+def run_verify(src, source, tmp_dir):
+	verify.verify(src, None, 1)
+
+def render(source, name, dst):
+	table = casting.load_table(name)
+	parser = build.Parser()
+	parser.setCasting(casting.Casting(table, casting.index(source, [table])))
+	parser.render(source, dst)
+
+def build_mf(src, source, tmp_dir):
+	render(source, 'mf', os.path.join(tmp_dir, 'plotto-mf.html'))
+
+def build_fm(src, source, tmp_dir):
+	render(source, 'fm', os.path.join(tmp_dir, 'plotto-fm.html'))
+
+def build_neutral(src, source, tmp_dir):
+	render(source, 'neutral', os.path.join(tmp_dir, 'plotto-neutral.html'))
+
+# The word frequency dict (build.py --dict), without the rest of the build.
+def word_dict(src, source, tmp_dir):
+	parser = build.Parser()
+	parser.dict = {}
+	for line in source.lines:
+		parser.add_line_to_dict(line.strip())
+
+# Stages as (name, function), in the order that they are run.
+STAGES = [
+	('parse', parse),
+	('fixup', run_fixup),
+	('verify', run_verify),
+	('build-mf', build_mf),
+	('build-fm', build_fm),
+	('build-neutral', build_neutral),
+	('dict', word_dict),
+]
+
+STAGE_NAMES = [name for (name, fn) in STAGES]
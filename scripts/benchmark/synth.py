@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Synthetic corpora for the benchmarks.
+#
+# A corpus that is N times the size of plotto.txt is made by repeating the
+# conflict section. The rest of plotto.txt appears only once, so the number
+# of copies of the conflicts is the one that brings the line count closest to
+# N times that of plotto.txt (see copies()).
+#
+# Each copy of the conflicts is renumbered (by adding a multiple of a power of
+# 10 to each id), along with all the links in the copy, so that every link in
+# a copy points to a conflict in the same copy and the result is still a
+# valid corpus.
+
+import re
+
+import lexer
+
+_re_conflict = re.compile(r'^Conflict{(\d+)}')
+# All links in PRE: and POST: lines.
+_re_link = re.compile(r'\(([^)]*)\)')
+# Links in the conflict text must start with a digit.
+_re_text_link = re.compile(r'\((\d[^)]*)\)')
+_re_tag = re.compile(r'@{(\d+)')
+# The conflict ids within a link (but not the characters, like A-2).
+_re_id = re.compile(r'(?<![\w-])\d+')
+
+# Return the (start, end) lines of the conflict section in |lines|.
+def conflict_section(lines):
+	start = lines.index('-- page 18') + 1
+	end = lines.index('-- page 190')
+	return (start, end)
+
+# Return the amount to add to the ids in each copy of the conflicts.
+def id_step(lines):
+	max_id = 0
+	for line in lines:
+		m = _re_conflict.match(line)
+		if m:
+			max_id = max(max_id, int(m.group(1)))
+	return 10 ** len(str(max_id))
+
+def renumber_line(line, offset):
+	def add(m):
+		return str(int(m.group(0)) + offset)
+
+	def renumber_link(m):
+		return '(%s)' % _re_id.sub(add, m.group(1))
+
+	def renumber_tag(m):
+		return '@{%d' % (int(m.group(1)) + offset)
+
+	token = lexer.tokenize(line)
+	if token.kind == lexer.COMMENT:
+		return line
+	if token.kind == lexer.CONFLICT:
+		return 'Conflict{%d}%s' % (int(token.args[0]) + offset,
+				line[_re_conflict.match(line).end():])
+	if token.kind in (lexer.PRE, lexer.POST):
+		return _re_link.sub(renumber_link, line)
+	line = _re_text_link.sub(renumber_link, line)
+	return _re_tag.sub(renumber_tag, line)
+
+# Return the number of copies of the conflict section (of |section| lines)
+# that make a corpus of |lines| lines closest to |scale| times its size.
+def copies(lines, section, scale):
+	other = lines - section
+	return max(1, int(round((scale * lines - other) / section)))
+
+# Return the text of a corpus that is |scale| times the size of |text| (the
+# contents of plotto.txt), with as many copies of the conflicts as that takes.
+def scale_corpus(text, scale):
+	lines = text.split('\n')
+	(start, end) = conflict_section(lines)
+	step = id_step(lines)
+	section = lines[start:end]
+
+	result = lines[:end]
+	for copy in range(1, copies(len(lines), len(section), scale)):
+		offset = copy * step
+		result.extend([renumber_line(line, offset) for line in section])
+	result.extend(lines[end:])
+	return '\n'.join(result)
+
+# Write a corpus that is |scale| times the size of |src| to |dst|.
+def write_corpus(src, dst, scale):
+	with open(src, 'r', encoding='utf-8') as f:
+		text = f.read()
+	with open(dst, 'w', encoding='utf-8') as f:
+		f.write(scale_corpus(text, scale))
@@ -1,13 +1,111 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import subprocess
+# Run this script from within the scripts/ directory.
+#
+# Builds all the variants of Plotto. The source text is parsed (and searched
+# for the words that the castings replace) once and then shared by all the
+# variants, which are rendered in parallel.
 
-configs = [
-	'config-mf.txt',
-	'config-fm.txt',
-	]
+import getopt
+import multiprocessing
+import sys
 
-for config in configs:
-	cmd = ['python', 'build.py', '--config', config]
-	subprocess.call(cmd)
+import build
+import linkgraph
+import watch
+
+# The parsed source, casting index and link graph shared by all the worker
+# processes.
+source = None
+index = None
+graph = None
+incremental_build = True
+
+def init_worker(corpus, casting_index, link_graph, incremental):
+	global source, index, graph, incremental_build
+	source = corpus
+	index = casting_index
+	graph = link_graph
+	incremental_build = incremental
+
+# Returns the exit status for the build (non-zero on error).
+def build_config(config):
+	try:
+		build.build_variant(config, source, incremental_build, index=index, graph=graph)
+	except SystemExit as e:
+		# build.error() exits, which would otherwise take down the worker.
+		return e.code or 0
+	return 0
+
+def usage():
+	print('Usage: %s <options>' % sys.argv[0])
+	print('where <options> are:')
+	print('  --compress')  # also write compressed copies (.gz, .br) of the output files
+	print('  --full')  # rebuild everything (ignore results from previous build)
+	print('  --jobs <n>')  # max number of variants to build in parallel
+	print('  --shard')  # write an index page and load the conflicts on demand
+	print('  --watch')  # rebuild on every change and serve the output
+	print('  --port <n>')  # port for the preview server (with --watch)
+
+def main():
+	try:
+		opts, args = getopt.getopt(sys.argv[1:],
+			'fj:sw',
+			['compress', 'full', 'jobs=', 'shard', 'watch', 'port='])
+	except getopt.GetoptError:
+		usage()
+		exit()
+
+	jobs = min(len(build.config_files), multiprocessing.cpu_count())
+	compress = False
+	full_build = False
+	shard_output = False
+	watch_mode = False
+	port = 8000
+	for opt, arg in opts:
+		if opt == '--compress':
+			compress = True
+		elif opt in ('-f', '--full'):
+			full_build = True
+		elif opt in ('-j', '--jobs'):
+			jobs = int(arg)
+		elif opt in ('-s', '--shard'):
+			shard_output = True
+		elif opt in ('-w', '--watch'):
+			watch_mode = True
+		elif opt == '--port':
+			port = int(arg)
+
+	# Load all the configs up front so that errors are reported before
+	# any work is done.
+	config_data = [build.load_config(c) for c in build.config_files]
+	for config in config_data:
+		if shard_output:
+			config['shard'] = True
+		if compress:
+			config['compress'] = True
+	corpus = build.read_source('../plotto.txt')
+	casting_index = build.casting_index(corpus, config_data)
+	link_graph = linkgraph.cached(corpus)
+
+	if jobs <= 1:
+		init_worker(corpus, casting_index, link_graph, not full_build)
+		results = [build_config(config) for config in config_data]
+	else:
+		pool = multiprocessing.Pool(min(jobs, len(config_data)),
+				init_worker, (corpus, casting_index, link_graph, not full_build))
+		results = pool.map(build_config, config_data)
+		pool.close()
+		pool.join()
+
+	build.write_link_graph(link_graph, build.link_graph_file)
+	build.write_service_worker(config_data, build.service_worker_file)
+
+	if watch_mode:
+		watch.run('../plotto.txt', build.config_files, port, shard_output)
+	elif any(results):
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -1,100 +1,54 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
 # Run this script from within the scripts/ directory.
 
 import getopt
+import json
 import os.path
 import re
 import sys
 
+import api
+import casting
+import corpus
+import genderswap
+import incremental
+import lexer
+import linkgraph
+import links
+import offline
+import output
+import profiling
+import search
+import shard
+import transform
+
 def error(msg):
-	print 'Error: %s' % (msg)
+	print('Error: %s' % (msg))
 	sys.exit(1)
 
-# These terms are bidirectional unless marked with an '*'. In this case, then '*'ed
-# term is not replaced with the other term (although the other term will be replaced with
-# the '*'ed term).
-# 'her' always requires disambiguation, so there is no default substitution.
-#   her: objective (him) vs. possessive (his)
-genderedTerms = [
-	['adventurer', 'adventuress'],
-	['brother', 'sister'],
-	['brothers', 'sisters'],
-	['boy', 'girl'],
-	['clergyman', 'clergywoman'],
-	['cowboy', 'cowgirl'],
-	['craftsman', 'craftswoman'],
-	['father', 'mother'],
-	['fatherhood', 'motherhood'],
-	['fathers', 'mothers'],
-	['foreman', 'forewoman'],
-	['frontiersman', 'frontierswoman'],
-	['gentleman', 'lady'],
-	# Handle gentlemen's <- ladies' (ladies' is preprocessed into ladies_poss)
-	["*gentlemen's", "ladies_poss"],
-	['gentlemen', 'ladies'],
-	['grandfather', 'grandmother'],
-	['he', 'she'],
-	['highwayman', 'highwaywoman'],
-	# him -> her
-	# See comment at top for her -> his/him
-	['him', '*her'],
-	['himself', 'herself'],
-	# wife <-> husband
-	# husband: spouse (wife) vs. to manage
-	# husband converts by default to 'wife', needs annotation to remain unchanged (=to manage)
-	['husband', 'wife'],
-	# his -> her
-	# See comment at top for her -> his/him
-	['his', '*her'],
-	['male', 'female'],
-	['man', 'woman'],
-	['man-hater', 'woman-hater'],
-	['mankind', 'womankind'],
-	['manly', 'womanly'],
-	['manservant', 'maid'],
-	['men', 'women'],
-	['misogynist', 'misandrist'],
-	# lover <- mistress
-	# 'lover' is ungendered and is not converted into 'mistress'
-	# mistress: head of household (master) vs. lover
-	# 'mistress' converts by default to 'lover', needs annotation for 'master'
-	['*lover', 'mistress'],
-	['nephew', 'niece'],
-	['paternal', 'maternal'],
-	['policeman', 'policewoman'],
-	['son', 'daughter'],
-	['stepfather', 'stepmother'],
-	['uncle', 'aunt'],
-	# unmarried <- maiden
-	# 'unmarried' is ungendered and is left unchanged
-	# This mapping works because 'maiden' is only used as an adj, as in 'maiden aunt'
-	# and 'maiden sisters'. The noun form of 'maiden' is not used.
-	['*unmarried', 'maiden'],
-	['widower', 'widow'],
-	# cad: female equivalent?
-]
-
-# Gendered character abbreviations.
-# These don't need to be swapped, but it is more readable to do so.
-genderedChars = [
-	['F', 'M'],		# father mother
-	['BR', 'SR'],	# brother sister
-	['SN', 'D'],	# son daughter
-	['U', 'AU'],	# uncle aunt
-	['NW', 'NC'],	# nephew niece
-	['GF', 'GM'],	# grandfather grandmother
-	['SF', 'SM'],	# stepfather stepmother
+# Links in the front matter, optionally prefixed with the subconflict id.
+re_format_links = re.compile(r'^\s*\(([a-d])\) (.*)$')
+
+# Words that are not counted in the word frequency dict: conflict and link
+# ids.
+re_dict_skip = re.compile(r'^(Conflict?{\d+}|[@B]{\d+}|\(?[-\d]+[abcde]?\)?)$')
+
+# Parser fields that carry over from one block of the source to the next.
+STATE_FIELDS = [
+	'page', 'in_conflict_section', 'in_conflict_div', 'in_conflict',
+	'group', 'subgroup', 'bclause_id', 'bclause_name', 'id', 'subid', 'text',
+	'text_info',
+	'format_paragraph', 'format_lines', 'format_next_line', 'format_links',
+	'blank_line', 'next_id',
+	'her_info', 'a_info', 'u_info', 'husband_info', 'mistress_info',
 ]
 
 class Parser():
 	"""Build script for Plotto"""
 
 	def __init__(self):
-		self.A = 'm'
-		self.B = 'f'
-
 		self.page = 0
 		self.in_conflict_section = False
 		self.in_conflict_div = False
@@ -109,6 +63,8 @@ class Parser():
 		self.subid = ''
 
 		self.text = []
+		# The "-- A" annotation for each line of |text|.
+		self.text_info = []
 		self.links = {}
 
 		self.format_paragraph = None
@@ -122,40 +78,53 @@ class Parser():
 		self.js_files = []
 		self.css_files = []
 		self.enable_bootstrap = True
+
+		# True to split the output into an index page and shards.
+		self.shard = False
+
+		# True to write compressed copies (.gz, .br) of each output file.
+		self.compress = False
+
+		# Text of each conflict/subconflict as (name, text).
+		self.docs = []
+		# Search index to write (or None) and the options used to build it.
+		self.search_file = None
+		self.search_options = {}
+		# Data for each conflict (see api.py), or None if the API isn't
+		# being written.
+		self.api_conflicts = None
+		self.api_dir = None
+
+		# Map from each conflict and subconflict to the names of the
+		# subconflicts that link to it (or None to not show them).
+		self.referenced_by = None
+
+		# Views of the targets of the transformed links (see transform.py) to
+		# write (or None), with the targets as (text, id, subids, label, part,
+		# transforms) and the text of each conflict and subconflict as (name,
+		# text, determiners).
+		self.views_file = None
+		self.view_links = None
+		self.view_texts = None
+
+		# URL of the service worker to register (or None).
+		self.service_worker = None
 		
-		# Dict with count of all words found in doc.
-		self.dict = {}
-		
-		# Arrays to swap gendered character abbreviations.
-		self.swapCharList = {}
-		for x in genderedChars:
-			male = x[0]
-			female = x[1]
-			assert not (male in self.swapCharList)
-			self.swapCharList[male] = female
-			assert not (female in self.swapCharList)
-			self.swapCharList[female] = male
-
-		# Array to swap gendered terms for equivalent in opposite gender.
-		self.replaceList = {}
-		for x in genderedTerms:
-			male = x[0]
-			female = x[1]
-			m2f = True
-			f2m = True
-			if male[0] == '*':
-				male = male[1:]
-				m2f = False
-			if female[0] == '*':
-				female = female[1:]
-				f2m = False
-
-			if m2f:
-				assert not (male in self.replaceList)
-				self.replaceList[male] = female
-			if f2m:
-				assert not (female in self.replaceList)
-				self.replaceList[female] = male
+		# Dict with count of all words found in doc (or None if the words
+		# aren't being counted).
+		self.dict = None
+
+		# Casting of the variant (see casting.py), or None to leave the text
+		# as written.
+		self.casting = None
+
+		# Rendered blocks that the casting doesn't change (by fingerprint, see
+		# render_block()), shared with the other variants built by this
+		# process, or None to not share them.
+		self.shared_blocks = None
+
+		# Fingerprints of the blocks that were rendered (with a manifest).
+		self.block_fps = []
 
 		# The pronoun 'her' can be either the objective (cf. him) or the
 		# possessive (cf. his). By default, we assume the posssive, but the
@@ -181,18 +150,17 @@ class Parser():
 		# Use "-- MISTRESS master" to override default
 		self.mistress_info = None
 
-	def setAB(self, ab):
-		self.A = ab[0]
-		self.B = ab[1]
+	def setCasting(self, casting):
+		self.casting = casting
 
 	def setJavascript(self, js):
-		if isinstance(js, basestring):
+		if isinstance(js, str):
 			self.js_files = [js]
 		else:
 			self.js_files = js
 		
 	def setCss(self, css):
-		if isinstance(css, basestring):
+		if isinstance(css, str):
 			self.css_files = [css]
 		else:
 			self.css_files = css
@@ -217,49 +185,35 @@ class Parser():
 
 	# Return the HTML hyperlink for this link.
 	# Assumes all links are valid (since they were all checked by verify.py).
-	def parse_link(self, link):
-		orig_link = link
-
-		# Sequence: (123; 234)
-		if ';' in link:
-			links = link.split(';')
-			hlinks = []
-			for l in links:
-				l = l.strip()
-				hlink = self.parse_link(l)
-				if hlink == None:
-					return None
-				hlinks.append(hlink)
-			return ' ; '.join(hlinks)
-
-		# Alternation: (123 or 234)
-		if ' or ' in link:
-			links = link.split(' or ')
-			hlinks = []
-			for l in links:
-				l = l.strip()
-				hlink = self.parse_link(l)
-				if hlink == None:
-					return None
-				hlinks.append(hlink)
-			return ' or '.join(hlinks)
-
-		# ()
-		if re.match(r'^$', link):
+	# Note that the gender swap can change the characters in the links (e.g.,
+	# GF-A to GM-A), so only the target ids are required here.
+	def parse_link(self, text):
+		link = links.parse(text)
+		return ' ; '.join([' or '.join([self.target_hyperlink(t) for t in alternatives])
+				for alternatives in link.sequence])
+
+	def target_hyperlink(self, target):
+		if target.text == '':
 			return ''
-
-		# (123a, b, c)
-		m = re.match(r'^(\d+)([a-h](, [a-h])*)?(?P<extra>.*)$', link)
-		if not m:
-			error('Invalid links: {0}'.format(orig_link))
-		id = m.group(1)
-		subid = m.group(2)
-
-		orig_link = orig_link.replace("&", "&amp;")
-		return '<a href="#{0}" class="clink">{1}</a>'.format(id, orig_link)
+		if target.id == None:
+			error('Invalid links: {0}'.format(target.text))
+		css_class = 'clink'
+		if self.view_links != None and len(target.transforms) != 0:
+			self.view_links.append((target.text, target.id, target.subids, target.label,
+					target.part, transform.pack(target.transforms)))
+			css_class = 'clink xlink'
+		return '<a href="#{0}" class="{2}">{1}</a>'.format(
+				target.id, target.text.replace("&", "&amp;"), css_class)
 
 	# Process an entire line from the file.
 	def process_line(self, line):
+		self.process_token(lexer.tokenize(line))
+
+	# Process a single (lexed) line from the file.
+	def process_token(self, token):
+		# The annotation for A is only needed for the text of the views.
+		a_info = self.a_info
+
 		# Reset language defaults.
 		self.her_info = None
 		self.a_info = None
@@ -267,87 +221,86 @@ class Parser():
 		self.husband_info = None
 		self.mistress_info = None
 
+		kind = token.kind
+		line = token.line
+
 		# Process comments.
-		m = re.match(r'^--', line)
-		if m:
-			m = re.match(r'-- page (\d+)', line)
-			if m:
-				self.page = m.group(1)
+		if kind == lexer.COMMENT:
+			(directive, value) = token.args
+			if directive == None:
+				return
+
+			if directive == 'page':
+				self.page = value
 
 				if self.page == '18':
 					self.in_conflict_section = True
 					self.outfile.write('</div>\n')  # End the 'frontmatter' section
+					if self.shard:
+						self.outfile.write(shard.MARK_BEGIN)
 				if self.page == '190':
 					self.in_conflict_section = False
 					self.id = ''
+					if self.shard:
+						if self.in_conflict_div:
+							self.write_conflict_footer()
+						self.outfile.write(shard.MARK_END)
+				return
 
-			m = re.match(r'-- HER (.*)', line)
-			if m:
-				self.her_info = m.group(1).split()
-			m = re.match(r'-- A (.*)', line)
-			if m:
-				self.a_info = m.group(1).split()
-			m = re.match(r'-- U (.*)', line)
-			if m:
-				self.u_info = m.group(1).split()
-			if line == '-- HUSBAND verb':
-				self.husband_info = 'verb'
-			if line == '-- MISTRESS master':
-				self.mistress_info = 'master'
+			if directive == 'HER':
+				self.her_info = value.split()
+				return
+			if directive == 'A':
+				self.a_info = value.split()
+				return
+			if directive == 'U':
+				self.u_info = value.split()
+				return
+			if directive == 'HUSBAND':
+				if value == 'verb':
+					self.husband_info = 'verb'
+				return
+			if directive == 'MISTRESS':
+				if value == 'master':
+					self.mistress_info = 'master'
+				return
 
-			m = re.match(r'^-- ID:(.*)', line)
-			if m:
-				self.next_id = m.group(1)
+			if directive == 'ID':
+				self.next_id = value
 				return
 
-			m = re.match(r'^-- FORMAT_LINES:(.*)', line)
-			if m:
+			if directive == 'HR':
+				self.outfile.write('<hr/>\n')
+				return
+
+			# All remaining directives are FORMAT_*.
+			if directive == 'FORMAT_LINES':
 				# Put blank div between multiple FORMAT_LINES chunks.
 				if self.format_lines != None:
 					self.outfile.write('<div class="space">&nbsp;</div>\n')
 
-			m = re.match(r'^-- FORMAT', line)
-			if m:
-				# Any new format command cancels previous formatting.
-				self.format_paragraph = None
-				self.format_lines = None
-				self.format_next_line = None
-				self.format_links = None
-				# Fall through
+			# Any new format command cancels previous formatting.
+			self.format_paragraph = None
+			self.format_lines = None
+			self.format_next_line = None
+			self.format_links = None
 
 			# FORMAT_BEGIN must be followed by FORMAT_END
-			m = re.match(r'^-- FORMAT_BEGIN:(.*)', line)
-			if m:
-				self.format_paragraph = m.group(1)
+			if directive == 'FORMAT_BEGIN':
+				self.format_paragraph = value
 				self.outfile.write('<div class="{0}">\n'.format(self.format_paragraph))
-				return
-			m = re.match(r'^-- FORMAT_END', line)
-			if m:
+			elif directive == 'FORMAT_END':
 				self.outfile.write('</div>\n')
-				return
-
-			m = re.match(r'^-- FORMAT:(.*)', line)
-			if m:
-				self.format_next_line = m.group(1)
-				return
-			m = re.match(r'^-- FORMAT_LINES:(.*)', line)
-			if m:
-				if self.format_lines != None:
-					self.outfile.write('<div>xxx</div>\n')
-				self.format_lines = m.group(1)
-				return
-			m = re.match(r'^-- FORMAT_LINKS:(.*)', line)
-			if m:
-				self.format_links = m.group(1)
-				return
-			m = re.match(r'^-- HR', line)
-			if m:
-				self.outfile.write('<hr/>\n')
-				return
+			elif directive == 'FORMAT':
+				self.format_next_line = value
+			elif directive == 'FORMAT_LINES':
+				self.format_lines = value
+			elif directive == 'FORMAT_LINKS':
+				self.format_links = value
 			return
 
 		if self.format_paragraph:
-			if line == '':
+			if kind == lexer.BLANK:
 				if not self.blank_line:
 					self.outfile.write('</div>\n<div class="{0}">\n'.format(self.format_paragraph))
 					self.blank_line = True
@@ -371,7 +324,7 @@ class Parser():
 
 		if self.format_links:
 			prefix = ''
-			m = re.match('^\s*\(([a-d])\) (.*)$', line)
+			m = re_format_links.match(line)
 			if m:
 				prefix = '<span class="subid">{0}</span>'.format(m.group(1))
 				line = m.group(2)
@@ -380,66 +333,78 @@ class Parser():
 			return
 
 		if self.in_conflict_section:
-			if line == '':
+			if kind == lexer.BLANK:
 				return
 
-			m = re.match(r'^ConflictGroup{(.+)}$', line)
-			if m:
-				self.group = m.group(1)
+			if kind == lexer.GROUP:
+				self.group = token.args[0]
 				return
 
-			m = re.match(r'^ConflictSubGroup{(.*)}$', line)
-			if m:
-				self.subgroup = m.group(1)
+			if kind == lexer.SUBGROUP:
+				self.subgroup = token.args[0]
+				if self.shard:
+					# Each shard must be a self-contained chunk of HTML.
+					if self.in_conflict_div:
+						self.write_conflict_footer()
+					self.outfile.write(shard.MARK_SHARD)
 				self.write_group_header(self.group)
 				self.write_subgroup_header(self.subgroup)
 				return
 
-			m = re.match(r'^B{(\d+)} (.*)$', line)
-			if m:
-				self.bclause_id = m.group(1)
-				self.bclause_name = m.group(2)
+			if kind == lexer.BCLAUSE:
+				(self.bclause_id, self.bclause_name) = token.args
 				self.write_bclause_header(self.bclause_id, self.bclause_name)
 				return
 
-			m = re.match(r'^Conflict{(\d+)}$', line)
-			if m:
-				self.id = m.group(1)
+			if kind == lexer.CONFLICT:
+				self.id = token.args[0]
 				self.links[self.id] = []
 				if self.in_conflict_div:
 					self.write_conflict_footer()
 				self.write_conflict_header()
+				if self.api_conflicts != None:
+					self.api_conflicts.append(api.conflict_data(self.id, self.group,
+							self.subgroup, self.bclause_id, self.bclause_name,
+							self.get_referenced_by(self.id)))
 				return
 
-			m = re.match(r'^(\((?P<subid>[a-m])\) )?PRE: (?P<links>.*)$', line)
-			if m:
+			if kind == lexer.PRE:
 				assert(not self.in_conflict)
 				self.in_conflict = True
 				self.text = []
-				self.subid = m.group('subid')
-				if not self.subid:
-					self.subid = ''
+				self.text_info = []
+				(self.subid, links) = token.args
 				self.links[self.id].append(self.subid)
+				if self.api_conflicts != None:
+					self.api_conflicts[-1]['subconflicts'].append(
+							api.subconflict_data(self.subid, links,
+							self.get_referenced_by(self.id + self.subid)))
 
-				links = m.group('links')
 				hlinks = self.parse_links(links)
 				self.write_conflict_subheader(self.subid, hlinks)
 				return
 
-			m = re.match(r'^POST: (?P<links>.*)$', line)
-			if m:
+			if kind == lexer.POST:
 				assert(self.in_conflict)
 				self.in_conflict = False
-				links = m.group('links')
-				hlinks = self.parse_links(links)
+				hlinks = self.parse_links(token.args[0])
 				self.write_conflict_body(hlinks)
+				if self.view_texts != None:
+					self.view_texts.append((self.id + self.subid, self.docs[-1][1],
+							transform.determiners(self.text, self.text_info)))
+				if self.api_conflicts != None:
+					sub = self.api_conflicts[-1]['subconflicts'][-1]
+					sub['text'] = self.docs[-1][1]
+					sub['links'] = api.text_links_data(sub['text'])
+					sub['post'] = api.links_data(token.args[0])
 				self.subid = ''
 				return
 
 			if not self.in_conflict:
-				print line
+				print(line)
 				assert(self.in_conflict)
 			self.text.append(line)
+			self.text_info.append(a_info)
 
 	def write_html_header(self):
 		self.outfile.write('<!DOCTYPE html>\n')
@@ -462,10 +427,20 @@ class Parser():
 		self.write_navbar()
 
 		self.outfile.write('<div class="container">\n')
+		if self.search_file:
+			self.outfile.write('<div class="search-results" id="search-results"></div>\n')
 		self.outfile.write('<div class="frontmatter">\n')
 
 	def write_html_footer(self):
 		self.outfile.write('</div>\n')
+		# The conflict ids, for random.js.
+		self.outfile.write('<script>var plottoConflicts = {0};</script>\n'.format(
+				json.dumps(list(self.links), separators=(',', ':'))))
+		if self.views_file:
+			self.outfile.write('<script>var plottoViews = "{0}";</script>\n'.format(
+					os.path.basename(self.views_file)))
+		if self.service_worker:
+			self.outfile.write('<script>if ("serviceWorker" in navigator) {{ navigator.serviceWorker.register("{0}"); }}</script>\n'.format(self.service_worker))
 		if self.enable_bootstrap:
 			self.outfile.write('<script src="https://ajax.googleapis.com/ajax/libs/jquery/1.11.3/jquery.min.js"></script>\n')
 			self.outfile.write('<script src="https://maxcdn.bootstrapcdn.com/bootstrap/3.3.6/js/bootstrap.min.js" integrity="sha384-0mSbJDEHialfmuBBQP6A4Qrprq5OVfW37PRR3j5ELqxss1yVqOtnepnHVP9aJ7xS" crossorigin="anonymous"></script>\n')
@@ -480,12 +455,17 @@ class Parser():
 		self.outfile.write('\t\t</div>\n')
 
 		self.outfile.write('\t\t<div class="collapse navbar-collapse" id="navbar-right">\n')
+		if self.search_file:
+			self.outfile.write('\t\t<form class="navbar-form navbar-left" role="search" id="search-form" data-index="{0}">\n'.format(os.path.basename(self.search_file)))
+			self.outfile.write('\t\t\t<input type="search" class="form-control" id="search-input" placeholder="Search" autocomplete="off" />\n')
+			self.outfile.write('\t\t</form>\n')
 		self.outfile.write('\t\t<ul class="nav navbar-nav navbar-right">\n')
+		self.outfile.write('\t\t<li><a href="?random">Random</a></li>\n')
 		self.outfile.write('\t\t<li class="dropdown">\n')
 		self.outfile.write('\t\t\t<a href="#" class="dropdown-toggle" data-toggle="dropdown" role="button" aria-haspopup="true" aria-expanded="false">AB <span class="caret"></span></a>\n')
 		self.outfile.write('\t\t\t<ul class="dropdown-menu">\n')
-		self.outfile.write('\t\t\t\t<li><a href="plotto-mf.html">A=male, B=female</a></li>\n')
-		self.outfile.write('\t\t\t\t<li><a href="plotto-fm.html">A=female, B=male</a></li>\n')
+		for (page, title) in variant_pages:
+			self.outfile.write('\t\t\t\t<li><a href="{0}">{1}</a></li>\n'.format(page, title))
 		self.outfile.write('\t\t\t</ul>\n')
 		self.outfile.write('\t\t</li>\n')
 		self.outfile.write('\t\t</ul>\n')
@@ -508,6 +488,7 @@ class Parser():
 		self.outfile.write('\n<div class="conflict" id="{0}">\n'.format(self.id))
 		self.in_conflict_div = True
 		self.outfile.write('\n<div class="conflictid">{0}</div>\n'.format(self.id))
+		self.write_referenced_by(self.id)
 
 	def write_conflict_footer(self):
 		self.outfile.write('\n</div>\n')
@@ -518,10 +499,26 @@ class Parser():
 		if subid != '':
 			prefix = '<span class="subid">' + subid + '</span> '
 		self.outfile.write('\n<div class="prelinks">{0}{1}</div>\n'.format(prefix, links))
+		if subid != '':
+			self.write_referenced_by(self.id + subid)
+
+	def get_referenced_by(self, name):
+		if self.referenced_by == None:
+			return []
+		return self.referenced_by.get(name, [])
+
+	# Write the sources of the links to |name|. The ids are expanded into
+	# links by refby.js.
+	def write_referenced_by(self, name):
+		if self.referenced_by == None or not name in self.referenced_by:
+			return
+		self.outfile.write('<div class="refby" data-refby="{0}"></div>\n'.format(
+				' '.join(self.referenced_by[name])))
 
 	def write_conflict_body(self, links):
 		self.outfile.write('<div class="desc">')
 		text = ' '.join([x.strip() for x in self.text])
+		self.docs.append((self.id + self.subid, text))
 		new_text = ''
 		done = False
 		while not done:
@@ -554,109 +551,184 @@ class Parser():
 			text += self.add_tags(m.group(3))
 		return text
 
-	# Preprocess the word, swapping gendered terms.
-	def preprocess_word(self, word):
-		if word == '':
-			return word
-
-		char = word.split('-')
-		if len(char) == 2:
-			(pre, post) = char
-			if post == 'A' or post == 'B':
-				if pre in self.swapCharList:
-					return '%s-%s' % (self.swapCharList[pre], post)
-		
-		if word == 'U' and self.u_info:
-			return word
+	def process(self, src, dst):
+		self.render(read_source(src), dst)
+
+	# Render the (already parsed) |source| into the output file.
+	# If a |manifest| is given, then the rendered blocks from the previous
+	# build are reused for all the conflicts that haven't changed, and the
+	# search index, views and API are only written if a block changed.
+	def render(self, source, dst, manifest=None):
+		self.outfile = output.OutputBuffer()
+		self.block_fps = []
+		self.write_html_header()
+		for (start, end) in incremental.split_blocks(source):
+			self.render_block(source, start, end, manifest)
+		if self.in_conflict_div:
+			self.write_conflict_footer()
+		self.write_html_footer()
 
-		if word in ['BR', 'SR', 'SN', 'D', 'U', 'AU', 'NC', 'NW']:
-			return self.swapCharList[word]
-		
-		cap = False
-		wordLower = word
-		if word[0].isupper():
-			cap = True
-			wordLower = word[0].lower() + word[1:]
-
-		if wordLower == 'her':
-			wordNew = 'his'
-			if self.her_info != None:
-				if len(self.her_info) == 0:
-					print self.page, self.id, 'missing her info'
-				type = self.her_info.pop(0)
-				if type == 'obj':
-					wordNew = 'him'
-				elif type == 'poss':
-					wordNew = 'his'
-				else:
-					assert False
-			if cap:
-				wordNew = wordNew[0].upper() + wordNew[1:]
-			return wordNew
-
-		if wordLower == 'husband' and self.husband_info:
-			return 'husband'
-		if wordLower == 'mistress' and self.mistress_info:
-			return 'master'
-
-		if wordLower in self.replaceList:
-			wordNew = self.replaceList[wordLower]
-			if cap:
-				wordNew = wordNew[0].upper() + wordNew[1:]
-			return wordNew
-		return word
-
-	def preprocess_line(self, line):
-		if line[0:2] == '--':
-			return line
-		# Preprocess "ladies'" so we can convert to "gentlemen's".
-		line = line.replace("ladies'", "ladies_poss");
-		# Note: — is emdash
-		words = re.split('([ .,:;—\'"\(\)\[\]\{\}])', line)
-		for w in words:
-			#if self.id == '1289':
-			#	print self.subid, w
-			self.add_to_dict(w, line)
-		line2 = ''.join([self.preprocess_word(w) for w in words])
-		return line2
+		try:
+			if self.shard:
+				shard.write(self.outfile.getvalue(), dst, self.compress)
+			else:
+				output.write_if_changed(dst, self.outfile.getvalue(), self.compress)
+		except (IOError, OSError) as e:
+			error('Unable to open "%s" for writing: %s' % (dst, e))
 
-	def process(self, src, dst):
-		if not os.path.isfile(src):
-			error('File "%s" doesn\'t exist' % src)
+		blocks = None
+		if manifest != None:
+			blocks = incremental.blocks_key(self.block_fps)
+		if self.search_file:
+			self.write_output('search', self.search_file, self.search_file,
+					self.write_search_index, manifest, blocks)
+		if self.views_file:
+			self.write_output('views', self.views_file, self.views_file,
+					self.write_views, manifest, blocks)
+		if self.api_dir:
+			self.write_output('api', self.api_dir, os.path.join(self.api_dir, api.MANIFEST),
+					self.write_api, manifest, blocks)
+
+	# Write the output |name| into |dst| with |write|, unless the previous
+	# build wrote it from the same |blocks| (see incremental.blocks_key()) and
+	# the file |check| is still there.
+	def write_output(self, name, dst, check, write, manifest, blocks):
+		if manifest != None:
+			manifest.put_output(name, blocks)
+			if manifest.has_output(name, blocks) and os.path.exists(check):
+				return
+		write(dst)
 
+	def write_search_index(self, dst):
+		index = search.build(self.docs, **self.search_options)
 		try:
-			infile = open(src, 'r')
+			output.write_if_changed(dst, index.to_json(), self.compress)
 		except IOError as e:
-			error('Unable to open "%s" for reading: %s' % (src, e))
+			error('Unable to open "%s" for writing: %s' % (dst, e))
 
+	def write_views(self, dst):
+		texts = {}
+		for (name, text, determiners) in self.view_texts:
+			texts[name] = (text, determiners)
 		try:
-			outfile = open(dst, 'w')
+			output.write_if_changed(dst, transform.build_views(self.view_links, texts, self.links),
+					self.compress)
 		except IOError as e:
 			error('Unable to open "%s" for writing: %s' % (dst, e))
 
-		self.outfile = outfile
-		self.write_html_header()
-		for line in infile:
-			line = line.strip()
-			if self.A == 'f' and self.B == 'm':
-				line = self.preprocess_line(line)
-			self.process_line(line)
-		if self.in_conflict_div:
-			self.write_conflict_footer()
-		self.write_html_footer()
+	def write_api(self, dir):
+		try:
+			api.write(self.api_conflicts, dir, self.compress)
+		except (IOError, OSError) as e:
+			error('Unable to write the API to "%s": %s' % (dir, e))
+
+	def render_block(self, source, start, end, manifest):
+		# The changes that the casting makes to the block. Blocks without any
+		# have the same fingerprint in all the variants.
+		changes = ()
+		if self.casting != None:
+			changes = self.casting.changes(start, end)
+		shared = self.shared_blocks if len(changes) == 0 else None
+		if manifest != None or shared != None:
+			fp = incremental.fingerprint(source, start, end, self.get_state(),
+					(self.block_references(source, start), changes))
+			cached = None
+			if manifest != None:
+				self.block_fps.append(fp)
+				cached = manifest.get(fp)
+			if cached == None and shared != None:
+				cached = shared.get(fp)
+				if cached != None and manifest != None:
+					manifest.put(fp, cached)
+			if cached != None:
+				(fragment, state, subids, docs, conflicts, views) = cached
+				self.outfile.write(fragment)
+				self.set_state(state)
+				if subids != None:
+					self.links[self.id] = list(subids)
+				self.docs.extend(docs)
+				if self.api_conflicts != None:
+					self.api_conflicts.extend(conflicts)
+				if self.view_links != None:
+					self.view_links.extend(views[0])
+					self.view_texts.extend(views[1])
+				return
 
-		outfile.close()
-		infile.close()
+		mark = self.outfile.mark()
+		docs_mark = len(self.docs)
+		if self.api_conflicts != None:
+			api_mark = len(self.api_conflicts)
+		if self.view_links != None:
+			views_mark = (len(self.view_links), len(self.view_texts))
+		changes = dict(changes)
+		for (i, token) in enumerate(source.tokens(start, end), start):
+			line = token.line.strip()
+			if self.dict != None:
+				self.add_line_to_dict(line)
+			if i in changes:
+				line = casting.apply(line, changes[i])
+			if line != token.line:
+				token = lexer.tokenize(line)
+			self.process_token(token)
+
+		if manifest != None or shared != None:
+			subids = None
+			if self.id in self.links:
+				subids = tuple(self.links[self.id])
+			conflicts = ()
+			if self.api_conflicts != None:
+				conflicts = tuple(self.api_conflicts[api_mark:])
+			views = ((), ())
+			if self.view_links != None:
+				views = (tuple(self.view_links[views_mark[0]:]),
+						tuple(self.view_texts[views_mark[1]:]))
+			result = (self.outfile.since(mark), self.get_state(), subids,
+					tuple(self.docs[docs_mark:]), conflicts, views)
+			if manifest != None:
+				manifest.put(fp, result)
+			if shared != None:
+				shared[fp] = result
+
+	# Return the links to the conflict that starts the block at line |start|
+	# (and to its subconflicts), since they are written in the block.
+	def block_references(self, source, start):
+		if self.referenced_by == None:
+			return None
+		token = source.token(start)
+		if token.kind != lexer.CONFLICT:
+			return None
+		c = source.conflict(token.args[0])
+		names = [c.id] + [c.id + s.subid for s in c.subconflicts if s.subid != '']
+		return tuple([(name, tuple(self.get_referenced_by(name))) for name in names])
+
+	# Return a snapshot of the parser state that affects the rendered output.
+	# Lists are stored as tuples so that the state can be hashed.
+	def get_state(self):
+		state = []
+		for name in STATE_FIELDS:
+			value = getattr(self, name)
+			if isinstance(value, list):
+				value = tuple(value)
+			state.append(value)
+		return tuple(state)
+
+	def set_state(self, state):
+		for (name, value) in zip(STATE_FIELDS, state):
+			if isinstance(value, tuple):
+				value = list(value)
+			setattr(self, name, value)
+
+	def add_line_to_dict(self, line):
+		if line[0:2] == '--':
+			return
+		for w in genderswap.split_words(line):
+			self.add_to_dict(w, line)
 
 	def add_to_dict(self, word, line):
-		if re.match(r'^Conflict?{\d+}$', word):
-			return
-		if re.match(r'^[@B]{\d+}$', word):
-			return
-		if re.match(r'^\(?[-\d]+[abcde]?\)?$', word):
+		if re_dict_skip.match(word):
 			return
 		# Print entire line for word.
-		# Useful for tracking down short typo words.
+		# Useful for tracking down short typo words (see also typos.py).
 		#if word == 'hom':
 		#	print self.id, line
 
@@ -667,26 +739,32 @@ class Parser():
 	def write_dict(self):
 		dst = 'dict.txt'
 		try:
-			outfile = open(dst, 'w')
+			outfile = open(dst, 'w', encoding='utf-8')
 		except IOError as e:
 			error('Unable to open "%s" for writing: %s' % (dst, e))
 
-		for word in sorted(self.dict, key=self.dict.get, reverse=True):
+		# Most frequent first (and then alphabetically).
+		for word in sorted(self.dict, key=lambda w: (-self.dict[w], w)):
 			outfile.write('%d %s\n' % (self.dict[word], word))
 
 		outfile.close()
 
 def usage():
-	print 'Usage: %s <options>' % sys.argv[0]
-	print 'where <options> are:'
-	print '  --config <config-file-name>'
-	print '  --dict'  # write word frequency dict
-	print '  --verbose'  # verbose debug output
+	print('Usage: %s <options>' % sys.argv[0])
+	print('where <options> are:')
+	print('  --compress')  # also write compressed copies (.gz, .br) of the output files
+	print('  --config <config-file-name>')
+	print('  --dict')  # write word frequency dict
+	print('  --full')  # rebuild everything (ignore results from previous build)
+	print('  --profile')  # report where the time goes
+	print('  --profile-output <file>')  # also save the cProfile stats (for pstats)
+	print('  --shard')  # write an index page and load the conflicts on demand
+	print('  --verbose')  # verbose debug output
 	
 def load_config(file):
 	config = {}
 	try:
-		config_file = open(file, 'r')
+		config_file = open(file, 'r', encoding='utf-8')
 	except IOError as e:
 		error('Unable to open config file "%s": %s' % (file, e))
 	
@@ -707,55 +785,277 @@ def load_config(file):
 	config_file.close()
 	return config
 
+# Load the parsed Plotto text.
+# The result is shared by all variants, so it only needs to be read once.
+def read_source(src):
+	if not os.path.isfile(src):
+		error('File "%s" doesn\'t exist' % src)
+
+	try:
+		return corpus.load(src)
+	except IOError as e:
+		error('Unable to open "%s" for reading: %s' % (src, e))
+
+# Index of the links between conflicts (see linkgraph.py).
+link_graph_file = '../plotto-links.bin'
+
+# Config files for all the variants of Plotto.
+config_files = [
+	'config-mf.txt',
+	'config-fm.txt',
+	'config-neutral.txt',
+	]
+
+# Pages of the variants (and their titles) for the navbar.
+variant_pages = [
+	('plotto-mf.html', 'A=male, B=female'),
+	('plotto-fm.html', 'A=female, B=male'),
+	('plotto-neutral.html', 'Gender-neutral'),
+	]
+
+# Config options that only differ between the variants.
+variant_options = ['output_file', 'casting']
+
+# Rendered blocks that are the same in all the variants (by source and code
+# key), so that the variants that are built by the same process only render
+# them once.
+shared_blocks = {}
+
+# Service worker that caches the pages for offline use (see offline.py).
+service_worker_file = '../sw.js'
+
+# Save the index of all the links between conflicts alongside the output.
+def write_link_graph(graph, dst):
+	try:
+		output.write_if_changed(dst, linkgraph.dumps(graph))
+	except IOError as e:
+		error('Unable to open "%s" for writing: %s' % (dst, e))
+
+# Write the service worker |dst| for the variants in |configs| that have
+# service_worker set.
+def write_service_worker(configs, dst):
+	root = os.path.dirname(os.path.abspath(dst))
+	shell = []
+	runtime = []
+	for config in configs:
+		if config.get('service_worker'):
+			(js_files, css_files) = page_files(config)
+			(config_shell, config_runtime) = offline.assets(config, root, js_files, css_files)
+			shell.extend(config_shell)
+			runtime.extend(config_runtime)
+	try:
+		offline.write(shell, runtime, dst)
+	except IOError as e:
+		error('Unable to open "%s" for writing: %s' % (dst, e))
+
+def default_config():
+	config = {}
+	config['output_file'] = '../plotto.html'
+	config['casting'] = 'mf'
+	config['javascript'] = 'random.js'
+	config['css'] = 'plotto.css'
+	config['include_bootstrap'] = True
+	return config
+
+# Return the casting table (see casting.py) for |config|.
+def load_casting_table(config):
+	name = config.get('casting', 'mf')
+	try:
+		return casting.load_table(name)
+	except IOError as e:
+		error('Unable to open casting table "%s": %s' % (name, e))
+	except ValueError as e:
+		error('Invalid casting table "%s": %s' % (name, e))
+
+# Return the index of the words in |source| that are replaced by the castings
+# of any of the |configs|. Building the variants with the same index means
+# that the corpus is only searched once.
+def casting_index(source, configs):
+	return casting.index(source, [load_casting_table(c) for c in configs])
+
+# Return the (js, css) files that are included in the pages for |config|.
+def page_files(config):
+	js_files = config['javascript']
+	if isinstance(js_files, str):
+		js_files = [js_files]
+	css_files = config['css']
+	if isinstance(css_files, str):
+		css_files = [css_files]
+	js_files = list(js_files)
+	if config.get('shard'):
+		js_files.append('shard.js')
+	if config.get('search'):
+		js_files.append('search.js')
+	if config.get('views'):
+		js_files.append('views.js')
+	if config.get('referenced_by'):
+		js_files.append('refby.js')
+	return (js_files, list(css_files))
+
+# Build a single variant of Plotto (as described by |config|) from the
+# parsed |source|. Returns the parser so that callers can access the results.
+# If |incremental_build| is set, only the conflicts that changed since the last
+# build are rendered again. If |collect_dict| is set, the word frequency dict
+# is collected as well. |index| is the casting index shared by the variants
+# (see casting_index()) and |graph| is the link graph for |source|, if the
+# caller already has them.
+def build_variant(config, source, incremental_build=True, collect_dict=False, index=None,
+		graph=None):
+	table = load_casting_table(config)
+	if index == None:
+		index = casting.index(source, [table])
+
+	print('Building', config['output_file'], '...')
+
+	# The blocks only depend on the options that the variants have in common
+	# (and on the changes made by the casting, see render_block()).
+	key = incremental.code_key([__file__, lexer.__file__, genderswap.__file__, links.__file__,
+			api.__file__, transform.__file__, casting.__file__, search.__file__],
+			dict([(k, v) for (k, v) in config.items() if not k in variant_options]))
+
+	manifest = None
+	if incremental_build:
+		name = 'build-' + os.path.basename(config['output_file'])
+		manifest = incremental.Manifest(incremental.manifest_path(source.path, name), key)
+		manifest.load()
+
+	parser = Parser()
+	parser.setCasting(casting.Casting(table, index))
+	if not collect_dict:
+		if not (source.hash, key) in shared_blocks:
+			# Only keep the blocks for the latest source.
+			shared_blocks.clear()
+			shared_blocks[(source.hash, key)] = {}
+		parser.shared_blocks = shared_blocks[(source.hash, key)]
+	if collect_dict:
+		parser.dict = {}
+	(js_files, css_files) = page_files(config)
+	parser.setJavascript(js_files)
+	parser.setCss(css_files)
+	parser.enableBootstrap(config['include_bootstrap'])
+	parser.compress = config.get('compress', False)
+	if config.get('shard'):
+		parser.shard = True
+	if config.get('search'):
+		parser.search_file = os.path.splitext(config['output_file'])[0] + '-search.json'
+		parser.search_options = {
+			'stemming': config.get('search_stemming', True),
+			'stop_words': config.get('search_stop_words', True),
+		}
+	if config.get('views'):
+		parser.views_file = os.path.splitext(config['output_file'])[0] + '-views.json'
+		parser.view_links = []
+		parser.view_texts = []
+	if config.get('referenced_by'):
+		if graph == None:
+			graph = linkgraph.cached(source)
+		parser.referenced_by = graph.referenced_by()
+	if config.get('service_worker'):
+		parser.service_worker = os.path.relpath(os.path.abspath(service_worker_file),
+				os.path.dirname(os.path.abspath(config['output_file']))).replace(os.sep, '/')
+	if config.get('api'):
+		parser.api_conflicts = []
+		parser.api_dir = api.api_dir(config['output_file'])
+	parser.render(source, config['output_file'], manifest)
+
+	if manifest != None:
+		manifest.save()
+	return parser
+
+# Record the time spent in each phase of the build with |profiler|.
+def profile_phases(profiler):
+	profiler.wrap(corpus, 'load', 'read')
+	profiler.wrap(Parser, 'render', 'render')
+	profiler.wrap(casting, 'index', 'casting index')
+	profiler.wrap(casting.Casting, 'changes', 'casting')
+	profiler.wrap(Parser, 'process_token', 'process lines',
+			lambda parser, token: profiling.token_key(token))
+	profiler.wrap(Parser, 'write_conflict_body', 'conflict bodies')
+	profiler.wrap(Parser, 'write_search_index', 'search index')
+	profiler.wrap(Parser, 'write_views', 'views')
+	profiler.wrap(Parser, 'write_api', 'api')
+	profiler.wrap(output, 'write_if_changed', 'write')
+	profiler.wrap(sys.modules[__name__], 'write_link_graph', 'link graph')
+
 def main():
 	try:
 		opts, args = getopt.getopt(sys.argv[1:],
-			'c:dv',
-			['config=', 'dict', 'verbose'])
+			'c:dfpsv',
+			['compress', 'config=', 'dict', 'full', 'profile', 'profile-output=', 'shard', 'verbose'])
 	except getopt.GetoptError:
 		usage()
 		exit()
 
 	config_file = None
+	compress = False
 	write_dict = False
+	full_build = False
+	shard_output = False
 	verbose = False
+	profile = False
+	profile_output = None
 	
 	for opt, arg in opts:
 		if opt in ('-c', '--config'):
 			config_file = arg
+		elif opt == '--compress':
+			compress = True
 		elif opt in ('-d', '--dict'):
 			write_dict = True
+		elif opt in ('-f', '--full'):
+			full_build = True
+		elif opt in ('-p', '--profile'):
+			profile = True
+		elif opt == '--profile-output':
+			profile = True
+			profile_output = arg
+		elif opt in ('-s', '--shard'):
+			shard_output = True
 		elif opt in ('-v', '--verbose'):
 			verbose = True
 
+	profiler = None
+	if profile:
+		profiler = profiling.Profiler(profile_output)
+		profile_phases(profiler)
+		profiler.start()
+
 	if config_file:
 		config = load_config(config_file)
 	else:
-		# Default configuration
-		config = {}
-		config['output_file'] = '../plotto.html'
-		config['gender_swap'] = False
-		config['javascript'] = 'random.js'
-		config['css'] = 'plotto.css'
-		config['include_bootstrap'] = True
+		config = default_config()
+	if shard_output:
+		config['shard'] = True
+	if compress:
+		config['compress'] = True
 	#print config
-		
+
 	# The raw input file (with the Plotto text).
 	infilename = '../plotto.txt'
-	gender = 'mf'
-	if config['gender_swap']:
-		gender = 'fm'
-
-	print 'Building', config['output_file'], '...'
-	
-	parser = Parser()
-	parser.setAB(gender)
-	parser.setJavascript(config['javascript'])
-	parser.setCss(config['css'])
-	parser.enableBootstrap(config['include_bootstrap'])
-	parser.process(infilename, config['output_file'])
+	source = read_source(infilename)
+
+	# The word frequency dict is only collected for blocks that are
+	# rendered, so writing it requires a full build.
+	incremental_build = not (full_build or write_dict)
+
+	site_configs = [load_config(c) for c in config_files]
+	if shard_output:
+		for c in site_configs:
+			c['shard'] = True
+
+	# Use the same casting index as the other variants, so that the cached
+	# index can be shared.
+	index = casting_index(source, [config] + site_configs)
+	graph = linkgraph.cached(source)
+	parser = build_variant(config, source, incremental_build, write_dict, index, graph)
+	write_link_graph(graph, link_graph_file)
+	write_service_worker(site_configs, service_worker_file)
 	if write_dict:
 		parser.write_dict()
-	
+
+	if profiler != None:
+		profiler.stop()
+		profiler.report()
+
 if __name__ == '__main__':
 	main()
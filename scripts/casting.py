@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Casting of the variants of Plotto.
+#
+# The text is written with A male and B female. Each variant of Plotto is
+# described by a casting table, which maps the gendered terms and character
+# abbreviations to their replacements:
+#   mf      the text as written (an empty table)
+#   fm      A female, B male (the terms in genderswap.py)
+#   <name>  the table in casting-<name>.txt (see load_table())
+#
+# The words that any of the tables replace are found once for the whole
+# corpus (see Index), along with the annotations (HER, U, HUSBAND, MISTRESS)
+# that decide which replacement to use. Each variant then only looks up its
+# replacements for the lines that have such words (see Casting.changes()).
+# A block of the source that has no words that a table replaces is rendered
+# the same as in every other variant, so build.py shares those blocks between
+# the variants.
+
+import hashlib
+import marshal
+import os
+import os.path
+import re
+
+import corpus
+import genderswap
+import lexer
+
+# Words whose replacement depends on an annotation in the source, mapped to
+# the annotation (the comment on the line before) and to a function that
+# returns the sense of the word (or None for the default sense) given the
+# value of the annotation.
+# The HER annotation has a sense for each 'her' on the line: "-- HER obj poss".
+ANNOTATED = {
+	'her': ('HER', None),
+	'U': ('U', lambda value: 'abbrev'),
+	'husband': ('HUSBAND', lambda value: 'verb' if value == 'verb' else None),
+	'mistress': ('MISTRESS', lambda value: 'master' if value == 'master' else None),
+}
+
+# Sense of 'her' when there is no annotation.
+HER_DEFAULT = 'poss'
+
+# Directory with the casting-<name>.txt files.
+TABLE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class Table(object):
+	"""A casting table: the replacement for each word.
+
+	Words in lowercase (like 'he') also replace their capitalized form, and
+	the replacement is capitalized to match. Other words (the character
+	abbreviations like 'BR' or 'F-A') are replaced exactly as given.
+	Annotated words are given with their sense: 'her:obj', 'U:abbrev',
+	'husband:verb' (see ANNOTATED).
+	"""
+
+	def __init__(self, name, replace):
+		self.name = name
+		self.replace = replace
+
+	# Return the forms of the words that appear in the text.
+	def words(self):
+		result = set()
+		for key in self.replace:
+			word = key.split(':')[0]
+			result.add(word)
+			if word[0].islower():
+				result.add(genderswap.capitalize(word))
+		return result
+
+	# Return the replacement for |word| (as it appears in the text) with the
+	# given |key| (the word, or its lowercase form, plus the sense), or None
+	# if it isn't replaced.
+	def lookup(self, word, key):
+		new_word = self.replace.get(key)
+		if new_word == None or new_word == word:
+			return None
+		if key[0].islower():
+			new_word = genderswap.capitalize_as(word, new_word)
+			if new_word == word:
+				return None
+		return new_word
+
+# Return the table for the A=female, B=male variant.
+def swap_table():
+	replace = {}
+	for (word, new_word) in genderswap.swap_terms().items():
+		replace[word] = new_word
+	for (word, name) in genderswap.POSSESSIVES.items():
+		replace[word] = replace.pop(name)
+	chars = genderswap.swap_chars()
+	for word in genderswap.SWAP_CHARS_ALONE:
+		replace[word] = chars[word]
+	for (char, new_char) in chars.items():
+		for role in ['A', 'B']:
+			replace['%s-%s' % (char, role)] = '%s-%s' % (new_char, role)
+	replace['her:obj'] = 'him'
+	replace['her:poss'] = 'his'
+	replace['mistress:master'] = 'master'
+	return Table('fm', replace)
+
+# Return the casting table called |name|.
+# Raises IOError if there is no such table and ValueError if the table file
+# can't be parsed.
+def load_table(name):
+	if name == 'mf':
+		return Table(name, {})
+	if name == 'fm':
+		return swap_table()
+	return read_table(name, os.path.join(TABLE_DIR, 'casting-%s.txt' % name))
+
+# Read the table |name| from the file |path|. Each line is
+#   <word> = <replacement>
+# Blank lines and lines starting with '#' are ignored.
+def read_table(name, path):
+	replace = {}
+	with open(path, 'r', encoding='utf-8') as f:
+		for (n, line) in enumerate(f, 1):
+			line = line.strip()
+			if line == '' or line[0] == '#':
+				continue
+			parts = [p.strip() for p in line.split('=', 1)]
+			if len(parts) != 2 or parts[0] == '' or parts[1] == '':
+				raise ValueError('%s:%d: expected "<word> = <replacement>"' % (path, n))
+			(word, new_word) = parts
+			if word in replace:
+				raise ValueError('%s:%d: duplicate word "%s"' % (path, n, word))
+			base = word.split(':')[0]
+			if base != word and not base in ANNOTATED:
+				raise ValueError('%s:%d: "%s" doesn\'t have an annotation' % (path, n, base))
+			replace[word] = new_word
+	return Table(name, replace)
+
+class Index(object):
+	"""The words in the corpus that can be replaced by the casting tables.
+
+	For each line (by index) that has any of the words, there is a tuple of
+	(start, end, word, key) for each word, where the positions are in the
+	stripped line and the key is the word (in lowercase if it has a lowercase
+	form in the tables) plus the sense of annotated words ('her:obj').
+	If |lines| is given (from the cache), then |source| isn't searched.
+	"""
+
+	def __init__(self, source, words, lines=None):
+		self.words = frozenset(words)
+		self.lines = {}
+		if lines != None:
+			self.lines = lines
+			return
+		if len(self.words) == 0:
+			return
+
+		# Map from each form of a word to its key (without the sense).
+		keys = {}
+		for word in self.words:
+			keys[word] = word
+		for word in self.words:
+			lower = word[0].lower() + word[1:]
+			if lower != word and lower in self.words:
+				keys[word] = lower
+
+		delimiters = genderswap.DELIMITERS
+		before = re.escape(''.join([c for c in delimiters if not c in genderswap.NO_SWAP_AFTER]))
+		after = re.escape(delimiters)
+		re_word = re.compile('(?<![^%s])%s(?![^%s])' % (
+				before, genderswap.trie_pattern(self.words), after))
+
+		comment = corpus.KIND_INDEX[lexer.COMMENT]
+		for i in range(len(source)):
+			line = source.lines[i].strip()
+			if line[0:2] == '--':
+				continue
+			matches = list(re_word.finditer(line))
+			if len(matches) == 0:
+				continue
+
+			# The annotation (if any) is on the line before.
+			annotation = None
+			if i > 0 and source.kinds[i-1] == comment:
+				annotation = source.args[i-1]
+			her_info = None
+			if annotation != None and annotation[0] == 'HER':
+				her_info = annotation[1].split()
+
+			result = []
+			for m in matches:
+				key = keys[m.group(0)]
+				if key == 'her':
+					sense = HER_DEFAULT
+					if her_info != None:
+						sense = her_info.pop(0) if len(her_info) != 0 else None
+					if sense != None:
+						key += ':' + sense
+				elif key in ANNOTATED:
+					(directive, get_sense) = ANNOTATED[key]
+					if annotation != None and annotation[0] == directive:
+						sense = get_sense(annotation[1])
+						if sense != None:
+							key += ':' + sense
+				result.append((m.start(), m.end(), m.group(0), key))
+			self.lines[i] = tuple(result)
+
+# Name of the cached index (in the corpus cache directory).
+CACHE_FILE = 'casting.bin'
+
+# Return the key for the cached index of the |words| in |source|.
+def cache_key(source, words):
+	h = hashlib.sha1(source.hash.encode('ascii'))
+	for f in [__file__, genderswap.__file__]:
+		with open(os.path.splitext(f)[0] + '.py', 'rb') as infile:
+			h.update(infile.read())
+	h.update('\n'.join(sorted(words)).encode('utf-8'))
+	return h.hexdigest()
+
+def read_index(path, key, words):
+	if not os.path.isfile(path):
+		return None
+	try:
+		with open(path, 'rb') as f:
+			(cached_key, lines) = marshal.loads(f.read())
+	except (IOError, EOFError, ValueError, TypeError):
+		return None
+	if cached_key != key:
+		return None
+	return Index(None, words, lines)
+
+def write_index(path, key, index):
+	try:
+		dir = os.path.dirname(path)
+		if not os.path.isdir(dir):
+			os.makedirs(dir)
+		tmp = path + '.tmp'
+		with open(tmp, 'wb') as f:
+			marshal.dump((key, index.lines), f)
+		os.rename(tmp, path)
+	except (IOError, OSError):
+		# The cache is only an optimization.
+		pass
+
+_indexes = {}
+
+# Return the (shared) index of the words in |source| that are replaced by
+# any of the |tables|. The index is cached (next to the corpus cache), so it
+# is only built again when the source or the tables change.
+def index(source, tables):
+	words = set()
+	for table in tables:
+		words |= table.words()
+	key = (source.hash, frozenset(words))
+	result = _indexes.get(key)
+	if result != None:
+		return result
+
+	path = None
+	if source.path != None:
+		path = os.path.join(os.path.dirname(os.path.abspath(source.path)), corpus.CACHE_DIR,
+				CACHE_FILE)
+		cached_key = cache_key(source, words)
+		result = read_index(path, cached_key, words)
+	if result == None:
+		result = Index(source, words)
+		if path != None:
+			write_index(path, cached_key, result)
+	_indexes.clear()
+	_indexes[key] = result
+	return result
+
+class Casting(object):
+	"""Applies a casting |table| to the words found by an |index|."""
+
+	def __init__(self, table, index):
+		assert table.words() <= index.words
+		self.table = table
+		self.index = index
+
+	# Return the changes to the lines [start, end) of the source as a tuple of
+	# (line index, ((start, end, replacement), ...)) for each line that
+	# changes. The result is empty if the block is the same in all variants.
+	def changes(self, start, end):
+		result = []
+		lines = self.index.lines
+		lookup = self.table.lookup
+		for i in range(start, end):
+			matches = lines.get(i)
+			if matches == None:
+				continue
+			changes = []
+			for (s, e, word, key) in matches:
+				new_word = lookup(word, key)
+				if new_word != None:
+					changes.append((s, e, new_word))
+			if len(changes) != 0:
+				result.append((i, tuple(changes)))
+		return tuple(result)
+
+# Return |line| (stripped) with the |changes| (as returned by
+# Casting.changes()) applied.
+def apply(line, changes):
+	result = []
+	pos = 0
+	for (start, end, new_word) in changes:
+		result.append(line[pos:start])
+		result.append(new_word)
+		pos = end
+	result.append(line[pos:])
+	return ''.join(result)
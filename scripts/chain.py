@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Masterplot chain generator.
+#
+# Generates chains of conflicts by walking the POST links from one conflict
+# to the next (see linkgraph.py). Each chain is written to stdout as a
+# single line of JSON.
+#
+# Usage: python3 plotto.py chain <options>
+
+import getopt
+import json
+import multiprocessing
+import random
+import sys
+
+import corpus
+import linkgraph
+
+# Number of chains generated by a worker in a single batch.
+BATCH_SIZE = 250
+
+def error(msg):
+	print('Error: %s' % (msg), file=sys.stderr)
+	sys.exit(1)
+
+class ChainGenerator(object):
+	"""Random walks over the POST links between conflicts."""
+
+	def __init__(self, graph, source):
+		self.graph = graph
+		nodes = graph.nodes
+
+		# Successors (POST links) for each node as (target, label) pairs.
+		self.successors = [[] for n in nodes]
+		for n in range(len(nodes)):
+			for e in range(graph.offsets[n], graph.offsets[n+1]):
+				if graph.kinds[e] == linkgraph.POST:
+					self.successors[n].append((graph.targets[e], graph.labels[e]))
+
+		# Subconflicts for each conflict node. A link to a conflict that has
+		# subconflicts is resolved to one of the subconflicts.
+		# Links to undefined conflicts are ignored.
+		self.choices = [[n] if graph.defined[n] else [] for n in range(len(nodes))]
+		for (n, name) in enumerate(nodes):
+			parent = graph.node(linkgraph.conflict_of(name))
+			if parent != n and parent != None and graph.defined[n]:
+				if self.choices[parent] == [parent]:
+					self.choices[parent] = []
+				self.choices[parent].append(n)
+
+		# Group and subgroup for each node.
+		self.groups = [None] * len(nodes)
+		for c in source.conflicts:
+			for name in [c.id] + [c.id + s for s in c.subids() if s != '']:
+				n = graph.node(name)
+				if n != None:
+					self.groups[n] = (c.group.lower(), c.subgroup.lower())
+
+		# Nodes that can be used to start a random chain.
+		self.starts = [n for n in range(len(nodes))
+				if graph.defined[n] and len(self.successors[n]) != 0]
+
+	def in_group(self, n, group):
+		g = self.groups[n]
+		return g != None and (group in g[0] or group in g[1])
+
+	# Generate a single chain using the random number generator |rng|.
+	# Returns a list of (node, label) or None if no chain was found.
+	def walk(self, rng, start, group, max_length, allow_cycles):
+		if start == None:
+			n = rng.choice(self.starts)
+		else:
+			n = rng.choice(self.choices[start])
+		chain = [(n, 0)]
+		visited = set([n])
+		while True:
+			if group != None and len(chain) > 1 and self.in_group(n, group):
+				return chain
+			if len(chain) >= max_length:
+				break
+			candidates = []
+			for (t, label) in self.successors[n]:
+				for choice in self.choices[t]:
+					if allow_cycles or not choice in visited:
+						candidates.append((choice, label))
+			if len(candidates) == 0:
+				break
+			(n, label) = rng.choice(candidates)
+			visited.add(n)
+			chain.append((n, label))
+
+		# A chain with a target group must end in that group.
+		if group != None:
+			return None
+		return chain
+
+	# Generate chain |index| for the given |options|.
+	# Each chain has its own random number generator so that the results
+	# don't depend on how the work is divided between the workers.
+	def generate(self, index, options):
+		rng = random.Random(options['seed'] * 1000003 + index)
+		for i in range(options['tries']):
+			chain = self.walk(rng, options['start'], options['group'],
+					options['max_length'], options['allow_cycles'])
+			if chain != None:
+				return chain
+		return None
+
+	def to_json(self, index, chain):
+		nodes = self.graph.nodes
+		labels = self.graph.label_names
+		steps = []
+		for (n, label) in chain:
+			step = {'id': nodes[n]}
+			if label != 0:
+				step['label'] = labels[label]
+			steps.append(step)
+		return json.dumps({'index': index, 'chain': steps}, sort_keys=True)
+
+# The generator and options shared by all the worker processes.
+generator = None
+generator_options = None
+
+def init_worker(gen, options):
+	global generator, generator_options
+	generator = gen
+	generator_options = options
+
+# Generate the chains in [start, end), returning them as lines of JSON.
+def generate_batch(batch):
+	(start, end) = batch
+	lines = []
+	for i in range(start, end):
+		chain = generator.generate(i, generator_options)
+		if chain != None:
+			lines.append(generator.to_json(i, chain))
+	return lines
+
+def usage():
+	print('Usage: %s chain <options>' % sys.argv[0])
+	print('where <options> are:')
+	print('  --count <n>')  # number of chains to generate (default 1)
+	print('  --seed <n>')  # seed for the random number generator
+	print('  --start <id>')  # conflict to start each chain
+	print('  --group <name>')  # end each chain in this (sub)group
+	print('  --max-length <n>')  # maximum number of conflicts in a chain (default 10)
+	print('  --allow-cycles')  # allow a conflict to appear more than once
+	print('  --tries <n>')  # attempts to find each chain (default 100)
+	print('  --jobs <n>')  # number of worker processes
+
+def main(argv):
+	try:
+		opts, args = getopt.getopt(argv,
+			'n:s:g:l:j:',
+			['count=', 'seed=', 'start=', 'group=', 'max-length=',
+			 'allow-cycles', 'tries=', 'jobs='])
+	except getopt.GetoptError:
+		usage()
+		exit()
+
+	count = 1
+	jobs = multiprocessing.cpu_count()
+	options = {
+		'seed': random.randrange(1 << 30),
+		'start': None,
+		'group': None,
+		'max_length': 10,
+		'allow_cycles': False,
+		'tries': 100,
+	}
+	start = None
+	for opt, arg in opts:
+		if opt in ('-n', '--count'):
+			count = int(arg)
+		elif opt in ('-s', '--seed'):
+			options['seed'] = int(arg)
+		elif opt == '--start':
+			start = arg
+		elif opt in ('-g', '--group'):
+			options['group'] = arg.lower()
+		elif opt in ('-l', '--max-length'):
+			options['max_length'] = int(arg)
+		elif opt == '--allow-cycles':
+			options['allow_cycles'] = True
+		elif opt == '--tries':
+			options['tries'] = int(arg)
+		elif opt in ('-j', '--jobs'):
+			jobs = int(arg)
+
+	source = corpus.load('../plotto.txt')
+	graph = linkgraph.cached(source)
+	gen = ChainGenerator(graph, source)
+
+	if start != None:
+		options['start'] = graph.node(start)
+		if options['start'] == None or not graph.defined[options['start']]:
+			error('Unknown conflict: %s' % start)
+
+	batches = [(i, min(i + BATCH_SIZE, count)) for i in range(0, count, BATCH_SIZE)]
+	pool = None
+	if jobs <= 1 or len(batches) == 1:
+		init_worker(gen, options)
+		results = (generate_batch(b) for b in batches)
+	else:
+		pool = multiprocessing.Pool(jobs, init_worker, (gen, options))
+		results = pool.imap(generate_batch, batches)
+
+	# Stream the results (in order) as each batch completes.
+	for lines in results:
+		for line in lines:
+			sys.stdout.write(line + '\n')
+		sys.stdout.flush()
+
+	if pool != None:
+		pool.close()
+		pool.join()
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Parsed representation of the Plotto source text.
+#
+# The corpus holds the lexed token stream for every line in plotto.txt along
+# with the conflict structure (groups, B-clauses, conflicts and subconflicts)
+# that is built from it. The parsed result is cached in a binary file keyed
+# by the content hash of plotto.txt so that warm runs of the tools can skip
+# the tokenizing pass entirely.
+
+import array
+import glob
+import hashlib
+import marshal
+import os
+import os.path
+
+import lexer
+
+# Bump this whenever the format of the cached data changes.
+CACHE_VERSION = 2
+
+# Name of the cache directory (created next to the source file).
+CACHE_DIR = '.plotto-cache'
+
+# Map from token kind to its (compact) index in the kinds array.
+KIND_INDEX = dict([(k, i) for (i, k) in enumerate(lexer.KINDS)])
+
+class BClause(object):
+	"""A B-clause: B{<id>} <name>"""
+
+	__slots__ = ('id', 'name', 'group', 'subgroup', 'line')
+
+	def __init__(self, id, name, group, subgroup, line):
+		self.id = id
+		self.name = name
+		self.group = group
+		self.subgroup = subgroup
+		# Index of the B{} line in the source.
+		self.line = line
+
+	def pack(self):
+		return (self.id, self.name, self.group, self.subgroup, self.line)
+
+class SubConflict(object):
+	"""A single subconflict (or the entire conflict if there are no subconflicts)."""
+
+	__slots__ = ('subid', 'pre', 'body', 'post', 'line')
+
+	def __init__(self, subid, pre, line):
+		# Subconflict id ('a', 'b', ...) or '' if the conflict has no subconflicts.
+		self.subid = subid
+		# The raw PRE and POST link strings: "(123) (234a ch A to B)"
+		self.pre = pre
+		self.post = ''
+		# Lines of text in the description.
+		self.body = []
+		# Index of the PRE: line in the source.
+		self.line = line
+
+	def pack(self):
+		return (self.subid, self.pre, tuple(self.body), self.post, self.line)
+
+	@staticmethod
+	def unpack(data):
+		(subid, pre, body, post, line) = data
+		s = SubConflict(subid, pre, line)
+		s.body = list(body)
+		s.post = post
+		return s
+
+class Conflict(object):
+	"""A numbered conflict: Conflict{<id>}"""
+
+	__slots__ = ('id', 'group', 'subgroup', 'bclause', 'subconflicts', 'line')
+
+	def __init__(self, id, group, subgroup, bclause, line):
+		self.id = id
+		self.group = group
+		self.subgroup = subgroup
+		# Id of the B-clause that this conflict belongs to.
+		self.bclause = bclause
+		self.subconflicts = []
+		# Index of the Conflict{} line in the source.
+		self.line = line
+
+	def subids(self):
+		return [s.subid for s in self.subconflicts]
+
+	def pack(self):
+		return (self.id, self.group, self.subgroup, self.bclause, self.line,
+				tuple([s.pack() for s in self.subconflicts]))
+
+	@staticmethod
+	def unpack(data):
+		(id, group, subgroup, bclause, line, subconflicts) = data
+		c = Conflict(id, group, subgroup, bclause, line)
+		c.subconflicts = [SubConflict.unpack(s) for s in subconflicts]
+		return c
+
+class Corpus(object):
+	"""Parsed Plotto source text."""
+
+	def __init__(self):
+		# Path and content hash of the source text.
+		self.path = None
+		self.hash = None
+
+		# The token stream, one entry per line of source.
+		self.kinds = array.array('B')
+		self.lines = []
+		self.args = []
+
+		self.bclauses = []
+		self.conflicts = []
+		self.conflict_map = {}
+
+	def __len__(self):
+		return len(self.lines)
+
+	def token(self, index):
+		return lexer.Token(lexer.KINDS[self.kinds[index]], self.lines[index],
+				self.args[index])
+
+	def tokens(self, start=0, end=None):
+		kinds = lexer.KINDS
+		Token = lexer.Token
+		if end == None:
+			end = len(self.lines)
+		for i in range(start, end):
+			yield Token(kinds[self.kinds[i]], self.lines[i], self.args[i])
+
+	def conflict(self, id):
+		return self.conflict_map.get(str(id))
+
+	def add_tokens(self, tokens):
+		for t in tokens:
+			self.kinds.append(KIND_INDEX[t.kind])
+			self.lines.append(t.line)
+			self.args.append(t.args)
+
+	# Build the conflict structure from the token stream.
+	def build_structure(self):
+		in_conflict_section = False
+		group = ''
+		subgroup = ''
+		bclause = ''
+		conflict = None
+		sub = None
+
+		for i in range(len(self.lines)):
+			kind = lexer.KINDS[self.kinds[i]]
+			args = self.args[i]
+
+			if kind == lexer.COMMENT:
+				if args[0] == 'page':
+					if args[1] == '18':
+						in_conflict_section = True
+					elif args[1] == '190':
+						in_conflict_section = False
+						conflict = None
+						sub = None
+				continue
+			if not in_conflict_section:
+				continue
+
+			if kind == lexer.GROUP:
+				group = args[0]
+			elif kind == lexer.SUBGROUP:
+				subgroup = args[0]
+			elif kind == lexer.BCLAUSE:
+				bclause = args[0]
+				self.bclauses.append(BClause(args[0], args[1], group, subgroup, i))
+			elif kind == lexer.CONFLICT:
+				conflict = Conflict(args[0], group, subgroup, bclause, i)
+				self.conflicts.append(conflict)
+				sub = None
+			elif kind == lexer.PRE:
+				sub = SubConflict(args[0], args[1], i)
+				if conflict != None:
+					conflict.subconflicts.append(sub)
+			elif kind == lexer.POST:
+				if sub != None:
+					sub.post = args[0]
+				sub = None
+			elif kind == lexer.BODY:
+				if sub != None:
+					sub.body.append(self.lines[i].strip())
+
+		self.index_conflicts()
+
+	def index_conflicts(self):
+		self.conflict_map = dict([(c.id, c) for c in self.conflicts])
+
+	def pack(self):
+		return (CACHE_VERSION, self.hash, self.kinds.tobytes(),
+				self.lines, self.args,
+				[b.pack() for b in self.bclauses],
+				[c.pack() for c in self.conflicts])
+
+	@staticmethod
+	def unpack(data):
+		(version, hash, kinds, lines, args, bclauses, conflicts) = data
+		if version != CACHE_VERSION:
+			return None
+		corpus = Corpus()
+		corpus.hash = hash
+		corpus.kinds.frombytes(kinds)
+		corpus.lines = lines
+		corpus.args = args
+		corpus.bclauses = [BClause(*b) for b in bclauses]
+		corpus.conflicts = [Conflict.unpack(c) for c in conflicts]
+		corpus.index_conflicts()
+		return corpus
+
+# Return the content hash used to key the cache for |data|.
+# This includes the source for the lexer and the corpus so that the cache is
+# invalidated when the parsing code changes.
+def content_hash(data):
+	h = hashlib.sha1()
+	for module_file in [lexer.__file__, __file__]:
+		src = os.path.splitext(module_file)[0] + '.py'
+		with open(src, 'rb') as f:
+			h.update(f.read())
+	h.update(data)
+	return h.hexdigest()
+
+def cache_path(src, hash):
+	return os.path.join(os.path.dirname(os.path.abspath(src)), CACHE_DIR,
+			'plotto-%s.bin' % hash)
+
+# Parse the source text |data| into a new Corpus.
+def parse(data):
+	corpus = Corpus()
+	lines = data.split('\n')
+	# Ignore the empty "line" after the final newline.
+	if lines[-1] == '':
+		lines.pop()
+	corpus.add_tokens(lexer.tokenize_lines(lines))
+	corpus.build_structure()
+	return corpus
+
+def read_cache(path, hash):
+	if not os.path.isfile(path):
+		return None
+	try:
+		# Reading the whole file first is much faster than marshal.load(f).
+		with open(path, 'rb') as f:
+			corpus = Corpus.unpack(marshal.loads(f.read()))
+	except (IOError, EOFError, ValueError, TypeError):
+		return None
+	if corpus == None or corpus.hash != hash:
+		return None
+	return corpus
+
+def write_cache(path, corpus):
+	dir = os.path.dirname(path)
+	try:
+		if not os.path.isdir(dir):
+			os.makedirs(dir)
+		# Remove stale caches for earlier versions of the source.
+		for old in glob.glob(os.path.join(dir, 'plotto-*.bin')):
+			os.remove(old)
+		tmp = path + '.tmp'
+		with open(tmp, 'wb') as f:
+			marshal.dump(corpus.pack(), f)
+		os.rename(tmp, path)
+	except (IOError, OSError):
+		# The cache is only an optimization.
+		pass
+
+# Load the parsed corpus for the source file |src|.
+# The cached copy is used if it matches the current contents of the file.
+def load(src, use_cache=True):
+	with open(src, 'rb') as f:
+		data = f.read()
+	return from_data(src, data, use_cache)
+
+# Return the parsed corpus for |data| (the UTF-8 contents of the source file
+# |src|).
+def from_data(src, data, use_cache=True):
+	hash = content_hash(data)
+
+	path = cache_path(src, hash)
+	corpus = None
+	if use_cache:
+		corpus = read_cache(path, hash)
+	if corpus == None:
+		corpus = parse(data.decode('utf-8'))
+		corpus.hash = hash
+		if use_cache:
+			write_cache(path, corpus)
+	corpus.path = src
+	return corpus
@@ -1,10 +1,16 @@
+import getopt
 import os.path
 import re
 import subprocess
 import sys
 
+import corpus
+import lexer
+import output
+import profiling
+
 def error(msg):
-	print 'Error: %s' % (msg)
+	print('Error: %s' % (msg))
 	sys.exit(1)
 
 class Parser():
@@ -20,36 +26,50 @@ class Parser():
 		self.subconflict = []
 
 	def end_subconflict(self):
-		if self.in_subconflict and len(self.subconflict) != 0:
+		# Comments before the PRE line (like page numbers) are written as is.
+		lines = self.subconflict
+		while len(lines) != 0 and lexer.tokenize(lines[0]).kind == lexer.COMMENT:
+			self.outfile.write(lines[0] + '\n')
+			lines = lines[1:]
+
+		if self.in_subconflict and len(lines) != 0:
 			first = True
+			sub_id = ''
 			in_links = ''
 			body = []
 			out_links = ''
-			for line in self.subconflict:
-				if re.match(r'^--', line):
-					self.outfile.write(line + '\n')
+			for line in lines:
+				token = lexer.tokenize(line)
+				if token.kind == lexer.COMMENT:
+					# Comments stay where they are (annotations like
+					# "-- HER obj" apply to the line that follows).
+					body.append(line)
 					continue
 				if first:
-					in_links = line
+					if token.kind == lexer.PRE:
+						# Already normalized.
+						(sub_id, in_links) = token.args
+					else:
+						in_links = line
+						m = re.match(r'^\(([a-n])\) (.*)$', in_links)
+						if m:
+							sub_id = m.group(1)
+							in_links = m.group(2)
 					first = False
-				elif re.match(r'POST: ', line):
-					out_links = line[6:]
+				elif token.kind == lexer.POST:
+					out_links = token.args[0]
 				else:
 					body.append(line)
 
-			sub_id = ''
-			m = re.match(r'^\(([a-n])\) (.*)$', in_links)
-			if m:
-				sub_id = m.group(1)
-				in_links = m.group(2)
-
 			if out_links == '':
 				done = False
 				in_paren = False
-				trim_lines = 0
-				trim_chars = 0
+				# Body lines that are text (not comments).
+				text_lines = [i for (i, b) in enumerate(body) if b[0:2] != '--']
+				trim_lines = []
 				# Extract outlinks from end of body
-				for b in reversed(body):
+				for i in reversed(text_lines):
+					b = body[i]
 					#print 'b:', b
 					if not done:
 						n = 0
@@ -71,18 +91,17 @@ class Parser():
 							#b = b[:-n]
 						# If we consumed the entire line, delete it from the body.
 						if n == len(b):
-							trim_lines += 1
+							trim_lines.append(i)
 						else:
 							# If we didn't consume the entire line, then we're done.
-							trim_chars = n
+							if n != 0:
+								body[i] = b[:-n]
 							break
 
-				if trim_lines == len(body):
+				if len(trim_lines) == len(text_lines):
 					error('Unable to find out links for %d' % self.conflict_id)
-				if trim_lines != 0:
-					del body[-trim_lines:]
-				if trim_chars != 0:
-					body[-1] = body[-1][:-trim_chars]
+				for i in trim_lines:
+					del body[i]
 				#print 'body', body
 				#print 'links "%s"' % out_links.strip()
 
@@ -104,69 +123,119 @@ class Parser():
 		return text
 
 	# Process an entire line from the file.
+	# Returns the line to write to the output, or None.
 	def process_line(self, line):
+		return self.process_token(lexer.tokenize(line.rstrip('\n')))
+
+	# Process a single (lexed) line from the file.
+	def process_token(self, token):
+		kind = token.kind
+		line = token.line
+
 		# Conflicts end on page 190.
-		m = re.match(r'^-- page 190$', line)
-		if m:
+		if kind == lexer.COMMENT and token.args == ('page', '190'):
 			self.end_subconflict()
 			self.in_conflict = False
 
 		# Start of new B-clause or conflict group ends the current Conflict.
-		m = re.match(r'^(B|ConflictGroup|ConflictSubGroup){', line)
-		if m:
+		if kind in (lexer.BCLAUSE, lexer.GROUP, lexer.SUBGROUP):
 			self.end_subconflict()
 			self.in_conflict = False
 
-		m = re.match(r'^Conflict{(\d+)}$', line)
-		if m:
-			#print 'Conflict', m.group(1)
-			self.conflict_id = int(m.group(1))
+		if kind == lexer.CONFLICT:
+			#print 'Conflict', token.args[0]
+			self.conflict_id = int(token.args[0])
 			self.end_subconflict()
 			self.in_conflict = True
 			self.in_subconflict = False
 
 		if self.in_conflict:
-			line2 = line.strip();
-
 			# A blank line in a Conflict means that a new (or the first)
 			# subconflict will start on the next line.
-			if len(line2) == 0 or re.match(r'^--', line2):
+			if kind == lexer.BLANK:
 				self.end_subconflict()
 				self.in_subconflict = True
 			elif self.in_subconflict:
-				self.subconflict.append(line2)
-				return ''
+				self.subconflict.append(line.strip())
+				return None
 
 		return self.process_text(line)
 
+	# Return the normalized text of the (already parsed) |source|.
+	# Text that is already normalized is returned unchanged.
+	def normalize(self, source):
+		self.outfile = output.OutputBuffer()
+		for token in source.tokens():
+			new_line = self.process_token(token)
+			if new_line != None:
+				self.outfile.write(new_line + '\n')
+		self.end_subconflict()
+		return self.outfile.getvalue()
+
 	def process(self, src, dst):
 		if not os.path.isfile(src):
 			error('File "%s" doesn\'t exist' % src)
 
 		try:
-			self.infile = open(src, 'r')
+			source = corpus.load(src)
 		except IOError as e:
 			error('Unable to open "%s" for reading: %s' % (src, e))
 
+		text = self.normalize(source)
 		try:
-			self.outfile = open(dst, 'w')
-		except IOError as e:
+			output.write_if_changed(dst, text)
+		except (IOError, OSError) as e:
 			error('Unable to open "%s" for writing: %s' % (dst, e))
 
-		for line in self.infile:
-			new_line = self.process_line(line)
-			self.outfile.write(new_line)
 
-		self.outfile.close()
-		self.infile.close()
+def usage():
+	print('Usage: %s <options>' % sys.argv[0])
+	print('where <options> are:')
+	print('  --profile')  # report where the time goes
+	print('  --profile-output <file>')  # also save the cProfile stats (for pstats)
 
+# Record the time spent in each phase of the fixup with |profiler|.
+def profile_phases(profiler):
+	profiler.wrap(corpus, 'load', 'read')
+	profiler.wrap(Parser, 'process_token', 'process lines',
+			lambda parser, token: profiling.token_key(token))
+	profiler.wrap(Parser, 'end_subconflict', 'subconflicts')
 
 def main():
+	try:
+		opts, args = getopt.getopt(sys.argv[1:],
+			'p',
+			['profile', 'profile-output='])
+	except getopt.GetoptError:
+		usage()
+		exit()
+
+	profile = False
+	profile_output = None
+	for opt, arg in opts:
+		if opt in ('-p', '--profile'):
+			profile = True
+		elif opt == '--profile-output':
+			profile = True
+			profile_output = arg
+
 	infilename = '../plotto.txt'
 	outfilename = '../plotto_new.txt'
 
+	profiler = None
+	if profile:
+		profiler = profiling.Profiler(profile_output)
+		profile_phases(profiler)
+		profiler.start()
+
 	parser = Parser()
-	parser.process(infilename, outfilename)
+	try:
+		parser.process(infilename, outfilename)
+	finally:
+		# Report the profile even if fixup stops on an error.
+		if profiler != None:
+			profiler.stop()
+			profiler.report()
 
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Gender swap for the A=female, B=male variant of Plotto.
+#
+# The gendered terms and character abbreviations that are swapped, from
+# which casting.py makes the casting table of the variant.
+#
+# The text is swapped one word at a time, where a word is a run of
+# characters between two delimiters (see DELIMITERS). The 'her', 'U',
+# 'husband' and 'mistress' words depend on the annotations in the source
+# (see ANNOTATED in casting.py).
+
+import re
+
+# These terms are bidirectional unless marked with an '*'. In this case, then '*'ed
+# term is not replaced with the other term (although the other term will be replaced with
+# the '*'ed term).
+# 'her' always requires disambiguation, so there is no default substitution.
+#   her: objective (him) vs. possessive (his)
+genderedTerms = [
+	['adventurer', 'adventuress'],
+	['brother', 'sister'],
+	['brothers', 'sisters'],
+	['boy', 'girl'],
+	['clergyman', 'clergywoman'],
+	['cowboy', 'cowgirl'],
+	['craftsman', 'craftswoman'],
+	['father', 'mother'],
+	['fatherhood', 'motherhood'],
+	['fathers', 'mothers'],
+	['foreman', 'forewoman'],
+	['frontiersman', 'frontierswoman'],
+	['gentleman', 'lady'],
+	# Handle gentlemen's <- ladies' (see POSSESSIVES)
+	["*gentlemen's", "ladies_poss"],
+	['gentlemen', 'ladies'],
+	['grandfather', 'grandmother'],
+	['he', 'she'],
+	['highwayman', 'highwaywoman'],
+	# him -> her
+	# See comment at top for her -> his/him
+	['him', '*her'],
+	['himself', 'herself'],
+	# wife <-> husband
+	# husband: spouse (wife) vs. to manage
+	# husband converts by default to 'wife', needs annotation to remain unchanged (=to manage)
+	['husband', 'wife'],
+	# his -> her
+	# See comment at top for her -> his/him
+	['his', '*her'],
+	['male', 'female'],
+	['man', 'woman'],
+	['man-hater', 'woman-hater'],
+	['mankind', 'womankind'],
+	['manly', 'womanly'],
+	['manservant', 'maid'],
+	['men', 'women'],
+	['misogynist', 'misandrist'],
+	# lover <- mistress
+	# 'lover' is ungendered and is not converted into 'mistress'
+	# mistress: head of household (master) vs. lover
+	# 'mistress' converts by default to 'lover', needs annotation for 'master'
+	['*lover', 'mistress'],
+	['nephew', 'niece'],
+	['paternal', 'maternal'],
+	['policeman', 'policewoman'],
+	['son', 'daughter'],
+	['stepfather', 'stepmother'],
+	['uncle', 'aunt'],
+	# unmarried <- maiden
+	# 'unmarried' is ungendered and is left unchanged
+	# This mapping works because 'maiden' is only used as an adj, as in 'maiden aunt'
+	# and 'maiden sisters'. The noun form of 'maiden' is not used.
+	['*unmarried', 'maiden'],
+	['widower', 'widow'],
+	# cad: female equivalent?
+]
+
+# Gendered character abbreviations.
+# These don't need to be swapped, but it is more readable to do so.
+genderedChars = [
+	['F', 'M'],		# father mother
+	['BR', 'SR'],	# brother sister
+	['SN', 'D'],	# son daughter
+	['U', 'AU'],	# uncle aunt
+	['NW', 'NC'],	# nephew niece
+	['GF', 'GM'],	# grandfather grandmother
+	['SF', 'SM'],	# stepfather stepmother
+]
+
+# Character abbreviations that are swapped when they appear on their own.
+# The others (like 'F' and 'M') are too ambiguous, and are only swapped as
+# part of a character reference like 'F-A'.
+SWAP_CHARS_ALONE = ['BR', 'SR', 'SN', 'D', 'U', 'AU', 'NC', 'NW']
+
+# Possessives that would otherwise be split at the apostrophe, mapped to
+# the name used for them in genderedTerms.
+POSSESSIVES = {
+	"ladies'": 'ladies_poss',
+}
+
+# Characters that separate words.
+# Note: — is emdash and ’ “ ” are curly quotes.
+DELIMITERS = ' .,:;—’“”\'"()[]{}'
+
+# Delimiters that can end a swapped word, but can't start one: a word right
+# after a curly quote is left as it is. The swap was originally matched
+# against the UTF-8 encoded text one byte at a time, and the last byte of a
+# curly quote isn't a delimiter, so this keeps the output the same.
+NO_SWAP_AFTER = '’“”'
+
+_re_split = re.compile('([%s])' % re.escape(DELIMITERS))
+
+def capitalize(word):
+	return word[0].upper() + word[1:]
+
+# Return the map from each gendered character abbreviation to the other.
+def swap_chars():
+	chars = {}
+	for (male, female) in genderedChars:
+		assert not (male in chars)
+		chars[male] = female
+		assert not (female in chars)
+		chars[female] = male
+	return chars
+
+# Return the map from each gendered term to its replacement.
+def swap_terms():
+	terms = {}
+	for (male, female) in genderedTerms:
+		m2f = True
+		f2m = True
+		if male[0] == '*':
+			male = male[1:]
+			m2f = False
+		if female[0] == '*':
+			female = female[1:]
+			f2m = False
+
+		if m2f:
+			assert not (male in terms)
+			terms[male] = female
+		if f2m:
+			assert not (female in terms)
+			terms[female] = male
+	return terms
+
+# Split |line| into words and delimiters (as used by the word frequency dict).
+def split_words(line):
+	for (word, name) in POSSESSIVES.items():
+		line = line.replace(word, name)
+	return _re_split.split(line)
+
+# Return a regular expression that matches any of the |words|.
+# The words are arranged in a trie, so that the regular expression only needs
+# to look at each character once (rather than trying each word in turn).
+# Longer words are tried first, so that "ladies'" is matched before "ladies".
+def trie_pattern(words):
+	trie = {}
+	for word in words:
+		node = trie
+		for char in word:
+			node = node.setdefault(char, {})
+		node[''] = None
+	return _trie_pattern(trie)
+
+def _trie_pattern(node):
+	branches = [re.escape(char) + _trie_pattern(node[char])
+			for char in sorted(node) if char != '']
+	if len(branches) == 0:
+		return ''
+	if '' in node:
+		# The word can end here.
+		return '(?:%s)?' % '|'.join(branches)
+	if len(branches) == 1:
+		return branches[0]
+	return '(?:%s)' % '|'.join(branches)
+
+# Return |new_word|, capitalized if |word| is.
+def capitalize_as(word, new_word):
+	if word[0].isupper():
+		return capitalize(new_word)
+	return new_word
+
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Support for incremental builds and verification.
+#
+# The corpus is split into blocks at each Conflict{N} (plus one block for
+# the text before the first conflict and another for the text after the
+# conflict section ends). Each block is fingerprinted by its source lines
+# (which includes any annotations that apply to it) and the parser state
+# when the block starts. The tools keep a manifest that maps fingerprints to
+# the results for that block so that only the blocks that changed need to be
+# processed again. The manifest also records the blocks that each of the
+# outputs for the whole corpus (like the search index) was written from, so
+# that they are only written again when a block changes.
+
+import hashlib
+import marshal
+import os
+import os.path
+
+import corpus
+import lexer
+
+# Bump this whenever the format of the manifest changes.
+MANIFEST_VERSION = 3
+
+# Split the corpus into blocks, returning a list of (start, end) line ranges.
+def split_blocks(source):
+	conflict = corpus.KIND_INDEX[lexer.CONFLICT]
+	comment = corpus.KIND_INDEX[lexer.COMMENT]
+
+	starts = [0]
+	kinds = source.kinds
+	args = source.args
+	for i in range(len(kinds)):
+		if kinds[i] == conflict:
+			starts.append(i)
+		elif kinds[i] == comment and args[i] == ('page', '190'):
+			starts.append(i)
+	starts.append(len(kinds))
+
+	blocks = []
+	for i in range(len(starts) - 1):
+		if starts[i] != starts[i+1]:
+			blocks.append((starts[i], starts[i+1]))
+	return blocks
+
+# Return the fingerprint for the block of lines [start, end) in |source|
+# given the parser |state| at the start of the block. |extra| is any other
+# data (from outside the block) that the result depends on.
+def fingerprint(source, start, end, state, extra=None):
+	h = hashlib.sha1()
+	h.update(repr(state).encode('utf-8'))
+	h.update(b'\0')
+	if extra != None:
+		h.update(repr(extra).encode('utf-8'))
+		h.update(b'\0')
+	h.update('\n'.join(source.lines[start:end]).encode('utf-8'))
+	return h.digest()
+
+# Return the key for an output that is written from the blocks with the
+# fingerprints |fps| (in order).
+def blocks_key(fps):
+	h = hashlib.sha1()
+	for fp in fps:
+		h.update(fp)
+	return h.hexdigest()
+
+# Return a key identifying the code in |files| and the |config| used to
+# process the blocks. Manifests with a different key are discarded.
+def code_key(files, config):
+	h = hashlib.sha1()
+	for f in files:
+		src = os.path.splitext(f)[0] + '.py'
+		with open(src, 'rb') as infile:
+			h.update(infile.read())
+	h.update(repr(sorted(config.items())).encode('utf-8'))
+	return h.hexdigest()
+
+def manifest_path(src, name):
+	return os.path.join(os.path.dirname(os.path.abspath(src)), corpus.CACHE_DIR,
+			'%s.manifest' % name)
+
+class Manifest(object):
+	"""Map from block fingerprint to the result of processing that block."""
+
+	def __init__(self, path, key):
+		self.path = path
+		self.key = key
+		# Entries from the previous run.
+		self.old = {}
+		# Entries used or added in this run.
+		self.new = {}
+		# Map from each output to the key of the blocks that it was written
+		# from (see blocks_key()), in the previous run and in this one.
+		self.old_outputs = {}
+		self.new_outputs = {}
+		# True if an entry was added in this run.
+		self.changed = False
+		# Number of blocks that were reused from the previous run.
+		self.hits = 0
+		self.misses = 0
+
+	def load(self):
+		if not os.path.isfile(self.path):
+			return
+		try:
+			# Reading the whole file first is much faster than marshal.load(f).
+			with open(self.path, 'rb') as f:
+				(version, key, entries, outputs) = marshal.loads(f.read())
+		except (IOError, EOFError, ValueError, TypeError):
+			return
+		if version == MANIFEST_VERSION and key == self.key:
+			self.old = entries
+			self.old_outputs = outputs
+
+	def get(self, fp):
+		value = self.old.get(fp)
+		if value == None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self.new[fp] = value
+		return value
+
+	def put(self, fp, value):
+		self.new[fp] = value
+		self.changed = True
+
+	# Return True if the |output| was written from the blocks with the |key|
+	# (see blocks_key()) in the previous run.
+	def has_output(self, output, key):
+		return self.old_outputs.get(output) == key
+
+	def put_output(self, output, key):
+		self.new_outputs[output] = key
+
+	# Save the entries used in this run (stale entries are dropped). The file
+	# is only written if the entries changed.
+	def save(self):
+		unchanged = (not self.changed and len(self.new) == len(self.old) and
+				self.new_outputs == self.old_outputs)
+		dir = os.path.dirname(self.path)
+		try:
+			if not unchanged:
+				if not os.path.isdir(dir):
+					os.makedirs(dir)
+				tmp = self.path + '.tmp'
+				with open(tmp, 'wb') as f:
+					marshal.dump((MANIFEST_VERSION, self.key, self.new, self.new_outputs), f)
+				os.rename(tmp, self.path)
+		except (IOError, OSError):
+			# The manifest is only an optimization.
+			pass
+		# Start the next run (for tools that keep running) from this one.
+		self.old = self.new
+		self.new = {}
+		self.old_outputs = self.new_outputs
+		self.new_outputs = {}
+		self.changed = False
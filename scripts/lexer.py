@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Line lexer for the Plotto source text.
+#
+# Each line of plotto.txt is classified exactly once (by its leading token)
+# into a typed Token. This is shared by build.py, verify.py and fixup.py so
+# that they all agree on the structure of the file.
+
+import re
+
+# Token kinds.
+COMMENT = 'comment'        # -- <directive> <value>
+BLANK = 'blank'            # (empty line)
+GROUP = 'group'            # ConflictGroup{<name>}
+SUBGROUP = 'subgroup'      # ConflictSubGroup{<name>}
+BCLAUSE = 'bclause'        # B{<id>} <name>
+CONFLICT = 'conflict'      # Conflict{<id>}
+PRE = 'pre'                # (<subid>) PRE: <links>
+POST = 'post'              # POST: <links>
+BODY = 'body'              # Anything else
+
+KINDS = [COMMENT, BLANK, GROUP, SUBGROUP, BCLAUSE, CONFLICT, PRE, POST, BODY]
+
+# Comment directives.
+# Maps the directive name to the separator that precedes its value (or None
+# if the directive has no value). Comments that don't start with one of these
+# are plain comments and have a directive of None.
+DIRECTIVES = {
+	'page': ' ',
+	'HER': ' ',
+	'A': ' ',
+	'U': ' ',
+	'HUSBAND': ' ',
+	'MISTRESS': ' ',
+	'ID': ':',
+	'FORMAT': ':',
+	'FORMAT_BEGIN': ':',
+	'FORMAT_END': None,
+	'FORMAT_LINES': ':',
+	'FORMAT_LINKS': ':',
+	'HR': None,
+}
+
+_re_comment = re.compile(r'^-- ([A-Za-z_]+)(.*)$')
+_re_page = re.compile(r'^(\d+)')
+_re_conflict = re.compile(r'^Conflict{(\d+)}$')
+_re_group = re.compile(r'^ConflictGroup{(.+)}$')
+_re_subgroup = re.compile(r'^ConflictSubGroup{(.*)}$')
+_re_bclause = re.compile(r'^B{(\d+)} (.*)$')
+_re_pre = re.compile(r'^PRE: (.*)$')
+_re_subpre = re.compile(r'^\(([a-m])\) PRE: (.*)$')
+_re_post = re.compile(r'^POST: (.*)$')
+
+class Token(object):
+	"""A single classified line from the Plotto source."""
+
+	__slots__ = ('kind', 'line', 'args')
+
+	def __init__(self, kind, line, args=()):
+		self.kind = kind
+		# The original line (as passed to tokenize).
+		self.line = line
+		# Kind-specific values:
+		#   COMMENT: (directive, value)
+		#   GROUP, SUBGROUP: (name,)
+		#   BCLAUSE: (id, name)
+		#   CONFLICT: (id,)
+		#   PRE: (subid, links) - subid is '' for conflicts without subconflicts
+		#   POST: (links,)
+		self.args = args
+
+	def __repr__(self):
+		return 'Token(%s, %r, %r)' % (self.kind, self.line, self.args)
+
+def tokenize_comment(line):
+	m = _re_comment.match(line)
+	if not m:
+		return Token(COMMENT, line, (None, None))
+	directive = m.group(1)
+	rest = m.group(2)
+	if not directive in DIRECTIVES:
+		return Token(COMMENT, line, (None, None))
+
+	sep = DIRECTIVES[directive]
+	value = None
+	if sep != None:
+		if rest[0:1] != sep:
+			return Token(COMMENT, line, (None, None))
+		value = rest[1:]
+		if directive == 'page':
+			m = _re_page.match(value)
+			if not m:
+				return Token(COMMENT, line, (None, None))
+			value = m.group(1)
+	return Token(COMMENT, line, (directive, value))
+
+# Classify a single line from the source file.
+# The line may include the trailing newline.
+def tokenize(line):
+	ch = line[0:1]
+	if ch == '-':
+		if line[1:2] == '-':
+			return tokenize_comment(line)
+	elif ch == 'C':
+		if line.startswith('Conflict'):
+			m = _re_conflict.match(line)
+			if m:
+				return Token(CONFLICT, line, (m.group(1),))
+			m = _re_group.match(line)
+			if m:
+				return Token(GROUP, line, (m.group(1),))
+			m = _re_subgroup.match(line)
+			if m:
+				return Token(SUBGROUP, line, (m.group(1),))
+	elif ch == 'B':
+		if line[1:2] == '{':
+			m = _re_bclause.match(line)
+			if m:
+				return Token(BCLAUSE, line, (m.group(1), m.group(2)))
+	elif ch == 'P':
+		m = _re_pre.match(line)
+		if m:
+			return Token(PRE, line, ('', m.group(1)))
+		m = _re_post.match(line)
+		if m:
+			return Token(POST, line, (m.group(1),))
+	elif ch == '(':
+		m = _re_subpre.match(line)
+		if m:
+			return Token(PRE, line, (m.group(1), m.group(2)))
+	elif ch == '' or ch.isspace():
+		if line.strip() == '':
+			return Token(BLANK, line)
+	return Token(BODY, line)
+
+# Tokenize all the lines from |lines|.
+def tokenize_lines(lines):
+	return [tokenize(line) for line in lines]
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Index of all the cross-references between conflicts.
+#
+# Each node in the graph is either a conflict ('1039') or a subconflict
+# ('1039a'). There is an edge from a subconflict to every conflict (or
+# subconflict) mentioned in its PRE or POST links, in the links in its text
+# ("(123 ch A to B)") and in its @{} tags. The edges are stored in
+# CSR form: the edges for node n are targets[offsets[n]:offsets[n+1]], with
+# the edge kind and the (interned) transformation label stored in parallel
+# arrays.
+#
+# Usage:
+#   python3 linkgraph.py <id>              # show links to/from a conflict
+#   python3 linkgraph.py <id> <id>         # shortest path between conflicts
+
+import array
+import collections
+import hashlib
+import json
+import os
+import os.path
+import re
+import struct
+import sys
+
+import corpus
+import links
+
+# Bump this whenever the format of the saved graph changes.
+GRAPH_VERSION = 4
+
+# Header of the saved graph: magic, version, number of nodes, number of
+# edges and size of the names (see dumps()).
+MAGIC = b'PLKG'
+HEADER = '<4sIIII'
+
+# Edge kinds.
+PRE = 0
+POST = 1
+TEXT = 2
+TAG = 3
+
+KIND_NAMES = ['PRE', 'POST', 'TEXT', 'TAG']
+
+_re_link_group = re.compile(r'^\((.*?)\) ?(.*)$')
+# Links in the text of a subconflict: (123 ch A to B) @{123}
+_re_text_link = re.compile(r'\((\d[^)]*)\)|@{([^}]*)}')
+_re_node = re.compile(r'^(\d+)([a-z]?)$')
+
+# Split a string of links "(123) (234a ch A to B)" into the link strings.
+def split_links(text):
+	result = []
+	while len(text) != 0:
+		m = _re_link_group.match(text)
+		if not m:
+			break
+		result.append(m.group(1))
+		text = m.group(2)
+	return result
+
+# Return a list of (kind, link) for the links in |text| (TEXT for links in
+# parentheses and TAG for @{} tags).
+def text_links(text):
+	result = []
+	for m in _re_text_link.finditer(text):
+		if m.group(1) != None:
+			result.append((TEXT, m.group(1)))
+		else:
+			result.append((TAG, m.group(2)))
+	return result
+
+# Return a list of (target, label) for each target in the |link| string.
+# The target is the node name ('123' or '123a') and the label is any
+# qualifier or transformation that follows the id ('ch A to B').
+def link_targets(link):
+	targets = []
+	for t in links.parse(link).targets():
+		for name in t.names():
+			targets.append((name, t.label))
+	return targets
+
+# Sort key for node names: by conflict number and then subconflict id.
+def node_key(name):
+	m = _re_node.match(name)
+	if not m:
+		return (sys.maxsize, name)
+	return (int(m.group(1)), m.group(2))
+
+def conflict_of(name):
+	m = _re_node.match(name)
+	if not m:
+		return name
+	return m.group(1)
+
+class LinkGraph(object):
+	"""Compressed (CSR) graph of the links between conflicts."""
+
+	def __init__(self):
+		# Node names, sorted by conflict number then subid.
+		self.nodes = []
+		self.index = {}
+		# 1 if the node exists in the source, 0 if it is only a link target.
+		self.defined = array.array('B')
+
+		self.offsets = array.array('i', [0])
+		self.targets = array.array('i')
+		self.kinds = array.array('B')
+		self.labels = array.array('i')
+		# Interned transformation labels. Label 0 is always ''.
+		self.label_names = ['']
+
+		# Reverse (inbound) edges, built on demand.
+		self.in_offsets = None
+		self.in_edges = None
+		self.edge_sources = None
+
+		# Subconflict nodes for each conflict node, built on demand.
+		self.children = None
+
+	def __len__(self):
+		return len(self.nodes)
+
+	def num_edges(self):
+		return len(self.targets)
+
+	def node(self, name):
+		return self.index.get(str(name))
+
+	def is_defined(self, name):
+		n = self.node(name)
+		return n != None and self.defined[n] == 1
+
+	def _init_nodes(self, names, defined):
+		self.nodes = sorted(names, key=node_key)
+		self.index = dict([(name, i) for (i, name) in enumerate(self.nodes)])
+		self.defined = array.array('B', [0] * len(self.nodes))
+		for name in defined:
+			self.defined[self.index[name]] = 1
+
+	def _index_children(self):
+		self.children = collections.defaultdict(list)
+		for (n, name) in enumerate(self.nodes):
+			parent = conflict_of(name)
+			if parent != name and parent in self.index:
+				self.children[self.index[parent]].append(n)
+
+	def _index_inbound(self):
+		counts = [0] * (len(self.nodes) + 1)
+		for t in self.targets:
+			counts[t + 1] += 1
+		for i in range(len(self.nodes)):
+			counts[i + 1] += counts[i]
+		self.in_offsets = array.array('i', counts)
+		self.in_edges = array.array('i', [0] * len(self.targets))
+		fill = list(counts)
+		for n in range(len(self.nodes)):
+			for e in range(self.offsets[n], self.offsets[n+1]):
+				t = self.targets[e]
+				self.in_edges[fill[t]] = e
+				fill[t] += 1
+		# Edge id -> source node.
+		self.edge_sources = array.array('i', [0] * len(self.targets))
+		for n in range(len(self.nodes)):
+			for e in range(self.offsets[n], self.offsets[n+1]):
+				self.edge_sources[e] = n
+
+	# Return the node and all of its subconflicts.
+	def _expand(self, n):
+		if self.children == None:
+			self._index_children()
+		return [n] + self.children.get(n, [])
+
+	def _edge(self, e, other):
+		return (self.nodes[other], KIND_NAMES[self.kinds[e]],
+				self.label_names[self.labels[e]])
+
+	# Return a list of (target, kind, label) for all the links from |name|.
+	# For a conflict, this includes the links from all of its subconflicts.
+	def out_neighbours(self, name, kind=None):
+		n = self.node(name)
+		if n == None:
+			return []
+		result = []
+		for src in self._expand(n):
+			for e in range(self.offsets[src], self.offsets[src+1]):
+				if kind == None or self.kinds[e] == kind:
+					result.append(self._edge(e, self.targets[e]))
+		return result
+
+	# Return a list of (source, kind, label) for all the links to |name|.
+	# For a conflict, this includes the links to all of its subconflicts.
+	def in_neighbours(self, name, kind=None):
+		n = self.node(name)
+		if n == None:
+			return []
+		if self.in_offsets == None:
+			self._index_inbound()
+		result = []
+		for dst in self._expand(n):
+			for i in range(self.in_offsets[dst], self.in_offsets[dst+1]):
+				e = self.in_edges[i]
+				if kind == None or self.kinds[e] == kind:
+					result.append(self._edge(e, self.edge_sources[e]))
+		return result
+
+	def _neighbour_nodes(self, n, kind, inbound):
+		if inbound and self.in_offsets == None:
+			self._index_inbound()
+		for src in self._expand(n):
+			if inbound:
+				for i in range(self.in_offsets[src], self.in_offsets[src+1]):
+					e = self.in_edges[i]
+					if kind == None or self.kinds[e] == kind:
+						yield self.edge_sources[e]
+			else:
+				for e in range(self.offsets[src], self.offsets[src+1]):
+					if kind == None or self.kinds[e] == kind:
+						yield self.targets[e]
+
+	# Return a dict of {node name: distance} for all the nodes reachable from
+	# |name| in at most |k| steps.
+	def khop(self, name, k, kind=None, inbound=False):
+		n = self.node(name)
+		if n == None:
+			return {}
+		dist = {n: 0}
+		frontier = [n]
+		for d in range(1, k + 1):
+			next = []
+			for src in frontier:
+				for t in self._neighbour_nodes(src, kind, inbound):
+					if not t in dist:
+						dist[t] = d
+						next.append(t)
+			frontier = next
+		return dict([(self.nodes[n], d) for (n, d) in dist.items()])
+
+	# Return the shortest list of nodes from |start| to |end| following the
+	# links, or None if there is no path.
+	def shortest_path(self, start, end, kind=None):
+		a = self.node(start)
+		b = self.node(end)
+		if a == None or b == None:
+			return None
+		prev = {a: None}
+		queue = collections.deque([a])
+		while queue:
+			n = queue.popleft()
+			if n == b:
+				path = []
+				while n != None:
+					path.append(self.nodes[n])
+					n = prev[n]
+				return path[::-1]
+			for t in self._neighbour_nodes(n, kind, False):
+				if not t in prev:
+					prev[t] = n
+					queue.append(t)
+		return None
+
+	# Return a dict that maps each node name to the names of the nodes that
+	# link to it (directly, so the links to a subconflict are not included in
+	# the list for its conflict). The names are sorted and unique.
+	# The edges are stored in order of their source node, so a single pass
+	# over them builds the lists in sorted order.
+	def referenced_by(self):
+		result = {}
+		for n in range(len(self.nodes)):
+			source = self.nodes[n]
+			for e in range(self.offsets[n], self.offsets[n+1]):
+				sources = result.setdefault(self.nodes[self.targets[e]], [])
+				if len(sources) == 0 or sources[-1] != source:
+					sources.append(source)
+		return result
+
+	# Return the graph in the saved format (see dumps()).
+	def pack(self):
+		names = json.dumps({'nodes': self.nodes, 'labels': self.label_names},
+				ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+		header = struct.pack(HEADER, MAGIC, GRAPH_VERSION, len(self.nodes),
+				len(self.targets), len(names))
+		return b''.join([header, names] + [_array_bytes(a) for a in
+				[self.defined, self.offsets, self.targets, self.kinds, self.labels]])
+
+	@staticmethod
+	def unpack(data):
+		size = struct.calcsize(HEADER)
+		(magic, version, num_nodes, num_edges, names_size) = struct.unpack(HEADER, data[:size])
+		if magic != MAGIC or version != GRAPH_VERSION:
+			return None
+		pos = size + names_size
+		names = json.loads(data[size:pos].decode('utf-8'))
+		g = LinkGraph()
+		g.nodes = names['nodes']
+		g.index = dict([(name, i) for (i, name) in enumerate(g.nodes)])
+		g.label_names = names['labels']
+		g.offsets = array.array('i')
+		for (a, count) in [(g.defined, num_nodes), (g.offsets, num_nodes + 1),
+				(g.targets, num_edges), (g.kinds, num_edges), (g.labels, num_edges)]:
+			end = pos + count * a.itemsize
+			a.frombytes(data[pos:end])
+			if sys.byteorder != 'little':
+				a.byteswap()
+			pos = end
+		return g
+
+# Return the bytes of the array |a| (in little-endian order).
+def _array_bytes(a):
+	if sys.byteorder != 'little':
+		a = array.array(a.typecode, a)
+		a.byteswap()
+	return a.tobytes()
+
+# Build the link graph for the parsed |source| corpus.
+def build(source):
+	defined = []
+	# (source node, kind, target node, label) for each link.
+	edges = []
+	for c in source.conflicts:
+		defined.append(c.id)
+		for s in c.subconflicts:
+			name = c.id + s.subid
+			if s.subid != '':
+				defined.append(name)
+			refs = [(PRE, link) for link in split_links(s.pre)]
+			refs.extend(text_links(' '.join(s.body)))
+			refs.extend([(POST, link) for link in split_links(s.post)])
+			for (kind, link) in refs:
+				for (target, label) in link_targets(link):
+					edges.append((name, kind, target, label))
+
+	g = LinkGraph()
+	names = set(defined)
+	for e in edges:
+		names.add(e[2])
+	g._init_nodes(names, defined)
+
+	label_index = {'': 0}
+	edges.sort(key=lambda e: g.index[e[0]])
+	counts = [0] * len(g.nodes)
+	for (src, kind, target, label) in edges:
+		counts[g.index[src]] += 1
+		g.targets.append(g.index[target])
+		g.kinds.append(kind)
+		if not label in label_index:
+			label_index[label] = len(g.label_names)
+			g.label_names.append(label)
+		g.labels.append(label_index[label])
+	for c in counts:
+		g.offsets.append(g.offsets[-1] + c)
+	return g
+
+# Return the saved form of the |graph|. The format doesn't depend on the
+# Python version (and the same graph always gives the same bytes):
+#   header: HEADER (little-endian)
+#   the node names and labels as UTF-8 JSON: {"labels": [...], "nodes": [...]}
+#   the defined, offsets, targets, kinds and labels arrays (little-endian,
+#   with 1 byte for defined and kinds and 4 bytes for the others)
+def dumps(graph):
+	return graph.pack()
+
+def loads(data):
+	return LinkGraph.unpack(data)
+
+def save(graph, path):
+	with open(path, 'wb') as f:
+		f.write(dumps(graph))
+
+def load(path):
+	with open(path, 'rb') as f:
+		return loads(f.read())
+
+# Name of the cached graph (in the corpus cache directory).
+CACHE_FILE = 'links.bin'
+
+# Return the key for the cached graph of |source|, which depends on the source
+# and on the code that finds the links.
+def cache_key(source):
+	h = hashlib.sha1(source.hash.encode('ascii'))
+	for f in [__file__, links.__file__]:
+		with open(os.path.splitext(f)[0] + '.py', 'rb') as infile:
+			h.update(infile.read())
+	return h.hexdigest().encode('ascii')
+
+# Return the link graph for the parsed |source|. The graph is cached (next to
+# the corpus cache), so it is only built when the source changes.
+def cached(source):
+	if source.path == None:
+		return build(source)
+	path = os.path.join(os.path.dirname(os.path.abspath(source.path)), corpus.CACHE_DIR,
+			CACHE_FILE)
+	key = cache_key(source)
+	try:
+		with open(path, 'rb') as f:
+			data = f.read()
+		if data[:len(key)] == key:
+			graph = loads(data[len(key):])
+			if graph != None:
+				return graph
+	except (IOError, ValueError, struct.error):
+		pass
+
+	graph = build(source)
+	try:
+		dir = os.path.dirname(path)
+		if not os.path.isdir(dir):
+			os.makedirs(dir)
+		tmp = path + '.tmp'
+		with open(tmp, 'wb') as f:
+			f.write(key + dumps(graph))
+		os.rename(tmp, path)
+	except (IOError, OSError):
+		# The cache is only an optimization.
+		pass
+	return graph
+
+def main():
+	args = sys.argv[1:]
+	if len(args) == 0 or len(args) > 2:
+		print('Usage: %s <id> [<id>]' % sys.argv[0])
+		sys.exit(1)
+
+	graph = cached(corpus.load('../plotto.txt'))
+	if len(args) == 2:
+		path = graph.shortest_path(args[0], args[1])
+		if path == None:
+			print('No path from %s to %s' % (args[0], args[1]))
+		else:
+			print(' -> '.join(path))
+		return
+
+	for (name, kind, label) in graph.in_neighbours(args[0]):
+		print('%-4s %s <- %s %s' % (kind, args[0], name, label))
+	for (name, kind, label) in graph.out_neighbours(args[0]):
+		print('%-4s %s -> %s %s' % (kind, args[0], name, label))
+
+if __name__ == '__main__':
+	main()
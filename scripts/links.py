@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Parser for the links between conflicts.
+#
+# A link is the text between the parentheses in "(123a, b -* ch A to B)":
+#   123        the target conflict
+#   a, b       the target subconflicts (optional)
+#   -1-2       the parts of the target that apply (optional)
+#   -*, *-**   the part of the target that applies (optional)
+#   ch A to B  transformations to apply to the characters (optional)
+# and a link can list several targets as a sequence ("123; 234") or as
+# alternatives ("123 or 234").
+#
+# Links are parsed into Link objects that are shared by verify.py (which
+# checks that all the links are valid), build.py (which writes the
+# hyperlinks) and linkgraph.py. The same links appear many times, so the
+# results are cached.
+
+import re
+
+# Characters that can appear in a transformation.
+# Only match S in certain contexts since it is often a mistake for 3 or 8.
+CHAR = ('('
+		# Must be first to avoid partial matches: e.g., B vs. BR-B
+		'AUX|BR-A|BR-B|'
+		'A(X|-[1-9])?|'
+		'B(X|-[2-58])?|'
+		'(D|F|GF|M|NW|P|SN|SR|U)-A|'
+		'(D|F|GF|M|SM|SN|SR)-B|'
+		'CH|CN|D|FA|FB|GCH|NW|SN|SR|SX|U|X|'
+		'“.*?”'
+		')')
+
+_re_subid_only = re.compile(r'^[a-h]$')
+# (123a, b, c)
+_re_target = re.compile(r'^(\d+)([a-h](, [a-h])*)?(?P<extra>.*)$')
+
+# The stages that must match the text after the target (in this order).
+# Each stage is optional, and consumes the start of the text. All the stages
+# other than 'qualifiers' and 'part' are transformations.
+_stages = [
+	# -1-2-3
+	('qualifiers', r'(-1)?(-2)?(-3)?(-4)?'),
+	# -*, -**, *-**
+	('part', r'( -\*{1,4}| \*-\*{2,4}| \*{2}-\*{3,4}| \*{3}-\*{4,5}| \*{4}-\*{5})?'),
+	# transpose & change
+	('tr & ch', r'( tr %s & %s(,| &) ch %s to %s)?' % (CHAR, CHAR, CHAR, CHAR)),
+	# transpose & eliminate
+	('tr & eliminate', r'( tr %s & %s and eliminate “.*”)?' % (CHAR, CHAR)),
+	# transpose
+	('tr', r'( tr %s & %s)?' % (CHAR, CHAR)),
+	# change & transpose
+	('ch & tr', r'( ch %s to %s & tr %s & %s)?' % (CHAR, CHAR, CHAR, CHAR)),
+	# change & add
+	('ch & add', r'( ch %s to %s(, %s to %s)* & add %s)?' % (CHAR, CHAR, CHAR, CHAR, CHAR)),
+	# change & eliminate
+	('ch & eliminate', r'( ch %s to %s & eliminate “.*”)?' % (CHAR, CHAR)),
+	# change: A to B & X and Y to Z
+	('ch & and', r'( ch %s to %s & %s and %s to %s)?' % (CHAR, CHAR, CHAR, CHAR, CHAR)),
+	# change: A to B & LAST X to Y
+	('ch & last', r'( ch %s to %s & last %s to %s)?' % (CHAR, CHAR, CHAR, CHAR)),
+	# change
+	('ch', r'( ch %s to %s((, %s to %s)* (&|and) %s to %s)?)?' % (CHAR, CHAR, CHAR, CHAR, CHAR, CHAR)),
+	# add
+	('add', r'( add %s)?' % (CHAR)),
+]
+_stages = [(name, re.compile(r'^(?P<stage>%s)(?P<extra>.*)$' % pattern))
+		for (name, pattern) in _stages]
+# A note at the end: ', with ...'
+_re_note = re.compile(r'^(, (“.*”|(with|son|daughter|mother).*))?$')
+
+# The words in a transformation.
+_re_transform_word = re.compile(r'“.*?”|[\w-]+|&|,')
+KEYWORDS = ['tr', 'ch', 'add', 'eliminate']
+
+class Transform(object):
+	"""A single change to the characters in the target conflict.
+
+	op is one of:
+	  'tr': transpose the characters args[0] and args[1]
+	  'ch': change the character args[0] to args[1]
+	  'ch_last': as 'ch', but only for the last occurrence of args[0]
+	  'add': add the character args[0]
+	  'eliminate': remove the text args[0]
+	"""
+
+	__slots__ = ['op', 'args']
+
+	def __init__(self, op, args):
+		self.op = op
+		self.args = args
+
+	def __repr__(self):
+		return 'Transform(%r, %r)' % (self.op, self.args)
+
+class Target(object):
+	"""A single target of a link."""
+
+	__slots__ = ['text', 'id', 'subids', 'qualifiers', 'part', 'transforms',
+			'note', 'label']
+
+	def __init__(self, text):
+		# The link text for this target (without the sequence/alternation).
+		self.text = text
+		# Target conflict (or None for the empty link and for the bare
+		# subconflict ids that start a list of links).
+		self.id = None
+		# Target subconflicts.
+		self.subids = ()
+		# '-1-2'
+		self.qualifiers = ''
+		# '-*', '*-**'
+		self.part = ''
+		self.transforms = []
+		# ', with ...'
+		self.note = ''
+		# Everything after the target ids ('-* ch A to B').
+		self.label = ''
+
+	# Return the names of the target nodes ('123' or '123a', '123b').
+	def names(self):
+		if self.id == None:
+			return []
+		if len(self.subids) == 0:
+			return [self.id]
+		return [self.id + s for s in self.subids]
+
+class Link(object):
+	"""A parsed link."""
+
+	__slots__ = ['text', 'valid', 'sequence']
+
+	def __init__(self, text):
+		self.text = text
+		self.valid = True
+		# Targets as a list (sequence) of lists (alternatives).
+		self.sequence = []
+
+	def targets(self):
+		return [t for alternatives in self.sequence for t in alternatives]
+
+# Parse the transformations in |text| (which has already been validated).
+def parse_transforms(text):
+	words = _re_transform_word.findall(text)
+	transforms = []
+	i = 0
+	while i < len(words):
+		op = words[i]
+		i += 1
+		if op == 'tr':
+			# tr X & Y
+			transforms.append(Transform('tr', (words[i], words[i+2])))
+			i += 3
+		elif op == 'add':
+			transforms.append(Transform('add', (words[i],)))
+			i += 1
+		elif op == 'eliminate':
+			transforms.append(Transform('eliminate', (words[i],)))
+			i += 1
+		elif op == 'ch':
+			# ch X to Y, X and Y to Z & last X to Y
+			while i < len(words) and not words[i] in KEYWORDS:
+				op = 'ch'
+				if words[i] == 'last':
+					op = 'ch_last'
+					i += 1
+				sources = [words[i]]
+				i += 1
+				while words[i] == 'and':
+					sources.append(words[i+1])
+					i += 2
+				# 'to'
+				target = words[i+1]
+				i += 2
+				for s in sources:
+					transforms.append(Transform(op, (s, target)))
+				# Separator before the next change (or transformation).
+				if i < len(words) and words[i] in [',', '&', 'and']:
+					i += 1
+		# Anything else is a separator between transformations.
+	return transforms
+
+def parse_target(text):
+	target = Target(text)
+	if text == '':
+		return (target, True)
+	# (a), (b), (c), ...
+	# This should only be allowed as the first link in the list.
+	if _re_subid_only.match(text):
+		target.subids = (text,)
+		return (target, True)
+
+	m = _re_target.match(text)
+	if not m:
+		return (target, False)
+	target.id = m.group(1)
+	if m.group(2):
+		target.subids = tuple(m.group(2).split(', '))
+	extra = m.group('extra')
+	target.label = extra.strip()
+
+	transforms = []
+	for (name, stage) in _stages:
+		m = stage.match(extra)
+		if not m:
+			return (target, False)
+		if m.group('stage') and stats != None:
+			stats[name] = stats.get(name, 0) + 1
+		if name == 'qualifiers':
+			target.qualifiers = m.group('stage')
+		elif name == 'part':
+			target.part = m.group('stage').strip()
+		elif m.group('stage'):
+			transforms.append(m.group('stage'))
+		extra = m.group('extra')
+
+	if not _re_note.match(extra):
+		return (target, False)
+	target.note = extra[2:]
+	target.transforms = parse_transforms(' '.join(transforms))
+	return (target, True)
+
+# Quoted text (“text”), which can contain the separators of a link.
+_re_quoted = re.compile('“.*?”')
+
+# Split |text| at each |separator| that isn't in quoted text.
+def split_unquoted(text, separator):
+	masked = _re_quoted.sub(lambda m: '\0' * len(m.group(0)), text)
+	parts = []
+	start = 0
+	pos = masked.find(separator)
+	while pos != -1:
+		parts.append(text[start:pos])
+		start = pos + len(separator)
+		pos = masked.find(separator, start)
+	parts.append(text[start:])
+	return parts
+
+_cache = {}
+
+# Counts of the links parsed and the stages matched, by name (or None to not
+# count them). Used by profiling.py.
+stats = None
+
+# Return the Link for the |text| between the parentheses.
+def parse(text):
+	link = _cache.get(text)
+	if stats != None:
+		key = 'cached' if link != None else 'parsed'
+		stats[key] = stats.get(key, 0) + 1
+	if link != None:
+		return link
+
+	link = Link(text)
+	# Sequence: (123; 234)
+	steps = [text]
+	if ';' in text:
+		steps = [s.strip() for s in split_unquoted(text, ';')]
+	for step in steps:
+		# Alternation: (123 or 234)
+		alternatives = [step]
+		if ' or ' in step:
+			alternatives = [a.strip() for a in split_unquoted(step, ' or ')]
+		for (i, alt) in enumerate(alternatives):
+			(target, valid) = parse_target(alt)
+			if not valid:
+				link.valid = False
+			alternatives[i] = target
+		link.sequence.append(alternatives)
+	_cache[text] = link
+	return link
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Service worker for offline use.
+#
+# Writes sw.js, which caches the files of each variant (with
+# service_worker=True in its config). Only the shell is precached: the CSS and
+# JS, plus the page that registers the service worker. The other files (the
+# other variants, the shards and the search and views data) are cached when
+# they are first used. Each file is listed with a revision (a hash of its
+# contents), so the service worker only changes when a file changes, and then
+# the browsers only download the files that changed.
+#
+# The service worker code is in js/serviceworker.js. sw.js is that code
+# preceded by the lists of files:
+#   var PRECACHE = {"css/plotto.css": "<revision>", ...};
+#   var RUNTIME = {"plotto-mf.html": "<revision>", ...};
+
+import hashlib
+import json
+import os
+import os.path
+
+import output
+import shard
+
+# Number of hex digits of the content hash in the revisions.
+REVISION_LENGTH = 12
+
+TEMPLATE = os.path.join('js', 'serviceworker.js')
+
+# Return the files (relative to |root|) used by the variant described by
+# |config| as (shell, runtime), where the shell files are precached and the
+# runtime files are cached when they are first used. |js_files| and
+# |css_files| are the files included by its pages.
+def assets(config, root, js_files, css_files):
+	shell = []
+	shell.extend([os.path.join(root, 'js', f) for f in js_files])
+	shell.extend([os.path.join(root, 'css', f) for f in css_files])
+
+	runtime = []
+	page = os.path.abspath(config['output_file'])
+	runtime.append(page)
+	if config.get('shard'):
+		dir = shard.shard_dir(page)
+		if os.path.isdir(dir):
+			runtime.extend([os.path.join(dir, f) for f in sorted(os.listdir(dir))
+					if f.endswith('.html')])
+	if config.get('search'):
+		runtime.append(os.path.splitext(page)[0] + '-search.json')
+	if config.get('views'):
+		runtime.append(os.path.splitext(page)[0] + '-views.json')
+
+	def relative(files):
+		return [os.path.relpath(f, root).replace(os.sep, '/') for f in files]
+	return (relative(shell), relative(runtime))
+
+def revision(path):
+	with open(path, 'rb') as f:
+		return hashlib.sha1(f.read()).hexdigest()[:REVISION_LENGTH]
+
+# Return the map from each of the |files| (relative to |root|) to its
+# revision. Missing files are skipped.
+def revisions(files, root):
+	result = {}
+	for f in files:
+		path = os.path.join(root, f)
+		if os.path.isfile(path):
+			result[f] = revision(path)
+	return result
+
+# Write the service worker |dst| to precache the |shell| files and to cache
+# the |runtime| files when they are first used (both relative to the
+# directory of |dst|). Missing files are skipped.
+# Returns True if the service worker changed.
+def write(shell, runtime, dst):
+	root = os.path.dirname(os.path.abspath(dst))
+	precache = revisions(shell, root)
+	runtime = revisions([f for f in runtime if not f in precache], root)
+
+	with open(os.path.join(root, TEMPLATE), 'r', encoding='utf-8') as f:
+		template = f.read()
+	data = 'var PRECACHE = %s;\nvar RUNTIME = %s;\n\n%s' % (
+			json.dumps(precache, indent=1, sort_keys=True),
+			json.dumps(runtime, indent=1, sort_keys=True), template)
+	return output.write_if_changed(dst, data)
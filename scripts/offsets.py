@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Byte-offset index for random access to plotto.txt.
+#
+# Maps each conflict and subconflict id, each "-- page N" marker and each
+# B{n} clause to the range of bytes (and lines) in plotto.txt that it covers,
+# so that a single conflict can be read without parsing the whole file.
+#
+# The index is built (from the parsed corpus) once for each version of the
+# source and saved in the cache directory. It records the size and mtime of
+# the source, so that checking whether it is still current only needs a
+# stat() of the source. The content hash is only computed when those change.
+#
+# Reader memory-maps the source and parses only the requested range:
+#   reader = offsets.Reader('../plotto.txt')
+#   conflict = reader.conflict('1039')
+#
+# Usage: python3 plotto.py lookup <id>|page:<n>|B:<id>
+
+import array
+import marshal
+import mmap
+import os
+import os.path
+import sys
+
+import corpus
+import lexer
+
+# Bump this whenever the format of the index changes.
+INDEX_VERSION = 1
+
+def error(msg):
+	print('Error: %s' % (msg), file=sys.stderr)
+	sys.exit(1)
+
+class Range(object):
+	"""A range of lines in the source: [start, end) in bytes and lines."""
+
+	__slots__ = ('start', 'end', 'first_line', 'last_line')
+
+	def __init__(self, start, end, first_line, last_line):
+		self.start = start
+		self.end = end
+		# Line indexes [first_line, last_line).
+		self.first_line = first_line
+		self.last_line = last_line
+
+	def pack(self):
+		return (self.start, self.end, self.first_line, self.last_line)
+
+	def __repr__(self):
+		return 'Range(%d, %d, %d, %d)' % self.pack()
+
+class RangeTable(object):
+	"""Map from name to Ranges, stored as flat arrays (so it loads quickly).
+	A name can have more than one Range (B-clauses are repeated)."""
+
+	def __init__(self):
+		self.names = []
+		# The 4 values of each Range, in the same order as the names.
+		self.values = array.array('q')
+		# Map from name to the list of its positions in |names|.
+		self.positions = {}
+
+	def __contains__(self, name):
+		return name in self.positions
+
+	def add(self, name, range):
+		self.positions.setdefault(name, []).append(len(self.names))
+		self.names.append(name)
+		self.values.extend(range.pack())
+
+	# Return the (first) Range for |name|, or None.
+	def get(self, name):
+		positions = self.positions.get(name)
+		if positions == None:
+			return None
+		return self.range(positions[0])
+
+	# Return all the Ranges for |name|.
+	def get_all(self, name):
+		return [self.range(i) for i in self.positions.get(name, [])]
+
+	def range(self, i):
+		return Range(*self.values[4*i:4*i + 4])
+
+	def pack(self):
+		return (self.names, self.values.tobytes())
+
+	@staticmethod
+	def unpack(data):
+		(names, values) = data
+		table = RangeTable()
+		table.names = names
+		table.values.frombytes(values)
+		for (i, name) in enumerate(names):
+			table.positions.setdefault(name, []).append(i)
+		return table
+
+# Tokens that end the text of a conflict (and of a B-clause, except for
+# CONFLICT).
+_end_conflict = set([lexer.CONFLICT, lexer.BCLAUSE, lexer.GROUP, lexer.SUBGROUP])
+_end_bclause = set([lexer.BCLAUSE, lexer.GROUP, lexer.SUBGROUP])
+
+# Return the byte offset of the start of each line in |data| (plus the
+# offset of the end of the data).
+def line_offsets(data):
+	offsets = [0]
+	pos = data.find(b'\n')
+	while pos != -1:
+		offsets.append(pos + 1)
+		pos = data.find(b'\n', pos + 1)
+	if offsets[-1] != len(data):
+		offsets.append(len(data))
+	return offsets
+
+class Index(object):
+	"""Byte and line ranges of the conflicts, pages and B-clauses."""
+
+	def __init__(self):
+		self.hash = None
+		# Size and mtime (ns) of the source when the index was built.
+		self.size = None
+		self.mtime = None
+		# Conflict and subconflict ids.
+		self.conflicts = RangeTable()
+		# Map from conflict id to (group, subgroup, bclause).
+		self.headings = {}
+		# Page numbers (as strings).
+		self.pages = RangeTable()
+		# B-clause ids (each B-clause heading is repeated in the text).
+		self.bclauses = RangeTable()
+
+	def pack(self):
+		return (INDEX_VERSION, self.hash, self.size, self.mtime,
+				self.conflicts.pack(), self.headings,
+				self.pages.pack(), self.bclauses.pack())
+
+	@staticmethod
+	def unpack(data):
+		(version, hash, size, mtime, conflicts, headings, pages, bclauses) = data
+		if version != INDEX_VERSION:
+			return None
+		index = Index()
+		index.hash = hash
+		index.size = size
+		index.mtime = mtime
+		index.conflicts = RangeTable.unpack(conflicts)
+		index.headings = headings
+		index.pages = RangeTable.unpack(pages)
+		index.bclauses = RangeTable.unpack(bclauses)
+		return index
+
+# Build the index for the parsed |source|, where |data| is the contents of
+# the source file.
+def build(source, data):
+	offsets = line_offsets(data)
+	n = len(source)
+	kinds = [lexer.KINDS[k] for k in source.kinds]
+
+	def make_range(first, last):
+		return Range(offsets[first], offsets[last], first, last)
+
+	# Return the line at or after |i| that has a token in |end_kinds| (or the
+	# end of the conflict section).
+	def find_end(i, end_kinds):
+		while i < n:
+			if kinds[i] in end_kinds or source.args[i] == ('page', '190'):
+				return i
+			i += 1
+		return n
+
+	index = Index()
+	index.hash = source.hash
+	for c in source.conflicts:
+		index.conflicts.add(c.id, make_range(c.line, find_end(c.line + 1, _end_conflict)))
+		index.headings[c.id] = (c.group, c.subgroup, c.bclause)
+		for s in c.subconflicts:
+			if s.subid == '':
+				continue
+			# From the PRE: line to the POST: line.
+			end = s.line + 1
+			while end < n and kinds[end - 1] != lexer.POST:
+				end += 1
+			index.conflicts.add(c.id + s.subid, make_range(s.line, end))
+	for b in source.bclauses:
+		index.bclauses.add(b.id, make_range(b.line, find_end(b.line + 1, _end_bclause)))
+
+	pages = [i for i in range(n)
+			if kinds[i] == lexer.COMMENT and source.args[i][0] == 'page']
+	for (j, i) in enumerate(pages):
+		end = pages[j + 1] if j + 1 < len(pages) else n
+		index.pages.add(source.args[i][1], make_range(i, end))
+	return index
+
+def index_path(src):
+	return os.path.join(os.path.dirname(os.path.abspath(src)), corpus.CACHE_DIR,
+			'offsets.bin')
+
+def read_index(path):
+	if not os.path.isfile(path):
+		return None
+	try:
+		# Reading the whole file first is much faster than marshal.load(f).
+		with open(path, 'rb') as f:
+			return Index.unpack(marshal.loads(f.read()))
+	except (IOError, EOFError, ValueError, TypeError):
+		return None
+
+def write_index(path, index):
+	dir = os.path.dirname(path)
+	try:
+		if not os.path.isdir(dir):
+			os.makedirs(dir)
+		tmp = path + '.tmp'
+		with open(tmp, 'wb') as f:
+			marshal.dump(index.pack(), f)
+		os.rename(tmp, path)
+	except (IOError, OSError):
+		# The index is only an optimization.
+		pass
+
+# Load the index for the source file |src|, building it if the source has
+# changed since the index was built.
+def load(src):
+	path = index_path(src)
+	st = os.stat(src)
+	index = read_index(path)
+	if index != None and index.size == st.st_size and index.mtime == st.st_mtime_ns:
+		return index
+
+	with open(src, 'rb') as f:
+		data = f.read()
+	if index == None or index.hash != corpus.content_hash(data):
+		index = build(corpus.from_data(src, data), data)
+	# Record the current size and mtime (even if only the mtime changed).
+	index.size = st.st_size
+	index.mtime = st.st_mtime_ns
+	write_index(path, index)
+	return index
+
+class Reader(object):
+	"""Random access to the conflicts in the source file."""
+
+	def __init__(self, src):
+		self.src = src
+		self.index = load(src)
+		self.file = open(src, 'rb')
+		self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def close(self):
+		self.data.close()
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.close()
+		return False
+
+	# Return the text of |range|.
+	def text(self, range):
+		return self.data[range.start:range.end].decode('utf-8')
+
+	# Return the lines of |range| (without the newlines).
+	def lines(self, range):
+		lines = self.text(range).split('\n')
+		if lines[-1] == '':
+			lines.pop()
+		return lines
+
+	# Return the Range of the conflict or subconflict |id| (or None).
+	def conflict_range(self, id):
+		return self.index.conflicts.get(str(id))
+
+	def page_range(self, page):
+		return self.index.pages.get(str(page))
+
+	# Return the Ranges of each occurrence of the B-clause |id|.
+	def bclause_ranges(self, id):
+		return self.index.bclauses.get_all(str(id))
+
+	# Return the (parsed) corpus.Conflict for the conflict |id|, or None.
+	# Only the lines of the conflict are read and parsed. The line numbers in
+	# the result are for the whole source file.
+	def conflict(self, id):
+		id = str(id)
+		range = self.index.conflicts.get(id)
+		if range == None or not id in self.index.headings:
+			return None
+		(group, subgroup, bclause) = self.index.headings[id]
+		tokens = lexer.tokenize_lines(self.lines(range))
+		c = corpus.Conflict(id, group, subgroup, bclause, range.first_line)
+		sub = None
+		for (i, token) in enumerate(tokens):
+			if token.kind == lexer.PRE:
+				sub = corpus.SubConflict(token.args[0], token.args[1], range.first_line + i)
+				c.subconflicts.append(sub)
+			elif token.kind == lexer.POST:
+				if sub != None:
+					sub.post = token.args[0]
+				sub = None
+			elif token.kind == lexer.BODY:
+				if sub != None:
+					sub.body.append(token.line.strip())
+		return c
+
+def usage():
+	print('Usage: %s lookup <id>|page:<n>|B:<id>' % sys.argv[0])
+
+def main(argv):
+	if len(argv) != 1:
+		usage()
+		sys.exit(1)
+	key = argv[0]
+
+	with Reader('../plotto.txt') as reader:
+		if key.startswith('page:'):
+			ranges = [reader.page_range(key[len('page:'):])]
+		elif key.startswith('B:'):
+			ranges = reader.bclause_ranges(key[len('B:'):])
+		else:
+			ranges = [reader.conflict_range(key)]
+		ranges = [r for r in ranges if r != None]
+		if len(ranges) == 0:
+			error('Not found: %s' % key)
+		for range in ranges:
+			for (i, line) in enumerate(reader.lines(range)):
+				print('%d: %s' % (range.first_line + i + 1, line))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Output files.
+#
+# Documents are collected in memory (see OutputBuffer) and written with a
+# single write to a temporary file that is then renamed over the target, so
+# a partially written file is never visible. Documents can also be written
+# with precompressed siblings (<file>.gz and <file>.br) so that they can be
+# served without compressing them on each request. The .br files need the
+# brotli module (see requirements.txt); without it, only the .gz files are
+# written and a warning is shown.
+#
+# Text is written as UTF-8.
+
+import gzip
+import io
+import os
+import os.path
+import sys
+
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+class OutputBuffer():
+	"""Collects the output document in memory."""
+
+	def __init__(self):
+		self.chunks = []
+
+	def write(self, data):
+		self.chunks.append(data)
+
+	def mark(self):
+		return len(self.chunks)
+
+	# Return everything written since |mark|.
+	def since(self, mark):
+		return ''.join(self.chunks[mark:])
+
+	def getvalue(self):
+		return ''.join(self.chunks)
+
+def gzip_data(data):
+	buf = io.BytesIO()
+	# No file name or timestamp, so that the output only depends on |data|.
+	f = gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=buf, mtime=0)
+	f.write(data)
+	f.close()
+	return buf.getvalue()
+
+def brotli_data(data):
+	return brotli.compress(data, quality=11)
+
+_warned = False
+
+# Compressed siblings as (extension, compress function).
+def compressors():
+	global _warned
+	result = [('.gz', gzip_data)]
+	if brotli != None:
+		result.append(('.br', brotli_data))
+	elif not _warned:
+		print('Warning: the brotli module is not installed, so no .br files are written '
+				'(pip install -r requirements.txt)', file=sys.stderr)
+		_warned = True
+	return result
+
+# Remove the files in |dir| that aren't in |names| (or compressed siblings of
+# them).
+def remove_stale(dir, names):
+	for name in os.listdir(dir):
+		base = name
+		for ext in ['.gz', '.br']:
+			if name.endswith(ext):
+				base = name[:-len(ext)]
+		if not base in names:
+			os.remove(os.path.join(dir, name))
+
+# Write |data| to |dst| via a temporary file, so that |dst| either has the old
+# contents or all of the new contents.
+def write_atomic(dst, data):
+	tmp = '%s.tmp%d' % (dst, os.getpid())
+	try:
+		with open(tmp, 'wb') as f:
+			f.write(data)
+		os.rename(tmp, dst)
+	except:
+		if os.path.exists(tmp):
+			os.remove(tmp)
+		raise
+
+def has_contents(dst, data):
+	if not os.path.isfile(dst) or os.path.getsize(dst) != len(data):
+		return False
+	with open(dst, 'rb') as f:
+		return f.read() == data
+
+# Write |data| (text or bytes) to |dst| unless the file already has exactly
+# those contents.
+# If |compress| is set, then the compressed siblings are written as well;
+# otherwise any old siblings are removed, since they would be out of date.
+# Returns True if anything was written.
+def write_if_changed(dst, data, compress=False):
+	if isinstance(data, str):
+		data = data.encode('utf-8')
+	siblings = []
+	if compress:
+		siblings = [(dst + ext, fn) for (ext, fn) in compressors()]
+	if has_contents(dst, data) and all([os.path.isfile(s) for (s, fn) in siblings]):
+		return False
+	# The siblings are written first so that they are never older than |dst|.
+	for (sibling, fn) in siblings:
+		write_atomic(sibling, fn(data))
+	if not compress:
+		for ext in ['.gz', '.br']:
+			if os.path.isfile(dst + ext):
+				os.remove(dst + ext)
+	write_atomic(dst, data)
+	return True
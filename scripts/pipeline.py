@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Release pipeline: fixup, verify and build in a single pass.
+#
+# Reads plotto.txt once, normalizes the subconflicts (as fixup.py does),
+# verifies the result (as verify.py does) and then builds all the variants
+# (as build-all.py does). All the stages share the parsed corpus, and there
+# is no intermediate file: plotto.txt is only written back if the
+# normalization changed it.
+#
+# Usage: python3 plotto.py pipeline <options>
+
+import getopt
+import multiprocessing
+import sys
+
+import build
+import corpus
+import fixup
+import linkgraph
+import output
+import verify
+
+def error(msg):
+	print('Error: %s' % (msg))
+	sys.exit(1)
+
+# Normalize the subconflicts in |source| (the parsed contents |data| of
+# |src|), writing the result back to |src| if anything changed.
+# Returns the parsed corpus for the normalized text.
+# If |check| is set, then it is an error for the text to change.
+def normalize(src, data, source, check=False):
+	new_data = fixup.Parser().normalize(source).encode('utf-8')
+	if new_data == data:
+		return source
+	if check:
+		error('"%s" is not normalized (run without --check to fix)' % src)
+	try:
+		output.write_if_changed(src, new_data)
+	except (IOError, OSError) as e:
+		error('Unable to open "%s" for writing: %s' % (src, e))
+	print('Normalized', src)
+	return corpus.from_data(src, new_data)
+
+# Run the pipeline on |src| for all the |config_files|.
+# Returns the exit status (non-zero if the source has errors).
+def run(src, config_files, full=False, jobs=1, shard=False, check=False, compress=False):
+	# Load all the configs up front so that errors are reported before
+	# any work is done.
+	configs = [build.load_config(c) for c in config_files]
+	for config in configs:
+		if shard:
+			config['shard'] = True
+		if compress:
+			config['compress'] = True
+
+	try:
+		with open(src, 'rb') as f:
+			data = f.read()
+	except IOError as e:
+		error('Unable to open "%s" for reading: %s' % (src, e))
+	source = corpus.from_data(src, data)
+
+	source = normalize(src, data, source, check)
+
+	manifest = None
+	if not full:
+		manifest = verify.load_manifest(src)
+	diagnostics = verify.verify_source(source, manifest, jobs)
+	for d in diagnostics:
+		print(d.format(src))
+	errors = len([d for d in diagnostics if d.severity == verify.ERROR])
+	if errors != 0:
+		print('%d error(s), %d warning(s)' % (errors, len(diagnostics) - errors))
+		return 1
+
+	index = build.casting_index(source, configs)
+	graph = linkgraph.cached(source)
+	for config in configs:
+		build.build_variant(config, source, not full, index=index, graph=graph)
+	build.write_link_graph(graph, build.link_graph_file)
+	build.write_service_worker(configs, build.service_worker_file)
+	return 0
+
+def usage():
+	print('Usage: %s pipeline <options>' % sys.argv[0])
+	print('where <options> are:')
+	print('  --check')  # fail (instead of rewriting plotto.txt) if it isn't normalized
+	print('  --compress')  # also write compressed copies (.gz, .br) of the output files
+	print('  --full')  # verify and rebuild everything (ignore results from previous runs)
+	print('  --jobs <n>')  # number of worker processes for verify
+	print('  --shard')  # write an index page and load the conflicts on demand
+
+def main(argv):
+	try:
+		opts, args = getopt.getopt(argv,
+			'fj:s',
+			['check', 'compress', 'full', 'jobs=', 'shard'])
+	except getopt.GetoptError:
+		usage()
+		exit()
+
+	check = False
+	compress = False
+	full = False
+	jobs = multiprocessing.cpu_count()
+	shard = False
+	for opt, arg in opts:
+		if opt == '--check':
+			check = True
+		elif opt == '--compress':
+			compress = True
+		elif opt in ('-f', '--full'):
+			full = True
+		elif opt in ('-j', '--jobs'):
+			jobs = int(arg)
+		elif opt in ('-s', '--shard'):
+			shard = True
+
+	sys.exit(run('../plotto.txt', build.config_files, full, jobs, shard, check, compress))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
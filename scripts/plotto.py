@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Run this script from within the scripts/ directory.
+#
+# Command-line entry point for the Plotto tools.
+#
+# Usage: python3 plotto.py <command> <options>
+
+import sys
+
+import analyze
+import chain
+import offsets
+import pipeline
+import typos
+
+commands = {
+	'analyze': analyze.main,  # check and summarize the links between conflicts
+	'chain': chain.main,  # generate masterplot chains
+	'lookup': offsets.main,  # show a conflict, page or B-clause
+	'pipeline': pipeline.main,  # fixup, verify and build in a single pass
+	'typos': typos.main,  # find likely typos
+}
+
+def usage():
+	print('Usage: %s <command> <options>' % sys.argv[0])
+	print('where <command> is one of:')
+	for name in sorted(commands):
+		print('  %s' % name)
+
+def main():
+	if len(sys.argv) < 2 or not sys.argv[1] in commands:
+		usage()
+		sys.exit(1)
+	commands[sys.argv[1]](sys.argv[2:])
+
+if __name__ == '__main__':
+	main()
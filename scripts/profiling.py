@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Profiling support for the --profile option of the tools.
+#
+# Reports the wall time spent in each phase of a run, how often each kind
+# of line (and each stage of the link grammar) was matched and the peak
+# memory use. The cProfile stats can also be saved for use with pstats.
+#
+# The phases are measured by wrapping the functions that implement them
+# (see Profiler.wrap), so there is no cost when profiling is off.
+
+import cProfile
+import time
+import tracemalloc
+
+import lexer
+import links
+
+class Profiler(object):
+	"""Collects the timings and counters for a single run."""
+
+	def __init__(self, stats_file=None):
+		# File to write the cProfile stats to (or None).
+		self.stats_file = stats_file
+		self.cprofile = None
+		# Phase names, in the order they were first used.
+		self.phases = []
+		# Total time and number of calls for each phase.
+		self.times = {}
+		self.calls = {}
+		# Counters for each phase, by key.
+		self.counters = {}
+		self.start_time = None
+		self.total_time = None
+		# Peak memory allocated by Python (in bytes).
+		self.peak_memory = None
+
+	def start(self):
+		tracemalloc.start()
+		# Count the links that are parsed (see links.py).
+		links.stats = {}
+		if self.stats_file:
+			self.cprofile = cProfile.Profile()
+			self.cprofile.enable()
+		self.start_time = time.time()
+
+	def stop(self):
+		self.total_time = time.time() - self.start_time
+		if self.cprofile != None:
+			self.cprofile.disable()
+			self.cprofile.dump_stats(self.stats_file)
+		(current, peak) = tracemalloc.get_traced_memory()
+		self.peak_memory = peak
+		tracemalloc.stop()
+		self.counters['links'] = links.stats
+		links.stats = None
+
+	def add_time(self, phase, elapsed):
+		if not phase in self.times:
+			self.phases.append(phase)
+			self.times[phase] = 0.0
+			self.calls[phase] = 0
+		self.times[phase] += elapsed
+		self.calls[phase] += 1
+
+	def count(self, phase, key):
+		counters = self.counters.setdefault(phase, {})
+		counters[key] = counters.get(key, 0) + 1
+
+	# Time a block of code as |phase|.
+	def phase(self, phase):
+		return Timer(self, phase)
+
+	# Replace the function |name| of |obj| (a module, class or instance) with
+	# one that records the time spent in it as |phase|. If |key| is given,
+	# then the calls are also counted by key(*args).
+	def wrap(self, obj, name, phase, key=None):
+		fn = getattr(obj, name)
+		profiler = self
+
+		def wrapper(*args, **kwargs):
+			if key != None:
+				profiler.count(phase, key(*args))
+			start = time.time()
+			try:
+				return fn(*args, **kwargs)
+			finally:
+				profiler.add_time(phase, time.time() - start)
+
+		setattr(obj, name, wrapper)
+
+	def report(self):
+		print('Profile:')
+		print('  Phases (wall time, including nested phases):')
+		for phase in self.phases:
+			print('    %-24s %8.3fs %8d calls' % (phase, self.times[phase], self.calls[phase]))
+		print('    %-24s %8.3fs' % ('total', self.total_time))
+		for phase in sorted(self.counters):
+			counters = self.counters[phase]
+			if not counters:
+				continue
+			print('  Matches (%s):' % phase)
+			for key in sorted(counters, key=lambda k: (-counters[k], str(k))):
+				print('    %-24s %8d' % (key, counters[key]))
+		print('  Memory (tracemalloc peak): %.1f MB' % (self.peak_memory / (1024.0 * 1024)))
+		if self.stats_file:
+			print('  cProfile stats written to %s' % self.stats_file)
+
+class Timer(object):
+	"""Context manager that records the time taken as a phase."""
+
+	def __init__(self, profiler, phase):
+		self.profiler = profiler
+		self.name = phase
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.profiler.add_time(self.name, time.time() - self.start)
+		return False
+
+# Return the key used to count the |token| kinds in process_token.
+# Comments are counted by directive.
+def token_key(token):
+	if token.kind == lexer.COMMENT:
+		(directive, value) = token.args
+		if directive != None:
+			return '%s %s' % (lexer.COMMENT, directive)
+	return token.kind
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Full-text search index.
+#
+# Builds a compact inverted index that maps each term to the conflicts and
+# subconflicts that contain it. The index is written as JSON and loaded
+# (lazily) by js/search.js, which must tokenize and stem the query in the
+# same way.
+#
+# Index format:
+#   docs: list of document names ('1039', '1039a', ...)
+#   terms: {term: postings}
+# where postings is a comma-separated list of base-36 numbers giving the gap
+# from the previous document index (the first is the index itself). If the
+# term appears more than once in the document, then the gap is followed by
+# ':' and the term count.
+
+import json
+import re
+
+# Common words that are not indexed (when stop words are enabled).
+STOP_WORDS = [
+	'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'from',
+	'has', 'have', 'in', 'into', 'is', 'it', 'its', 'of', 'on', 'or', 'so',
+	'that', 'the', 'their', 'them', 'then', 'there', 'they', 'this', 'to',
+	'was', 'were', 'which', 'who', 'whom', 'with',
+]
+
+_re_word = re.compile(r'[a-z]+')
+# Links and tags are not part of the text: (123 ch A to B) @{123}
+_re_link = re.compile(r'\(\d[^)]*\)|@{[^}]*}')
+
+_digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+def base36(n):
+	if n == 0:
+		return '0'
+	s = ''
+	while n != 0:
+		s = _digits[n % 36] + s
+		n //= 36
+	return s
+
+# Strip common suffixes from |word|.
+# This is intentionally simple since it must match stem() in js/search.js.
+def stem(word):
+	if len(word) > 4 and word.endswith('ies'):
+		return word[:-3] + 'y'
+	if len(word) > 4 and (word.endswith('sses') or word.endswith('shes') or word.endswith('ches')):
+		return word[:-2]
+	if len(word) > 3 and word.endswith('s') and not word.endswith('ss') and not word.endswith('us'):
+		word = word[:-1]
+	if len(word) > 5 and word.endswith('ing'):
+		return word[:-3]
+	if len(word) > 4 and word.endswith('ed'):
+		return word[:-2]
+	return word
+
+class Index(object):
+	"""Inverted index builder."""
+
+	def __init__(self, stemming=True, stop_words=True):
+		self.stemming = stemming
+		self.stop_words = set(STOP_WORDS) if stop_words else set()
+		self.docs = []
+		# Map from term to list of [doc index, count].
+		self.postings = {}
+
+	def terms(self, text):
+		text = _re_link.sub(' ', text.lower())
+		result = []
+		for word in _re_word.findall(text):
+			if word in self.stop_words:
+				continue
+			if self.stemming:
+				word = stem(word)
+			result.append(word)
+		return result
+
+	def add(self, name, text):
+		doc = len(self.docs)
+		self.docs.append(name)
+		for term in self.terms(text):
+			p = self.postings.get(term)
+			if p == None:
+				self.postings[term] = [[doc, 1]]
+			elif p[-1][0] == doc:
+				p[-1][1] += 1
+			else:
+				p.append([doc, 1])
+
+	def encode(self, postings):
+		result = []
+		prev = 0
+		for (doc, count) in postings:
+			entry = base36(doc - prev)
+			if count != 1:
+				entry += ':' + base36(count)
+			result.append(entry)
+			prev = doc
+		return ','.join(result)
+
+	def to_json(self):
+		terms = {}
+		for term in self.postings:
+			terms[term] = self.encode(self.postings[term])
+		data = {
+			'docs': self.docs,
+			'stemming': self.stemming,
+			'stop_words': sorted(self.stop_words),
+			'terms': terms,
+		}
+		return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+# Return the search index for the (name, text) |docs|.
+def build(docs, stemming=True, stop_words=True):
+	index = Index(stemming, stop_words)
+	for (name, text) in docs:
+		index.add(name, text)
+	return index
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Sharded HTML output.
+#
+# Splits the rendered Plotto document into a light index page (front matter,
+# table of contents and a map from conflict id to shard) and one shard file
+# per group of conflicts. js/shard.js loads the shards on demand.
+#
+# build.py marks the boundaries in the document with the comments below.
+
+import json
+import os
+import os.path
+import re
+
+import output
+
+# Marks the start and end of the conflict section.
+MARK_BEGIN = '<!-- conflicts -->\n'
+MARK_END = '<!-- /conflicts -->\n'
+# Marks the start of each shard.
+MARK_SHARD = '<!-- shard -->\n'
+
+_re_group = re.compile(r'<div class="group">(.*?)</div>')
+_re_subgroup = re.compile(r'<div class="subgroup">(.*?)</div>')
+_re_conflict = re.compile(r'<div class="conflict" id="(\d+)">')
+
+def shard_dir(dst):
+	return os.path.splitext(dst)[0]
+
+def shard_name(index):
+	return 'group-%d.html' % (index + 1)
+
+class Shard(object):
+	"""A single group of conflicts."""
+
+	def __init__(self, index, html):
+		self.index = index
+		self.html = html
+
+		m = _re_group.search(html)
+		self.group = m.group(1) if m else ''
+		m = _re_subgroup.search(html)
+		self.subgroup = m.group(1) if m else ''
+
+		ids = [int(id) for id in _re_conflict.findall(html)]
+		self.first = min(ids) if ids else None
+		self.last = max(ids) if ids else None
+
+# Split the |html| document into (before, shards, after).
+def split(html):
+	begin = html.index(MARK_BEGIN)
+	end = html.index(MARK_END)
+	before = html[:begin]
+	after = html[end + len(MARK_END):]
+
+	parts = html[begin + len(MARK_BEGIN):end].split(MARK_SHARD)
+	# Anything before the first shard stays in the index page.
+	before += parts[0]
+	shards = [Shard(i, h) for (i, h) in enumerate(parts[1:])]
+	return (before, shards, after)
+
+def write_toc(shards):
+	toc = ['<div class="toc">\n']
+	for s in shards:
+		if s.first == None:
+			continue
+		name = s.group
+		if s.subgroup != '':
+			name += ': ' + s.subgroup
+		toc.append('<div class="tocentry"><a href="#{0}">{1}</a> <span class="tocrange">{0}&ndash;{2}</span></div>\n'.format(
+				s.first, name, s.last))
+	toc.append('</div>\n')
+	return ''.join(toc)
+
+# Write the index page to |dst| and the shards into the directory next to it.
+# Shards that are no longer used are removed.
+# If |compress| is set, then compressed copies of each file are written too.
+def write(html, dst, compress=False):
+	(before, shards, after) = split(html)
+
+	dir = shard_dir(dst)
+	if not os.path.isdir(dir):
+		os.makedirs(dir)
+	# Path of the shards relative to the index page.
+	rel_dir = os.path.basename(dir)
+
+	shard_map = []
+	placeholders = []
+	files = set()
+	for s in shards:
+		file = shard_name(s.index)
+		output.write_if_changed(os.path.join(dir, file), s.html, compress)
+		files.add(file)
+		shard_map.append({'file': rel_dir + '/' + file, 'first': s.first, 'last': s.last})
+		placeholders.append('<div class="shard" id="shard-%d"></div>\n' % s.index)
+
+	index = [
+		before,
+		write_toc(shards),
+		'<script>var plottoShards = %s;</script>\n' % json.dumps(shard_map, sort_keys=True),
+		''.join(placeholders),
+		after,
+	]
+	output.write_if_changed(dst, ''.join(index), compress)
+
+	# The index page no longer refers to the old shards.
+	output.remove_stale(dir, files)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Transformations of the characters in a conflict.
+#
+# A link can ask for the characters in the target conflict to be changed
+# ("(1035 ch A-2 to A-4)", "(478 tr A & B)"). Each distinct list of
+# transformations (see links.Transform) is compiled once into a Program: a
+# single substitution over the character tokens (like A, B-3 or F-A) that
+# applies all of the transformations at once. So "ch U to A & A to NW"
+# changes U to A and (the original) A to NW.
+#
+# build.py uses the programs to write the transformed text of the target of
+# each transformed link into a views file (<output_file>-views.json), which
+# js/views.js shows when the link is clicked.
+#
+# Views format:
+#   {<link text>: {id, label, subconflicts}}
+# where <link text> is the text of a single target of a link ('1035 ch A-2
+# to A-4') and subconflicts is a list of [name, transformed text].
+
+import json
+import re
+
+import genderswap
+
+# Characters that can't be next to a character token (so that the 'A' in
+# 'F-A' or 'A-2' is not matched as 'A').
+_boundary = r'\w-'
+
+# The character A (which can also be the determiner 'a' at the start of a
+# sentence, see the "-- A" annotations).
+_re_a = re.compile(r'(?<![%s])A(?![%s])' % (_boundary, _boundary))
+
+# A marker between the parts of a conflict: '*', '**', ...
+_re_part_marker = re.compile(r'(?<!\*)(\*+)(?!\*)')
+
+# Return the character or text for the transformation argument |arg| (quoted
+# text is given as “text”).
+def _arg(arg):
+	if arg.startswith('“') and arg.endswith('”'):
+		return arg[1:-1]
+	return arg
+
+class Program(object):
+	"""A compiled list of transformations."""
+
+	def __init__(self, transforms):
+		# Map from each character (or text) to its replacement.
+		self.map = {}
+		# (character, replacement) for the last occurrence of the character.
+		self.last = []
+		# Text to remove.
+		self.eliminate = []
+		# Characters that are added (which don't change the text).
+		self.add = []
+		for (op, args) in transforms:
+			args = [_arg(a) for a in args]
+			if op == 'tr':
+				self.map[args[0]] = args[1]
+				self.map[args[1]] = args[0]
+			elif op == 'ch':
+				self.map[args[0]] = args[1]
+			elif op == 'ch_last':
+				self.last.append((args[0], args[1]))
+			elif op == 'eliminate':
+				self.eliminate.append(args[0])
+			elif op == 'add':
+				self.add.append(args[0])
+
+		words = set(self.map) | set([c for (c, new_c) in self.last])
+		self.re_char = None
+		if len(words) != 0:
+			self.re_char = re.compile('(?<![%s])%s(?![%s])' % (
+					_boundary, genderswap.trie_pattern(words), _boundary))
+
+	# Return |text| with the transformations applied.
+	# |determiners| is the set of the A tokens (by index, see determiners())
+	# that are the determiner 'a' rather than the character.
+	def apply(self, text, determiners=()):
+		for phrase in self.eliminate:
+			text = text.replace('“%s”' % phrase, '').replace(phrase, '')
+		text = re.sub(' +', ' ', text).strip()
+		if self.re_char == None:
+			return text
+
+		matches = list(self.re_char.finditer(text))
+		last = {}
+		for (c, new_c) in self.last:
+			found = [i for (i, m) in enumerate(matches) if m.group(0) == c]
+			if len(found) != 0:
+				last[found[-1]] = new_c
+
+		result = []
+		pos = 0
+		a_count = 0
+		for (i, m) in enumerate(matches):
+			c = m.group(0)
+			if c == 'A':
+				a_count += 1
+				if (a_count - 1) in determiners:
+					continue
+			result.append(text[pos:m.start()])
+			result.append(last.get(i, self.map.get(c, c)))
+			pos = m.end()
+		result.append(text[pos:])
+		return ''.join(result)
+
+_cache = {}
+
+# Return the (op, args) for each of the |transforms| (links.Transform).
+def pack(transforms):
+	return tuple([(t.op, tuple(t.args)) for t in transforms])
+
+# Return the Program for the |transforms| (as returned by pack()).
+def compile(transforms):
+	key = tuple(transforms)
+	program = _cache.get(key)
+	if program == None:
+		program = Program(transforms)
+		_cache[key] = program
+	return program
+
+# Return the indexes of the A tokens in the |lines| of text that are the
+# determiner 'a'. |annotations| has the value of the "-- A" annotation (a
+# list of 'det' or 'char' for each A on the line) for each line, or None.
+def determiners(lines, annotations):
+	result = []
+	count = 0
+	for (line, annotation) in zip(lines, annotations):
+		n = len(_re_a.findall(line.strip()))
+		if annotation:
+			for (i, kind) in enumerate(annotation[:n]):
+				if kind == 'det':
+					result.append(count + i)
+		count += n
+	return tuple(result)
+
+# Return the |part| ('-*', '*-**', ...) of the |text| of a conflict, or all
+# of the text if it doesn't have that part.
+def select_part(text, part):
+	if part == '':
+		return text
+	(start, end) = part.split('-')
+	pieces = _re_part_marker.split(text)
+	# pieces alternates text and markers: [text, '*', text, '**', text]
+	begin = 0
+	if start != '':
+		if not start in pieces[1::2]:
+			return text
+		begin = pieces.index(start) + 1
+	if not end in pieces[begin + 1::2]:
+		return text
+	finish = pieces.index(end, begin)
+	return ''.join(pieces[begin:finish]).strip()
+
+# Return the views file for the |links| (a list of (link text, id, subids,
+# label, part, transforms)) given the |texts| (a map from each conflict and
+# subconflict to (text, determiners)) and |subids| (a map from each conflict
+# to the ids of its subconflicts).
+def build_views(links, texts, subids):
+	views = {}
+	for (text, id, target_subids, label, part, transforms) in links:
+		if text in views or not id in subids:
+			continue
+		program = compile(transforms)
+		names = [id + s for s in (target_subids or subids[id])]
+		subconflicts = []
+		for name in names:
+			if name in texts:
+				(body, dets) = texts[name]
+				subconflicts.append([name, select_part(program.apply(body, dets), part)])
+		views[text] = {'id': id, 'label': label, 'subconflicts': subconflicts}
+	return json.dumps(views, sort_keys=True, separators=(',', ':'))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Typo finder.
+#
+# Finds the rare words in plotto.txt that are a small edit distance away
+# from a common word (like "marriaqe" for "marriage"). The common words are
+# indexed by their deletes (as in SymSpell): each word is stored under every
+# string that can be made by deleting up to |max_distance| characters from
+# it. The candidates for a rare word are then found by looking up its own
+# deletes, rather than by comparing it against every word in the vocabulary.
+#
+# Words that are in the reference word lists are never reported. The list of
+# the words in plotto.txt that are spelled correctly (typos-words.txt) is
+# always used, so only the misspellings and new words are checked.
+#
+# Usage: python3 plotto.py typos <options>
+
+import getopt
+import os.path
+import re
+import sys
+
+import corpus
+import lexer
+
+# Reference word list of the correctly spelled words in plotto.txt.
+CORPUS_WORDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'typos-words.txt')
+
+# Default additional reference word list (if it exists).
+DEFAULT_WORDS = '/usr/share/dict/words'
+
+# Only the first PREFIX_LENGTH characters of each word are indexed, which
+# bounds the number of deletes for long words. The candidates are checked
+# against the whole word.
+PREFIX_LENGTH = 7
+
+# Words shorter than this are not checked (too many short words are a
+# single edit away from each other).
+MIN_LENGTH = 4
+# Words shorter than this are only checked for a distance of 1.
+MIN_LENGTH_DISTANCE_2 = 7
+
+# Suffixes that make a different form of the same word (like 'threat' and
+# 'threats'), rather than a typo.
+INFLECTIONS = ['s', 'es', 'd', 'ed', 'r', 'er', 'ing', 'ly']
+
+_re_word = re.compile(r'[A-Za-z]+')
+# Links and tags are not part of the text: (123 ch A to B) @{123}
+_re_link = re.compile(r'\(\d[^)]*\)|@{[^}]*}')
+
+def error(msg):
+	print('Error: %s' % (msg), file=sys.stderr)
+	sys.exit(1)
+
+# Return the set of strings made by deleting up to |distance| characters
+# from |word| (including |word| itself).
+def deletes(word, distance):
+	result = set([word])
+	edge = [word]
+	for d in range(distance):
+		next_edge = []
+		for w in edge:
+			for i in range(len(w)):
+				new_word = w[:i] + w[i+1:]
+				if not new_word in result:
+					result.add(new_word)
+					next_edge.append(new_word)
+		edge = next_edge
+	return result
+
+# Return the edit distance between |a| and |b| (insertions, deletions,
+# substitutions and transpositions of adjacent characters), or None if it is
+# more than |max_distance|.
+def distance(a, b, max_distance):
+	if abs(len(a) - len(b)) > max_distance:
+		return None
+	prev2 = None
+	prev = list(range(len(b) + 1))
+	for i in range(1, len(a) + 1):
+		row = [i] + [0] * len(b)
+		for j in range(1, len(b) + 1):
+			cost = 0 if a[i-1] == b[j-1] else 1
+			row[j] = min(prev[j] + 1, row[j-1] + 1, prev[j-1] + cost)
+			if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+				row[j] = min(row[j], prev2[j-2] + 1)
+		if min(row) > max_distance:
+			return None
+		prev2 = prev
+		prev = row
+	if prev[-1] > max_distance:
+		return None
+	return prev[-1]
+
+# Return True if |a| and |b| are different forms of the same word.
+def is_inflection(a, b):
+	if len(a) > len(b):
+		(a, b) = (b, a)
+	return b.startswith(a) and b[len(a):] in INFLECTIONS
+
+class DeleteIndex(object):
+	"""Symmetric delete index for finding words within an edit distance."""
+
+	def __init__(self, max_distance):
+		self.max_distance = max_distance
+		# Map from each delete to the words that it was made from.
+		self.deletes = {}
+
+	def add(self, word):
+		for d in deletes(word[:PREFIX_LENGTH], self.max_distance):
+			self.deletes.setdefault(d, []).append(word)
+
+	# Return a list of (distance, word) for the words in the index (other
+	# than |word| itself) that are within |max_distance| of |word|.
+	def lookup(self, word, max_distance):
+		candidates = set()
+		for d in deletes(word[:PREFIX_LENGTH], max_distance):
+			candidates.update(self.deletes.get(d, ()))
+		candidates.discard(word)
+		result = []
+		for c in candidates:
+			dist = distance(word, c, max_distance)
+			if dist != None:
+				result.append((dist, c))
+		return result
+
+class Occurrence(object):
+	"""A word in the source text."""
+
+	__slots__ = ('line', 'id')
+
+	def __init__(self, line, id):
+		# Index of the line in the source.
+		self.line = line
+		# Conflict (and subconflict) id, or '' outside of the conflicts.
+		self.id = id
+
+class Typo(object):
+	"""A rare word and the common words that it is close to."""
+
+	def __init__(self, word, occurrences, suggestions):
+		self.word = word
+		self.occurrences = occurrences
+		# List of (distance, count, word), best first.
+		self.suggestions = suggestions
+
+	# Return the report for the |occurrence| of the word in |src|.
+	def format(self, src, occurrence):
+		suggestions = ', '.join(['%s (%d)' % (w, count)
+				for (dist, count, w) in self.suggestions])
+		return '%s:%d: %s: %s -> %s' % (src, occurrence.line + 1,
+				occurrence.id or '-', self.word, suggestions)
+
+# Return the map from each (lowercased) word in |source| to the list of its
+# Occurrences.
+def collect_words(source):
+	words = {}
+	id = ''
+	subid = ''
+	for (i, token) in enumerate(source.tokens()):
+		kind = token.kind
+		if kind == lexer.CONFLICT:
+			(id, subid) = (token.args[0], '')
+		elif kind == lexer.PRE:
+			subid = token.args[0]
+		elif kind in (lexer.GROUP, lexer.SUBGROUP, lexer.BCLAUSE):
+			(id, subid) = ('', '')
+		elif kind == lexer.COMMENT and token.args == ('page', '190'):
+			(id, subid) = ('', '')
+		if not kind in (lexer.BODY, lexer.BCLAUSE):
+			continue
+		text = _re_link.sub(' ', token.line)
+		for word in _re_word.findall(text):
+			words.setdefault(word.lower(), []).append(Occurrence(i, id + subid))
+	return words
+
+# Return the set of (lowercased) words in the word list |path|.
+# Each line is a word, optionally preceded by a count (as in dict.txt).
+# Lines starting with '#' are ignored.
+def load_words(path):
+	words = set()
+	with open(path, 'r', encoding='utf-8', errors='replace') as f:
+		for line in f:
+			fields = line.split()
+			if len(fields) != 0 and fields[0][0] != '#':
+				words.add(fields[-1].lower())
+	return words
+
+# Return the list of Typos in |source|.
+# Words that occur at most |max_rare| times are checked against the words
+# that occur at least |min_common| times. Words in |known_words| are never
+# reported.
+def find(source, known_words=set(), max_distance=2, max_rare=2, min_common=5):
+	words = collect_words(source)
+
+	index = DeleteIndex(max_distance)
+	for (word, occurrences) in words.items():
+		if len(occurrences) >= min_common:
+			index.add(word)
+
+	typos = []
+	for (word, occurrences) in words.items():
+		if len(occurrences) > max_rare or len(word) < MIN_LENGTH or word in known_words:
+			continue
+		max_dist = max_distance
+		if len(word) < MIN_LENGTH_DISTANCE_2:
+			max_dist = min(max_distance, 1)
+		matches = [(dist, w) for (dist, w) in index.lookup(word, max_dist)
+				if not is_inflection(word, w)]
+		if len(matches) == 0:
+			continue
+		suggestions = sorted([(dist, -len(words[w]), w) for (dist, w) in matches])
+		best = suggestions[0][0]
+		suggestions = [(dist, -count, w) for (dist, count, w) in suggestions if dist == best]
+		typos.append(Typo(word, occurrences, suggestions))
+	return typos
+
+def usage():
+	print('Usage: %s typos <options>' % sys.argv[0])
+	print('where <options> are:')
+	print('  --words <file>')  # additional reference word list (default /usr/share/dict/words, if it exists)
+	print('  --max-distance <n>')  # max edit distance to a common word (default 2)
+	print('  --max-rare <n>')  # check words that occur at most n times (default 2)
+	print('  --min-common <n>')  # compare against words that occur at least n times (default 5)
+
+def main(argv):
+	try:
+		opts, args = getopt.getopt(argv,
+			'w:d:',
+			['words=', 'max-distance=', 'max-rare=', 'min-common='])
+	except getopt.GetoptError:
+		usage()
+		exit()
+
+	words_file = None
+	if os.path.isfile(DEFAULT_WORDS):
+		words_file = DEFAULT_WORDS
+	options = {}
+	for opt, arg in opts:
+		if opt in ('-w', '--words'):
+			words_file = arg
+		elif opt in ('-d', '--max-distance'):
+			options['max_distance'] = int(arg)
+		elif opt == '--max-rare':
+			options['max_rare'] = int(arg)
+		elif opt == '--min-common':
+			options['min_common'] = int(arg)
+
+	known_words = set()
+	for path in [CORPUS_WORDS, words_file]:
+		if path == None:
+			continue
+		try:
+			known_words |= load_words(path)
+		except IOError as e:
+			error('Unable to open "%s" for reading: %s' % (path, e))
+
+	infilename = '../plotto.txt'
+	source = corpus.load(infilename)
+	reports = []
+	for typo in find(source, known_words, **options):
+		for o in typo.occurrences:
+			reports.append((o.line, typo.format(infilename, o)))
+	for (line, report) in sorted(reports):
+		print(report)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -1,15 +1,64 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import bisect
+import getopt
+import json
+import multiprocessing
 import os.path
 import re
 import subprocess
 import sys
 
+import corpus
+import incremental
+import lexer
+import links
+import profiling
+
 def error(msg):
-	print 'Error: %s' % (msg)
+	print('Error: %s' % (msg))
 	sys.exit(1)
 
+# A {-tag at the start of a line: B{, Conflict{, ...
+re_tag = re.compile(r'^(.+){')
+
+# Q&D regex to catch obviously incorrect chars in links.
+re_post_link = re.compile(r'^\(([a-zA-Z\d “”’&\*,;-]*)\) ?(.*)$')
+
+# The next parenthetical in the conflict text.
+re_parenthetical = re.compile(r'[^(]*\(([^)]+)\)')
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Number of blocks (conflicts) verified by a worker in a single batch.
+BATCH_SIZE = 64
+
+class Diagnostic(object):
+	"""An error or warning found in the source."""
+
+	__slots__ = ['line', 'id', 'severity', 'message']
+
+	def __init__(self, line, id, severity, message):
+		self.line = line
+		self.id = id
+		self.severity = severity
+		self.message = message
+
+	def to_tuple(self):
+		return (self.line, self.id, self.severity, self.message)
+
+	def to_json(self):
+		return {'line': self.line, 'conflict': self.id,
+				'severity': self.severity, 'message': self.message}
+
+	def format(self, src):
+		where = '%s:%d:' % (src, self.line)
+		if self.id:
+			where += ' %s:' % self.id
+		return '%s %s: %s' % (where, self.severity, self.message)
+
 class Parser():
 	"""Verify script for Plotto"""
 
@@ -18,238 +67,287 @@ class Parser():
 		self.in_conflict = False
 		self.id = 0
 
+		# Line number of the token being processed.
+		self.line_no = 0
+
+		# Text of the current subconflict, with the line number of each line.
 		self.conflict_text = []
+		self.conflict_lines = []
 		self.links = {}
 
-	def validate_link(self, link):
-		# Only match S in certain contexts since it is often a mistake for 3 or 8.
-		char = ('('
-				# Must be first to avoid partial matches: e.g., B vs. BR-B
-				'AUX|BR-A|BR-B|'
-				'A(X|-[1-9])?|'
-				'B(X|-[2-58])?|'
-				'(D|F|GF|M|NW|P|SN|SR|U)-A|'
-				'(D|F|GF|M|SM|SN|SR)-B|'
-				'CH|CN|D|FA|FB|GCH|NW|SN|SR|SX|U|X|'
-				'“.*?”'
-				')')
-
-		# Sequence: (123; 234)
-		if ';' in link:
-			links = link.split(';')
-			for l in links:
-				l = l.strip()
-				if not self.validate_link(l):
-					return False
-			return True
-
-		# Alternation: (123 or 234)
-		if ' or ' in link:
-			links = link.split(' or ')
-			for l in links:
-				l = l.strip()
-				if not self.validate_link(l):
-					return False
-			return True
-
-		# (a), (b), (c), ...
-		# This should only be allowed as the first link in the list.
-		if re.match(r'^[a-h]$', link):
-			return True
-		# ()
-		if re.match(r'^$', link):
-			return True
-
-		# (123a, b, c)
-		m = re.match(r'^\d+([a-h](, [a-h])*)?(?P<extra>.*)$', link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# -1-2-3
-		m = re.match(r'^(-1)?(-2)?(-3)?(-4)?(?P<extra>.*)$', link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# -*, -**, *-**
-		m = re.match(r'^( -\*{1,4}| \*-\*{2,4}| \*{2}-\*{3,4}| \*{3}-\*{4,5}| \*{4}-\*{5})?(?P<extra>.*)$', link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# transpose & change
-		m = re.match(r'^( tr %s & %s(,| &) ch %s to %s)?(?P<extra>.*)$' % (char, char, char, char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# transpose & eliminate
-		m = re.match(r'^( tr %s & %s and eliminate “.*”)?(?P<extra>.*)$' % (char, char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# transpose
-		m = re.match(r'^( tr %s & %s)?(?P<extra>.*)$' % (char, char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# change & transpose
-		m = re.match(r'^( ch %s to %s & tr %s & %s)?(?P<extra>.*)$' % (char, char, char, char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# change & add
-		m = re.match(r'^( ch %s to %s(, %s to %s)* & add %s)?(?P<extra>.*)$' % (char, char, char, char, char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# change & eliminate
-		m = re.match(r'^( ch %s to %s & eliminate “.*”)?(?P<extra>.*)$' % (char, char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# change: A to B & X and Y to Z
-		m = re.match(r'^( ch %s to %s & %s and %s to %s)?(?P<extra>.*)$' % (char, char, char, char, char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# change: A to B & LAST X to Y
-		m = re.match(r'^( ch %s to %s & last %s to %s)?(?P<extra>.*)$' % (char, char, char, char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# change
-		m = re.match(r'^( ch %s to %s((, %s to %s)* (&|and) %s to %s)?)?(?P<extra>.*)$' % (char, char, char, char, char, char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# add
-		m = re.match(r'^( add %s)?(?P<extra>.*)$' % (char), link)
-		if not m:
-			return False
-		link = m.group('extra')
-
-		# add
-		m = re.match(r'^(, (“.*”|(with|son|daughter|mother).*))?$', link)
-		if not m:
-			return False
-		link = ''
-
-		return len(link) == 0
+		# Errors and warnings reported for the current block.
+		self.diagnostics = []
+
+	def report(self, severity, msg, line_no=None):
+		if line_no == None:
+			line_no = self.line_no
+		id = str(self.id) if self.id else ''
+		self.diagnostics.append(Diagnostic(line_no, id, severity, msg))
+
+	def error(self, msg, line_no=None):
+		self.report(ERROR, msg, line_no)
+
+	def warn(self, msg, line_no=None):
+		self.report(WARNING, msg, line_no)
 
 	def verify_conflict_text(self):
 		text = ' '.join([x.strip() for x in self.conflict_text])
-
-		done = False
-		while not done:
-			m = re.match(r'^([^(]*)\(([^)]+)\)(.*)$', text)
-			if m:
-				pre = m.group(1)
-				link = m.group(2)
-				post = m.group(3)
-				if link[0].isdigit():
-					if not self.validate_link(link):
-						error('%s: found, but unable to parse: %s' % (self.id, link))
-				else:
-					print '{0} ignoring parenthetical ({1})'.format(self.id, link)
-				text = post
+		# Offset of each line in |text|.
+		offsets = []
+		pos = 0
+		for x in self.conflict_text:
+			offsets.append(pos)
+			pos += len(x.strip()) + 1
+
+		pos = 0
+		while True:
+			m = re_parenthetical.match(text, pos)
+			if not m:
+				break
+			link = m.group(1)
+			line_no = self.conflict_lines[bisect.bisect_right(offsets, m.start(1)) - 1]
+			if link[0].isdigit():
+				if not links.parse(link).valid:
+					self.error('found, but unable to parse: %s' % link, line_no)
 			else:
-				done = True
+				self.warn('ignoring parenthetical (%s)' % link, line_no)
+			pos = m.end()
 
 	# Process an entire line from the file.
 	def process_line(self, line):
-		# Conflicts end on page 190.
-		m = re.match(r'^-- page 190$', line)
-		if m:
-			self.in_conflict_section = False
-			return
-
-		# Ignore comments.
-		m = re.match(r'^--', line)
-		if m:
+		self.process_token(lexer.tokenize(line))
+
+	# Process a single (lexed) line from the file.
+	def process_token(self, token):
+		kind = token.kind
+		line = token.line
+
+		if kind == lexer.COMMENT:
+			# Conflicts end on page 190.
+			if token.args == ('page', '190'):
+				self.in_conflict_section = False
+			# Ignore comments.
 			return
 
 		# Make sure that all {-tags are valid.
-		m = re.match(r'^(.+){', line)
-		if m and not m.group(1) in ['B', 'Conflict', 'ConflictGroup', 'ConflictSubGroup']:
-			# Allow @{} in the middle of lines.
-			if m.group(1)[-1] != '@':
-				print line,
-				error('Invalid token')
-
-		m = re.match(r'^Conflict{(\d+)}$', line)
-		if m:
-			self.id = int(m.group(1))
+		if '{' in line:
+			m = re_tag.match(line)
+			if m and not m.group(1) in ['B', 'Conflict', 'ConflictGroup', 'ConflictSubGroup']:
+				# Allow @{} in the middle of lines.
+				if m.group(1)[-1] != '@':
+					self.error('invalid token: %s' % line)
+
+		if kind == lexer.CONFLICT:
+			self.id = int(token.args[0])
 			self.links[self.id] = []
 			return
 
-		m = re.match(r'^(\((?P<subid>[a-m])\) )?PRE: (.*)$', line)
-		if m:
+		if kind == lexer.PRE:
 			self.in_conflict_section = True
 			self.in_conflict = True
 			self.conflict_text = []
-			subid = m.group('subid')
+			self.conflict_lines = []
+			subid = token.args[0]
 			if not subid:
 				subid = '-'
 			elif subid != 'a':
 				# Make sure previous letter of alphabet is already present.
-				prev = self.links[self.id][-1]
+				subids = self.links.get(self.id, [])
+				prev = subids[-1] if subids else None
 				prev_expected = chr(ord(subid) - 1)
 				if prev != prev_expected:
-					print self.id, subid, prev, prev_expected
-			self.links[self.id].append(subid)
-			#print 'adding', self.id, subid
+					self.warn('subconflict %s follows %s (expected %s)' % (subid, prev, prev_expected))
+			self.links.setdefault(self.id, []).append(subid)
 			return
 
-		m = re.match(r'^POST: (.*)$', line)
-		if m:
+		if kind == lexer.POST:
 			self.in_conflict = False
 			self.verify_conflict_text()
-			line2 = m.group(1)
+			line2 = token.args[0]
 			while len(line2) != 0:
 				# Q&D regex to catch obviously incorrect chars.
-				m = re.match(r'^\(([a-zA-Z\d “”’&\*,;-]*)\) ?(.*)$', line2)
-				if m:
-					line2 = m.group(2)
-					if not self.validate_link(m.group(1)):
-						error('%s: found, but unable to parse: %s' % (self.id, m.group(1)))
-				else:
-					print line2
-					error('%s: not found' % self.id)
+				m = re_post_link.match(line2)
+				if not m:
+					self.error('link not found: %s' % line2)
+					break
+				line2 = m.group(2)
+				if not links.parse(m.group(1)).valid:
+					self.error('found, but unable to parse: %s' % m.group(1))
 
 		if self.in_conflict_section and self.in_conflict:
 			self.conflict_text.append(line)
-
-
-	def process(self, src):
-		if not os.path.isfile(src):
-			error('File "%s" doesn\'t exist' % src)
-
-		try:
-			infile = open(src, 'r')
-		except IOError as e:
-			error('Unable to open "%s" for reading: %s' % (src, e))
-
-		for line in infile:
-			self.process_line(line)
-
-		infile.close()
-
+			self.conflict_lines.append(self.line_no)
+
+	# Verify the lines [start, end) of |source|, returning the diagnostics.
+	# Each block (see incremental.split_blocks) starts with a fresh parser,
+	# so the blocks can be verified independently (and in parallel).
+	def process_block(self, source, start, end):
+		self.__init__()
+		for (i, token) in enumerate(source.tokens(start, end)):
+			self.line_no = start + i + 1
+			self.process_token(token)
+		return self.diagnostics
+
+# The parsed source shared by all the worker processes.
+worker_source = None
+
+def init_worker(source):
+	global worker_source
+	worker_source = source
+
+# Verify a batch of blocks, returning a list of diagnostics (as tuples) for
+# each block.
+def verify_batch(blocks):
+	parser = Parser()
+	result = []
+	for (start, end) in blocks:
+		diagnostics = parser.process_block(worker_source, start, end)
+		result.append(tuple([d.to_tuple() for d in diagnostics]))
+	return result
+
+# Verify the file |src| and return a list of all the diagnostics, sorted by
+# line.
+# If a |manifest| is given, then only the conflicts that have changed since
+# the last verification are checked again.
+# The blocks are verified by |jobs| worker processes.
+def verify(src, manifest=None, jobs=1):
+	if not os.path.isfile(src):
+		error('File "%s" doesn\'t exist' % src)
+
+	try:
+		source = corpus.load(src)
+	except IOError as e:
+		error('Unable to open "%s" for reading: %s' % (src, e))
+	return verify_source(source, manifest, jobs)
+
+# Verify the (already parsed) |source|, as verify() does.
+def verify_source(source, manifest=None, jobs=1):
+	blocks = incremental.split_blocks(source)
+	results = [None] * len(blocks)
+	fps = [None] * len(blocks)
+	if manifest != None:
+		for (i, (start, end)) in enumerate(blocks):
+			fps[i] = incremental.fingerprint(source, start, end, ())
+			results[i] = manifest.get(fps[i])
+	todo = [i for i in range(len(blocks)) if results[i] == None]
+
+	batches = [todo[i:i + BATCH_SIZE] for i in range(0, len(todo), BATCH_SIZE)]
+	block_batches = [[blocks[i] for i in batch] for batch in batches]
+	if jobs <= 1 or len(batches) <= 1:
+		init_worker(source)
+		batch_results = [verify_batch(b) for b in block_batches]
+	else:
+		pool = multiprocessing.Pool(min(jobs, len(batches)), init_worker, (source,))
+		batch_results = pool.map(verify_batch, block_batches)
+		pool.close()
+		pool.join()
+
+	for (batch, batch_result) in zip(batches, batch_results):
+		for (i, diagnostics) in zip(batch, batch_result):
+			results[i] = diagnostics
+			if manifest != None:
+				manifest.put(fps[i], diagnostics)
+	if manifest != None:
+		manifest.save()
+
+	diagnostics = [Diagnostic(*d) for r in results for d in r]
+	diagnostics.sort(key=lambda d: d.line)
+	return diagnostics
+
+# Return the manifest with the results from the last verification of |src|.
+def load_manifest(src):
+	manifest = incremental.Manifest(
+			incremental.manifest_path(src, 'verify'),
+			incremental.code_key([__file__, lexer.__file__, links.__file__], {}))
+	manifest.load()
+	return manifest
+
+def write_json_report(dst, src, diagnostics):
+	report = {
+		'source': src,
+		'errors': len([d for d in diagnostics if d.severity == ERROR]),
+		'warnings': len([d for d in diagnostics if d.severity == WARNING]),
+		'diagnostics': [d.to_json() for d in diagnostics],
+	}
+	try:
+		with open(dst, 'w') as f:
+			json.dump(report, f, indent=2, sort_keys=True)
+			f.write('\n')
+	except IOError as e:
+		error('Unable to open "%s" for writing: %s' % (dst, e))
+
+def usage():
+	print('Usage: %s <options>' % sys.argv[0])
+	print('where <options> are:')
+	print('  --full')  # verify everything (ignore results from previous run)
+	print('  --jobs <n>')  # number of worker processes
+	print('  --json <file>')  # also write the report as JSON
+	print('  --profile')  # report where the time goes (implies --jobs 1)
+	print('  --profile-output <file>')  # also save the cProfile stats (for pstats)
+
+# Record the time spent in each phase of the verification with |profiler|.
+def profile_phases(profiler):
+	profiler.wrap(corpus, 'load', 'read')
+	profiler.wrap(Parser, 'process_block', 'process blocks')
+	profiler.wrap(Parser, 'process_token', 'process lines',
+			lambda parser, token: profiling.token_key(token))
+	profiler.wrap(Parser, 'verify_conflict_text', 'conflict text')
 
 def main():
+	try:
+		opts, args = getopt.getopt(sys.argv[1:],
+			'fj:p',
+			['full', 'jobs=', 'json=', 'profile', 'profile-output='])
+	except getopt.GetoptError:
+		usage()
+		exit()
+
+	full = False
+	jobs = multiprocessing.cpu_count()
+	json_file = None
+	profile = False
+	profile_output = None
+	for opt, arg in opts:
+		if opt in ('-f', '--full'):
+			full = True
+		elif opt in ('-j', '--jobs'):
+			jobs = int(arg)
+		elif opt == '--json':
+			json_file = arg
+		elif opt in ('-p', '--profile'):
+			profile = True
+		elif opt == '--profile-output':
+			profile = True
+			profile_output = arg
+
 	infilename = '../plotto.txt'
 
-	parser = Parser()
-	parser.process(infilename)
+	profiler = None
+	if profile:
+		# The worker processes can't report back to the profiler.
+		jobs = 1
+		profiler = profiling.Profiler(profile_output)
+		profile_phases(profiler)
+		profiler.start()
+
+	manifest = None
+	if not full:
+		manifest = load_manifest(infilename)
+
+	diagnostics = verify(infilename, manifest, jobs)
+	for d in diagnostics:
+		print(d.format(infilename))
+	if json_file:
+		write_json_report(json_file, infilename, diagnostics)
+
+	if profiler != None:
+		profiler.stop()
+		profiler.report()
+
+	errors = len([d for d in diagnostics if d.severity == ERROR])
+	if errors != 0:
+		print('%d error(s), %d warning(s)' % (errors, len(diagnostics) - errors))
+		sys.exit(1)
 
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Watch mode for build-all.py.
+#
+# Watches plotto.txt, the config files, css/ and js/ for changes and
+# rebuilds the variants that are affected. The output is served from a local
+# HTTP server, which adds js/livereload.js to each page so that open browsers
+# reload when the page is rebuilt (using server-sent events). The service
+# worker isn't served, so that the previews are never cached.
+#
+# Changes are detected with inotify (if the inotify_simple module is
+# installed), or else by polling.
+
+import http.server
+import os
+import os.path
+import posixpath
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+
+try:
+	import inotify_simple
+except ImportError:
+	inotify_simple = None
+
+import build
+import linkgraph
+import verify
+
+# Seconds to wait for more changes before rebuilding (editors often write a
+# file in several steps).
+DEBOUNCE = 0.3
+# Seconds between checks when polling for changes.
+POLL_INTERVAL = 0.5
+# Seconds between keep-alive messages to the browsers.
+KEEP_ALIVE = 15
+
+LIVE_RELOAD_SCRIPT = b'<script src="/js/livereload.js"></script>\n'
+
+class PollingWatcher(object):
+	"""Detects changes to files by polling their size and mtime."""
+
+	def __init__(self, files, dirs):
+		self.files = files
+		self.dirs = dirs
+		self.state = self.snapshot()
+
+	def snapshot(self):
+		paths = list(self.files)
+		for dir in self.dirs:
+			if os.path.isdir(dir):
+				paths.extend([os.path.join(dir, f) for f in os.listdir(dir)])
+		state = {}
+		for path in paths:
+			try:
+				st = os.stat(path)
+				state[path] = (st.st_mtime, st.st_size)
+			except OSError:
+				pass
+		return state
+
+	# Return the set of paths that changed, waiting up to |timeout| seconds
+	# (or forever if None).
+	def wait(self, timeout=None):
+		start = time.time()
+		while True:
+			state = self.snapshot()
+			changed = set()
+			for path in set(state) | set(self.state):
+				if state.get(path) != self.state.get(path):
+					changed.add(path)
+			self.state = state
+			if changed or (timeout != None and time.time() - start >= timeout):
+				return changed
+			time.sleep(POLL_INTERVAL if timeout == None else min(POLL_INTERVAL, timeout))
+
+class InotifyWatcher(object):
+	"""Detects changes to files with inotify."""
+
+	def __init__(self, files, dirs):
+		self.inotify = inotify_simple.INotify()
+		f = inotify_simple.flags
+		mask = f.CLOSE_WRITE | f.MODIFY | f.MOVED_TO | f.CREATE | f.DELETE
+		# The directory of each watch, and the files of interest in it (or
+		# None for all files). Editors often save by renaming a new file over
+		# the old one, so the directories are watched rather than the files.
+		self.watches = {}
+		self.names = {}
+		for path in files:
+			dir = os.path.dirname(path)
+			wd = self.inotify.add_watch(dir, mask)
+			self.watches[wd] = dir
+			self.names.setdefault(wd, set()).add(os.path.basename(path))
+		for dir in dirs:
+			wd = self.inotify.add_watch(dir, mask)
+			self.watches[wd] = dir
+			self.names[wd] = None
+
+	def wait(self, timeout=None):
+		ms = None if timeout == None else int(timeout * 1000)
+		changed = set()
+		for event in self.inotify.read(timeout=ms):
+			names = self.names.get(event.wd)
+			if names == None or event.name in names:
+				changed.add(os.path.join(self.watches[event.wd], event.name))
+		return changed
+
+def create_watcher(files, dirs):
+	if inotify_simple != None:
+		try:
+			return InotifyWatcher(files, dirs)
+		except (OSError, IOError):
+			pass
+	return PollingWatcher(files, dirs)
+
+class Reloader(object):
+	"""Tells the browsers to reload."""
+
+	def __init__(self):
+		self.condition = threading.Condition()
+		# Incremented on every rebuild.
+		self.generation = 0
+
+	def reload(self):
+		with self.condition:
+			self.generation += 1
+			self.condition.notify_all()
+
+	# Wait until the generation is newer than |generation| (or |timeout|
+	# seconds have passed), and return the current generation.
+	def wait(self, generation, timeout):
+		with self.condition:
+			if self.generation == generation:
+				self.condition.wait(timeout)
+			return self.generation
+
+class PreviewHandler(http.server.SimpleHTTPRequestHandler):
+	"""Serves the output files, with live reload."""
+
+	def do_GET(self):
+		path = self.translate_path(self.path)
+		if self.path.split('?', 1)[0] == '/__events':
+			self.send_events()
+		elif os.path.abspath(path) == os.path.abspath(build.service_worker_file):
+			# The previews must not be cached by the service worker.
+			self.send_error(404, 'File not found')
+		elif os.path.splitext(path)[1] == '.html':
+			self.send_page(path)
+		else:
+			http.server.SimpleHTTPRequestHandler.do_GET(self)
+
+	# Send the page with the live reload script added.
+	def send_page(self, path):
+		try:
+			with open(path, 'rb') as f:
+				data = f.read()
+		except IOError:
+			self.send_error(404, 'File not found')
+			return
+		end = data.rfind(b'</body>')
+		if end == -1:
+			end = len(data)
+		data = data[:end] + LIVE_RELOAD_SCRIPT + data[end:]
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/html; charset=utf-8')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	# Send an event each time the output is rebuilt.
+	def send_events(self):
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/event-stream')
+		self.send_header('Cache-Control', 'no-cache')
+		self.end_headers()
+		reloader = self.server.reloader
+		generation = reloader.generation
+		try:
+			while True:
+				new_generation = reloader.wait(generation, KEEP_ALIVE)
+				if new_generation != generation:
+					generation = new_generation
+					self.wfile.write(b'event: reload\ndata: %d\n\n' % generation)
+				else:
+					self.wfile.write(b': keep-alive\n\n')
+				self.wfile.flush()
+		except (IOError, OSError):
+			# The browser went away.
+			pass
+
+	# Map the URL |path| to a file under the server root.
+	def translate_path(self, path):
+		path = posixpath.normpath(urllib.parse.unquote(path.split('?', 1)[0].split('#', 1)[0]))
+		result = self.server.root
+		for word in path.split('/'):
+			if word in ['', os.curdir, os.pardir]:
+				continue
+			result = os.path.join(result, word)
+		return result
+
+	def end_headers(self):
+		# The files change on every build.
+		if not self.path.startswith('/__events'):
+			self.send_header('Cache-Control', 'no-cache')
+		http.server.SimpleHTTPRequestHandler.end_headers(self)
+
+	def log_message(self, format, *args):
+		pass
+
+class PreviewServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+# Start serving the files in |root| on |port| in a background thread.
+def start_server(root, port, reloader):
+	server = PreviewServer(('localhost', port), PreviewHandler)
+	server.root = root
+	server.reloader = reloader
+	thread = threading.Thread(target=server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	return server
+
+class Builder(object):
+	"""Rebuilds the variants that are affected by a change."""
+
+	def __init__(self, src, config_files, shard=False):
+		self.src = os.path.abspath(src)
+		self.config_files = [os.path.abspath(c) for c in config_files]
+		self.shard = shard
+		self.configs = {}
+		for c in self.config_files:
+			self.configs[c] = self.load_config(c)
+		self.verify_manifest = verify.load_manifest(self.src)
+
+	def load_config(self, config_file):
+		config = build.load_config(config_file)
+		if self.shard:
+			config['shard'] = True
+		# The preview server doesn't serve the compressed copies.
+		config['compress'] = False
+		return config
+
+	# Return the config files that need to be rebuilt for the |changed|
+	# files (css/ and js/ only need the browsers to reload).
+	def affected(self, changed):
+		if self.src in changed:
+			return list(self.config_files)
+		return [c for c in self.config_files if c in changed]
+
+	# Verify the source and rebuild the |config_files|.
+	# Returns True on success.
+	def rebuild(self, config_files):
+		try:
+			diagnostics = verify.verify(self.src, self.verify_manifest)
+			errors = [d for d in diagnostics if d.severity == verify.ERROR]
+			for d in errors:
+				print(d.format(self.src))
+			if len(errors) != 0:
+				return False
+
+			source = build.read_source(self.src)
+			for c in config_files:
+				self.configs[c] = self.load_config(c)
+			index = build.casting_index(source, self.configs.values())
+			graph = linkgraph.cached(source)
+			for c in config_files:
+				build.build_variant(self.configs[c], source, index=index, graph=graph)
+			build.write_link_graph(graph, build.link_graph_file)
+			self.write_service_worker()
+		except SystemExit:
+			# build.error() exits after reporting the error.
+			return False
+		return True
+
+	# Write the service worker with the new revisions of the files.
+	def write_service_worker(self):
+		build.write_service_worker(list(self.configs.values()), build.service_worker_file)
+
+# Watch for changes and rebuild until interrupted.
+# If |shard| is set, then the variants are built as sharded output.
+def run(src, config_files, port, shard=False):
+	root = os.path.dirname(os.path.abspath(src))
+	builder = Builder(src, config_files, shard)
+	reloader = Reloader()
+	server = start_server(root, port, reloader)
+
+	dirs = [os.path.join(root, 'css'), os.path.join(root, 'js')]
+	watcher = create_watcher([builder.src] + builder.config_files, dirs)
+	pages = [os.path.relpath(os.path.abspath(c['output_file']), root)
+			for c in builder.configs.values()]
+	for page in sorted(pages):
+		print('Serving http://localhost:%d/%s' % (port, page))
+	print('Watching for changes (%s)...' % (
+			'inotify' if isinstance(watcher, InotifyWatcher) else 'polling'))
+
+	try:
+		while True:
+			changed = watcher.wait()
+			# Wait for the changes to settle.
+			while True:
+				more = watcher.wait(DEBOUNCE)
+				if len(more) == 0:
+					break
+				changed |= more
+
+			start = time.time()
+			config_files = builder.affected(changed)
+			if len(config_files) == 0:
+				builder.write_service_worker()
+				reloader.reload()
+			elif builder.rebuild(config_files):
+				reloader.reload()
+				print('Rebuilt in %.2fs' % (time.time() - start))
+			sys.stdout.flush()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.shutdown()
@@ -0,0 +1,134 @@
+var PRECACHE = {
+ "css/plotto.css": "641192e60d74",
+ "js/random.js": "285145f9073c",
+ "js/refby.js": "53c372e67352",
+ "js/search.js": "d9c329f90aed",
+ "js/views.js": "402fd65b6074"
+};
+var RUNTIME = {
+ "plotto-fm-search.json": "a8c43062cf3b",
+ "plotto-fm-views.json": "958f74b38241",
+ "plotto-fm.html": "2b3a38d1de53",
+ "plotto-mf-search.json": "13a153454f2f",
+ "plotto-mf-views.json": "4ad4be00ca05",
+ "plotto-mf.html": "ca2dc136c0e4",
+ "plotto-neutral-search.json": "d8a020c08bee",
+ "plotto-neutral-views.json": "cf2f0033c296",
+ "plotto-neutral.html": "e52772c8cd16"
+};
+
+// Service worker for offline use.
+// This is the template for sw.js, which build.py writes (see
+// scripts/offline.py) with the lists of files in front of it:
+//   var PRECACHE = {"css/plotto.css": "<revision>", ...};
+//   var RUNTIME = {"plotto-mf.html": "<revision>", ...};
+// The revision is a hash of the contents of the file. Each file is cached
+// under its URL plus its revision, so that after a rebuild only the files
+// that changed are downloaded again.
+// Only the shell (the CSS and JS, plus the pages that are open when the
+// service worker is installed) is precached. The other files (the other
+// pages, the shards and the JSON data) are cached when they are first used.
+var CACHE = "plotto-precache";
+
+// Map from the URL of each file to its key in the cache.
+var cacheKeys = {};
+[PRECACHE, RUNTIME].forEach(function(files) {
+	Object.keys(files).forEach(function(path) {
+		var url = new URL(path, self.location).href;
+		cacheKeys[url] = url + "?rev=" + files[path];
+	});
+});
+
+// Return the cache key for the |url| (ignoring the query, like "?random"
+// which doesn't change the file), or undefined if it isn't cached.
+function cacheKey(url) {
+	url = new URL(url);
+	return cacheKeys[url.origin + url.pathname];
+}
+
+// Fetch the |url| (bypassing the HTTP cache, which may have an older
+// revision) and store it in the |cache| under |key|, unless it is already
+// there.
+function precache(cache, url, key) {
+	return cache.match(key).then(function(cached) {
+		if (cached) {
+			return;
+		}
+		return fetch(new Request(url, {cache: "reload"})).then(function(response) {
+			if (!response.ok) {
+				throw new Error("Unable to fetch " + url);
+			}
+			return cache.put(key, response);
+		});
+	});
+}
+
+self.addEventListener("install", function(event) {
+	event.waitUntil(Promise.all([
+		caches.open(CACHE),
+		self.clients.matchAll({type: "window", includeUncontrolled: true}),
+	]).then(function(results) {
+		var cache = results[0];
+		var urls = Object.keys(PRECACHE).map(function(path) {
+			return new URL(path, self.location).href;
+		});
+		// The pages that are open (like the one that registered the
+		// service worker).
+		results[1].forEach(function(client) {
+			var url = new URL(client.url);
+			url = url.origin + url.pathname;
+			if (cacheKeys[url] && urls.indexOf(url) == -1) {
+				urls.push(url);
+			}
+		});
+		return Promise.all(urls.map(function(url) {
+			return precache(cache, url, cacheKeys[url]);
+		}));
+	}).then(function() {
+		return self.skipWaiting();
+	}));
+});
+
+self.addEventListener("activate", function(event) {
+	// Remove the old revisions.
+	var current = {};
+	Object.keys(cacheKeys).forEach(function(url) {
+		current[cacheKeys[url]] = true;
+	});
+	event.waitUntil(caches.open(CACHE).then(function(cache) {
+		return cache.keys().then(function(requests) {
+			return Promise.all(requests.filter(function(request) {
+				return !current[request.url];
+			}).map(function(request) {
+				return cache.delete(request);
+			}));
+		});
+	}).then(function() {
+		return self.clients.claim();
+	}));
+});
+
+self.addEventListener("fetch", function(event) {
+	if (event.request.method != "GET") {
+		return;
+	}
+	var key = cacheKey(event.request.url);
+	if (!key) {
+		return;
+	}
+	event.respondWith(caches.open(CACHE).then(function(cache) {
+		return cache.match(key).then(function(cached) {
+			if (cached) {
+				return cached;
+			}
+			// Cache the file the first time that it's used (checking that
+			// the HTTP cache doesn't have an older revision).
+			return fetch(event.request.url, {cache: "no-cache"}).then(function(response) {
+				if (response.ok) {
+					cache.put(key, response.clone());
+				}
+				return response;
+			});
+		});
+	}));
+});